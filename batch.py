@@ -0,0 +1,99 @@
+"""
+批量生成命令行：把一批文案一次提交给服务端 /api/batch，轮询批次状态直到全部结束
+
+    python batch.py scripts/                       # 目录下每个 .txt 是一篇文案，文件名作为标题
+    python batch.py a.txt b.txt --resolutions 9:16,16:9 --voice zh-CN-YunxiNeural
+    python batch.py scripts.jsonl --download output/batch   # 每行 {"title": "...", "text": "..."}
+
+整批共用音色、画幅、字幕等参数；相同的句子只合成一次配音、相同的画面只生成一次背景图。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import requests
+
+
+def load_scripts(paths):
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts += load_scripts(sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".txt")))
+        elif path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                scripts += [json.loads(line) for line in f if line.strip()]
+        else:
+            with open(path, encoding="utf-8") as f:
+                scripts.append({"title": os.path.splitext(os.path.basename(path))[0], "text": f.read().strip()})
+    return [s for s in scripts if s.get("text")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量提交文案生成视频")
+    parser.add_argument("inputs", nargs="+", help=".txt 文件、包含 .txt 的目录或 .jsonl 文件")
+    parser.add_argument("--server", default="http://127.0.0.1:8888")
+    parser.add_argument("--voice", default=None, help="Edge TTS 音色，缺省使用服务端配置的 EDGE_TTS_VOICE")
+    parser.add_argument("--resolutions", default="9:16", help="逗号分隔的画幅，如 9:16,16:9")
+    parser.add_argument("--bgm", default="none")
+    parser.add_argument("--subtitle-style", default="classic_yellow")
+    parser.add_argument("--subtitle-mode", default=None)
+    parser.add_argument("--encoder-profile", default=None)
+    parser.add_argument("--api-key", default=None, help="作为 X-API-Key 发送，用于服务端按客户端公平调度")
+    parser.add_argument("--download", default=None, help="完成后把视频下载到该目录")
+    parser.add_argument("--interval", type=float, default=3.0, help="轮询间隔（秒）")
+    args = parser.parse_args()
+
+    scripts = load_scripts(args.inputs)
+    if not scripts:
+        print("❌ 没有找到可用的文案")
+        return 1
+
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    body = {
+        "scripts": scripts, "voice": args.voice, "resolutions": resolutions, "bgm": args.bgm,
+        "subtitle_style": args.subtitle_style, "subtitle_mode": args.subtitle_mode, "encoder_profile": args.encoder_profile,
+    }
+    resp = requests.post(f"{args.server}/api/batch", json=body, headers=headers, timeout=60)
+    if resp.status_code != 200:
+        print(f"❌ 提交失败 ({resp.status_code}): {resp.text}")
+        return 1
+    batch = resp.json()
+    plan = batch["plan"]
+    print(f"📦 批次 {batch['batch_id']}: {plan['scripts']} 篇文案 / {plan['scenes']} 个场景，"
+          f"去重后配音 {plan['unique_audio']} 句、背景图 {plan['unique_images']} 张")
+
+    while True:
+        time.sleep(args.interval)
+        status = requests.get(f"{args.server}/api/batch/{batch['batch_id']}", headers=headers, timeout=30).json()
+        counts = " ".join(f"{k}={v}" for k, v in sorted(status["counts"].items()))
+        prewarm = status.get("prewarm") or {}
+        warming = f" | 预热 {prewarm.get('progress') or 0}%" if prewarm.get("status") in ("pending", "running") else ""
+        print(f"\r⏳ {status['progress']:5.1f}% | {counts}{warming}    ", end="", flush=True)
+        if status["status"] == "completed": break
+    print()
+
+    failed = [s for s in status["scripts"] if s["status"] != "completed"]
+    for s in status["scripts"]:
+        mark = "✅" if s["status"] == "completed" else "❌"
+        print(f"  {mark} {s['title']} ({s['task_id']}){'' if s['status'] == 'completed' else ': ' + str(s['error'])}")
+
+    if args.download:
+        os.makedirs(args.download, exist_ok=True)
+        for s in status["scripts"]:
+            if not s["download_url"]: continue
+            path = os.path.join(args.download, f"{s['title']}_{s['task_id']}.mp4")
+            with requests.get(f"{args.server}{s['download_url']}", headers=headers, stream=True, timeout=300) as r:
+                r.raise_for_status()
+                with open(path, "wb") as f:
+                    for chunk in r.iter_content(1 << 20):
+                        f.write(chunk)
+            print(f"  💾 {path}")
+    print(f"✨ 完成 {len(status['scripts']) - len(failed)}/{len(status['scripts'])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
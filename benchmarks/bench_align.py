@@ -0,0 +1,77 @@
+"""
+Whisper 对齐基准：逐场景对齐 vs 整篇批量对齐（CPU int8）
+
+用法:
+    python benchmarks/bench_align.py                      # 用 script.txt 通过 Edge TTS 合成场景音频
+    python benchmarks/bench_align.py --audio-dir DIR      # 复用已有的 audio_*.mp3（按文件名排序，与 script.txt 分句对应）
+"""
+import os
+import sys
+import time
+import glob
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BASE_DIR, EDGE_TTS_VOICE
+from generator.audio import AudioGenerator
+from generator.manifest import split_sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper 对齐吞吐对比")
+    parser.add_argument("--script", default=os.path.join(BASE_DIR, "script.txt"))
+    parser.add_argument("--audio-dir", help="已有场景音频目录，跳过 TTS")
+    parser.add_argument("--scenes", type=int, default=40, help="最多使用多少个场景")
+    parser.add_argument("--model", default="base")
+    args = parser.parse_args()
+
+    with open(args.script, encoding="utf-8") as f:
+        sentences = split_sentences(f.read())
+    # 文案不足时循环补齐，保证场景数量可控
+    while sentences and len(sentences) < args.scenes:
+        sentences += sentences[:args.scenes - len(sentences)]
+    sentences = sentences[:args.scenes]
+
+    from faster_whisper import WhisperModel
+    audio_gen = AudioGenerator(EDGE_TTS_VOICE)
+    audio_gen.whisper_model = WhisperModel(args.model, device="cpu", compute_type="int8")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.audio_dir:
+            paths = sorted(glob.glob(os.path.join(args.audio_dir, "*.mp3")))[:len(sentences)]
+            sentences = sentences[:len(paths)]
+        else:
+            paths = []
+            print(f"🎙️ 正在合成 {len(sentences)} 个场景音频...")
+            for i, s in enumerate(sentences):
+                path = os.path.join(tmp_dir, f"audio_{i:03d}.mp3")
+                audio_gen.synthesize(s, path)
+                paths.append(path)
+
+        items = list(zip(sentences, paths))
+        audio_seconds = sum(audio_gen._get_audio_duration(p) for p in paths)
+
+        # 预热一次，排除模型首次推理的初始化开销
+        audio_gen.align(*items[0])
+
+        t0 = time.perf_counter()
+        for text, path in items:
+            audio_gen.align(text, path)
+        per_scene = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        audio_gen.align_batch(items)
+        batched = time.perf_counter() - t0
+
+    print()
+    print(f"场景数: {len(items)}  音频总长: {audio_seconds:.1f}s  模型: {args.model} (cpu/int8)")
+    print(f"{'模式':<10}{'耗时(s)':>10}{'场景/s':>10}{'实时倍率':>10}")
+    for name, cost in [("per-scene", per_scene), ("batched", batched)]:
+        print(f"{name:<10}{cost:>10.2f}{len(items) / cost:>10.2f}{audio_seconds / cost:>10.1f}x")
+    print(f"加速比: {per_scene / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Ken Burns 运动引擎基准：zoompan vs scale_crop 的逐帧渲染速度 (fps)
+
+只测背景运动滤镜本身（输出到 null，不含字幕与编码），分别在 9:16 / 16:9 / 1:1 下运行。
+速度按 ffmpeg 实际输出的帧数计算，输出帧数与场景应有帧数不一致（丢帧 / 帧率不对）时单独标出。
+用法:
+    python benchmarks/bench_motion.py [--seconds 10] [--image path.jpg]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator.synthesis import VideoSynthesizer
+
+ASPECTS = [("9:16", "1080:1920", "1440x2560"), ("16:9", "1920:1080", "2560x1440"), ("1:1", "1080:1080", "1920x1920")]
+
+
+def make_test_image(path, size):
+    """生成与生图服务输出尺寸一致的测试图"""
+    subprocess.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=s={size}:d=1", "-frames:v", "1", "-q:v", "2", path,
+        "-loglevel", "error"
+    ], check=True)
+
+
+def run_engine(engine, resolution, image_path, seconds, fps):
+    """返回 (实际输出帧数 / 耗时, 实际输出帧数)"""
+    synth = VideoSynthesizer(resolution, fps, motion_engine=engine)
+    frames = int(seconds * fps)
+    cmd = [
+        "ffmpeg", "-y", *synth._motion_input(image_path),
+        "-filter_complex", f"[0:v]{synth._motion_filter(frames)}[outv]",
+        "-map", "[outv]", "-t", f"{seconds:.2f}", "-f", "null", "-",
+        "-progress", "pipe:1", "-nostats", "-loglevel", "error"
+    ]
+    t0 = time.perf_counter()
+    result = subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    output_frames = max((int(line.split("=", 1)[1]) for line in result.stdout.splitlines() if line.startswith("frame=")), default=0)
+    return output_frames / elapsed, output_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ken Burns 运动引擎 fps 对比")
+    parser.add_argument("--seconds", type=float, default=10.0, help="每次渲染的场景时长")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--image", help="使用指定图片，默认按比例生成测试图")
+    args = parser.parse_args()
+
+    expected = int(args.seconds * args.fps)
+    print(f"{'比例':<8}{'zoompan fps':>14}{'scale_crop fps':>16}{'加速比':>10}   (应输出 {expected} 帧)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, resolution, source_size in ASPECTS:
+            image_path = args.image
+            if not image_path:
+                image_path = os.path.join(tmp_dir, f"src_{source_size}.jpg")
+                make_test_image(image_path, source_size)
+            results = {e: run_engine(e, resolution, image_path, args.seconds, args.fps) for e in VideoSynthesizer.MOTION_ENGINES}
+            speed = {e: r[0] for e, r in results.items()}
+            mismatched = [f"{e} 输出 {r[1]} 帧" for e, r in results.items() if r[1] != expected]
+            print(f"{name:<8}{speed['zoompan']:>14.1f}{speed['scale_crop']:>16.1f}"
+                  f"{speed['scale_crop'] / speed['zoompan']:>9.2f}x" + (f"   ⚠️ {', '.join(mismatched)}" if mismatched else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+端到端离线基准：用本地替身跑完整的 run_generation_process 流水线
+
+  - 配音：模拟模式 + 正弦音（按语速估算时长，不依赖 Edge TTS 和 macOS say）
+  - 生图：本地 HTTP 图像服务（benchmarks/fake_image_server.py），延迟与失败率可配置
+  - 每个用例在独立子进程中运行，工作目录、任务库、缓存都是临时的，互不影响；
+    子进程的峰值 RSS（自身与最大的 ffmpeg 子进程）单独记录
+
+结果写成 JSON（每个用例的耗时、吞吐、峰值内存、各阶段计时汇总），--compare 对比两次结果，
+吞吐下降或峰值内存上升超过阈值时以非零状态退出。
+用法:
+    python benchmarks/bench_pipeline.py --scenes 5,20 --resolutions 9:16,16:9,9:16+1:1 --out bench.json
+    python benchmarks/bench_pipeline.py --compare base.json bench.json [--threshold 0.1]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import BASE_DIR
+from generator.manifest import split_sentences
+
+FALLBACK_SENTENCES = ["今天我们用 FFmpeg 和 Whisper 来做一个短视频。", "每个场景都有配音、背景图和动态字幕。", "流水线把它们并行生产出来！"]
+
+
+def load_sentences(path, count):
+    text = ""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    # 与服务端同一套切分，基准的场景数与实际渲染一致
+    sentences = [s for s in split_sentences(text) if s] or FALLBACK_SENTENCES
+    while len(sentences) < count:
+        sentences += sentences[:count - len(sentences)]
+    return sentences[:count]
+
+
+def _peak_rss_mb(who):
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(case, image_url, result_path):
+    """子进程入口：在临时工作目录里跑一个任务，把结果写到 result_path"""
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.chdir(work_dir)
+    import config
+    assets = os.path.join(work_dir, "assets")
+    config.MOCK_AUDIO, config.MOCK_AUDIO_ENGINE, config.MOCK_IMAGE = True, "tone", False
+    config.TASK_STORE_BACKEND, config.TASK_DB_PATH = "sqlite", os.path.join(assets, "tasks.db")
+    config.STREAM_DIR = os.path.join(work_dir, "output", "hls")
+    for name in ("TTS", "IMAGE", "SCENE"):
+        setattr(config, f"{name}_CACHE_ENABLED", case["cache"])
+        setattr(config, f"{name}_CACHE_DIR", os.path.join(assets, "cache", name.lower()))
+
+    import server
+    from generator.synthesis import VideoSynthesizer
+    server.warm_generation_worker()
+
+    aspects = case["resolution"].split("+")
+    text = "".join(load_sentences(case["script"], case["scenes"]))
+    task_id = f"bench{case['scenes']}"
+    server.save_task_to_disk(task_id, {"status": "pending", "progress": 0, "scenes_status": {}, "video_path": None,
+                                       "error": None, "last_update": time.time(), "created": time.time()})
+    t0 = time.perf_counter()
+    server.run_generation_process(
+        task_id, text, "zh-CN-XiaoxiaoNeural", aspects[0], resolutions=aspects if len(aspects) > 1 else None,
+        image_config={"provider": "volcengine", "base_url": image_url, "api_key": "bench", "model_id": "bench"},
+        render_mode=case.get("render_mode"), encoder_profile=case.get("encoder_profile"),
+        subtitle_mode=case.get("subtitle_mode"), stream=case.get("stream"),
+    )
+    wall = time.perf_counter() - t0
+
+    task = server.load_task(task_id) or {}
+    video_seconds = 0.0
+    if task.get("status") == "completed":
+        video_seconds = VideoSynthesizer()._get_video_duration(task["video_path"])
+    timing = task.get("timing") or {}
+    result = {
+        **case, "status": task.get("status"), "error": task.get("error"),
+        "wall_seconds": round(wall, 3), "video_seconds": round(video_seconds, 3),
+        # 吞吐：每秒墙钟时间产出的视频秒数（多画幅时按第一个画幅计）
+        "throughput": round(video_seconds / wall, 4) if wall else 0.0,
+        "scenes_per_minute": round(case["scenes"] / wall * 60, 2) if wall else 0.0,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_child_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "encode": task.get("encode"),
+        "stages": timing.get("stages", {}),
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def case_key(case):
+    return f"{case['scenes']}scenes {case['resolution']} {case.get('render_mode') or '-'}/{case.get('subtitle_mode') or '-'}/{case.get('encoder_profile') or '-'}"
+
+
+def run_suite(args):
+    from fake_image_server import FakeImageServer
+    image_server = FakeImageServer(latency=args.image_latency, jitter=args.image_jitter,
+                                   failure_rate=args.image_failure_rate, seed=args.seed).start()
+    cases = []
+    for scenes in [int(n) for n in args.scenes.split(",")]:
+        for resolution in args.resolutions.split(","):
+            cases.append({
+                "scenes": scenes, "resolution": resolution, "script": args.script, "cache": args.cache,
+                "render_mode": args.render_mode, "subtitle_mode": args.subtitle_mode,
+                "encoder_profile": args.encoder_profile, "stream": args.stream,
+            })
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in cases:
+            for rep in range(args.repeat):
+                print(f"▶️ {case_key(case)} (第 {rep + 1}/{args.repeat} 次)")
+                result_path = os.path.join(tmp_dir, "result.json")
+                cmd = [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case),
+                       "--image-url", image_server.generation_url, "--result", result_path]
+                log = None if args.verbose else subprocess.DEVNULL
+                proc = subprocess.run(cmd, stdout=log, stderr=log)
+                if proc.returncode != 0 or not os.path.exists(result_path):
+                    results.append({**case, "status": "crashed", "error": f"exit code {proc.returncode}"})
+                    continue
+                with open(result_path, encoding="utf-8") as f:
+                    results.append(json.load(f))
+                os.remove(result_path)
+                r = results[-1]
+                print(f"   {r['status']}  {r['wall_seconds']:.1f}s  吞吐 {r['throughput']:.3f}x  峰值 RSS {r['peak_rss_mb']:.0f} MB "
+                      f"(ffmpeg {r['peak_child_rss_mb']:.0f} MB)")
+    image_server.stop()
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"), "git": _git_rev(), "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "ffmpeg": _ffmpeg_version(),
+            "image_server": {"latency": args.image_latency, "jitter": args.image_jitter,
+                             "failure_rate": args.image_failure_rate, "seed": args.seed, **image_server.stats},
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入 {args.out}")
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def _ffmpeg_version():
+    try:
+        return subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    except OSError:
+        return None
+
+
+def _aggregate(report):
+    """同一用例多次运行取平均"""
+    grouped = {}
+    for r in report["results"]:
+        if r.get("status") != "completed": continue
+        grouped.setdefault(case_key(r), []).append(r)
+    summary = {}
+    for key, runs in grouped.items():
+        stages = {}
+        for r in runs:
+            for stage, agg in r.get("stages", {}).items():
+                stages[stage] = stages.get(stage, 0.0) + agg["run"] / len(runs)
+        summary[key] = {
+            "throughput": sum(r["throughput"] for r in runs) / len(runs),
+            "peak_rss_mb": max(max(r["peak_rss_mb"], r["peak_child_rss_mb"]) for r in runs),
+            "stages": stages,
+        }
+    return summary
+
+
+def compare(base_path, new_path, threshold):
+    with open(base_path, encoding="utf-8") as f:
+        base = _aggregate(json.load(f))
+    with open(new_path, encoding="utf-8") as f:
+        new = _aggregate(json.load(f))
+
+    regressions = []
+    print(f"{'用例':<44}{'吞吐 (x)':>22}{'峰值 RSS (MB)':>24}")
+    for key in sorted(set(base) & set(new)):
+        b, n = base[key], new[key]
+        d_tp = (n["throughput"] - b["throughput"]) / b["throughput"] if b["throughput"] else 0.0
+        d_rss = (n["peak_rss_mb"] - b["peak_rss_mb"]) / b["peak_rss_mb"] if b["peak_rss_mb"] else 0.0
+        flag = ""
+        if d_tp < -threshold or d_rss > threshold:
+            flag = " ⚠️"
+            regressions.append(key)
+        print(f"{key:<44}{b['throughput']:>8.3f} → {n['throughput']:<7.3f}{d_tp:>+6.0%}"
+              f"{b['peak_rss_mb']:>9.0f} → {n['peak_rss_mb']:<6.0f}{d_rss:>+6.0%}{flag}")
+        # 各阶段累计执行时间的变化，按变化量排序
+        deltas = sorted(((n["stages"].get(s, 0.0) - b["stages"].get(s, 0.0), s) for s in set(b["stages"]) | set(n["stages"])),
+                        key=lambda x: -abs(x[0]))
+        print("    " + "  ".join(f"{s} {d:+.2f}s" for d, s in deltas[:5]))
+    for key in sorted(set(base) ^ set(new)):
+        print(f"{key:<44}（仅存在于{'基线' if key in base else '新结果'}）")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} 个用例吞吐下降或峰值内存上升超过 {threshold:.0%}")
+        return 1
+    print(f"\n✅ 无超过 {threshold:.0%} 的回退")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端离线基准（本地 TTS / 图像替身）")
+    parser.add_argument("--script", default=os.path.join(BASE_DIR, "script.txt"))
+    parser.add_argument("--scenes", default="5,20", help="逗号分隔的场景数")
+    parser.add_argument("--resolutions", default="9:16", help="逗号分隔的画幅，用 + 连接表示一个任务输出多个画幅")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--render-mode", choices=["scene", "single_pass"])
+    parser.add_argument("--subtitle-mode", choices=["scene", "global", "soft"])
+    parser.add_argument("--encoder-profile", choices=["draft", "balanced", "archive"])
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None, help="是否输出 HLS 分片")
+    parser.add_argument("--cache", action="store_true", help="启用缓存（默认每个用例都冷启动）")
+    parser.add_argument("--image-latency", type=float, default=0.5)
+    parser.add_argument("--image-jitter", type=float, default=0.0)
+    parser.add_argument("--image-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_pipeline.json")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程日志")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定回退的相对变化")
+    # 内部使用：子进程执行单个用例
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--image-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(json.loads(args.run_case), args.image_url, args.result)
+    elif args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    else:
+        run_suite(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+字幕排版基准：长文案（数千个词）生成 ASS 的耗时
+
+分别测量估算字宽与真实字宽（需要 fontTools + fc-match 能找到字体）两种模式；
+传入 --baseline 时从 git 取出旧版 animation.py 一并测量作对比。
+用法:
+    python benchmarks/bench_subtitle_layout.py [--tokens 5000] [--font "PingFang SC"] [--baseline HEAD~1]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import BASE_DIR
+import generator.text_layout as text_layout
+from generator.animation import AnimationGenerator
+
+MIXED_SAMPLE = "今天我们用 FFmpeg 5.1 和 Whisper 来做一个 AI-driven 的短视频，它到底能做什么？答案是：很多！"
+
+
+def load_script(path, tokens):
+    text = MIXED_SAMPLE
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            text = f.read() + MIXED_SAMPLE
+    # 循环拼接到目标词数
+    per_copy = max(1, len(text_layout.tokenize(text)))
+    return text * (tokens // per_copy + 1)
+
+
+def load_baseline(rev):
+    source = subprocess.run(["git", "show", f"{rev}:generator/animation.py"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType("animation_baseline")
+    exec(compile(source, f"{rev}:generator/animation.py", "exec"), module.__dict__)
+    return module.AnimationGenerator
+
+
+def run(generator_cls, text, ass_path, repeat, **kwargs):
+    gen = generator_cls("1080x1920", 30)
+    duration = len(text) * 0.2
+    # 预热一次（字体表加载、正则编译等一次性开销不计入）
+    gen.prepare_subtitles(text, [{"start": 0.1}], ass_path, duration, **kwargs)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        gen.prepare_subtitles(text, [{"start": 0.1}], ass_path, duration, **kwargs)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASS 字幕排版耗时")
+    parser.add_argument("--script", default=os.path.join(BASE_DIR, "script.txt"))
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--font", default="PingFang SC")
+    parser.add_argument("--baseline", help="对比的 git 版本，如 HEAD~1")
+    args = parser.parse_args()
+
+    text = load_script(args.script, args.tokens)
+    n_tokens = len(text_layout.tokenize(text))
+    measured = text_layout._load_font_table(args.font) is not None
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ass_path = os.path.join(tmp_dir, "bench.ass")
+        if args.baseline:
+            results.append((f"baseline ({args.baseline})", run(load_baseline(args.baseline), text, ass_path, args.repeat, font_name=args.font)))
+        results.append(("measured" if measured else "estimated", run(AnimationGenerator, text, ass_path, args.repeat, font_name=args.font)))
+        if measured:
+            # 同一份文案在估算模式下的耗时
+            text_layout._load_font_table.cache_clear()
+            text_layout.get_glyph_metrics.cache_clear()
+            original = text_layout._load_font_table
+            text_layout._load_font_table = lambda name: None
+            try:
+                results.append(("estimated", run(AnimationGenerator, text, ass_path, args.repeat, font_name=args.font)))
+            finally:
+                text_layout._load_font_table = original
+        with open(ass_path, encoding="utf-8") as f:
+            events = sum(1 for line in f if line.startswith("Dialogue:"))
+
+    print()
+    print(f"词数: {n_tokens}  事件数: {events}  字体: {args.font} ({'真实字宽' if measured else '未找到字体或缺少 fontTools，估算字宽'})")
+    print(f"{'模式':<24}{'耗时(ms)':>12}{'词/s':>14}")
+    for name, cost in results:
+        print(f"{name:<24}{cost * 1000:>12.1f}{n_tokens / cost:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
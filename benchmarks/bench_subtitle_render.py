@@ -0,0 +1,77 @@
+"""
+字幕滤镜开销基准：token 与 karaoke 两种字幕编译方式下 libass 烧录的速度 (fps)
+
+用纯色背景 + 全局字幕（多个场景首尾相接）输出到 null，只测 subtitles 滤镜本身；
+同时给出不带字幕的空跑速度作为基线。
+用法:
+    python benchmarks/bench_subtitle_render.py [--scenes 10] [--resolution 1080x1920] [--style classic_yellow]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BASE_DIR
+from generator.animation import AnimationGenerator
+from generator.manifest import split_sentences
+from generator.synthesis import VideoSynthesizer
+
+
+def load_scenes(path, count):
+    with open(path, encoding="utf-8") as f:
+        sentences = [s for s in split_sentences(f.read()) if s]
+    while sentences and len(sentences) < count:
+        sentences += sentences[:count - len(sentences)]
+    # 按约 4 字/秒估算每个场景时长；底片是一条连续的纯色视频，场景长度即为该时长
+    scenes = [{"sentence": s, "timestamps": [{"start": 0.1}], "duration": round(max(1.5, len(s) / 4), 2)} for s in sentences[:count]]
+    return [{**scene, "span": scene["duration"]} for scene in scenes]
+
+
+def run_filter(resolution, seconds, fps, vf):
+    frames = int(seconds * fps)
+    cmd = [
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"color=c=0x1a1a1a:s={resolution}:r={fps}:d={seconds:.2f}",
+        *(["-vf", vf] if vf else []), "-f", "null", "-", "-loglevel", "error"
+    ]
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+    return frames / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="libass 字幕烧录速度对比")
+    parser.add_argument("--script", default=os.path.join(BASE_DIR, "script.txt"))
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument("--resolution", default="1080x1920")
+    parser.add_argument("--style", default="classic_yellow", choices=list(AnimationGenerator.SUBTITLE_PRESETS))
+    parser.add_argument("--font", default="PingFang SC")
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    scenes = load_scenes(args.script, args.scenes)
+    seconds = sum(s["span"] for s in scenes)
+    synth = VideoSynthesizer(args.resolution.replace("x", ":"), args.fps)
+
+    results = [("no subtitles", 0, run_filter(args.resolution, seconds, args.fps, None))]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for compiler in AnimationGenerator.SUBTITLE_COMPILERS:
+            ass_path = os.path.join(tmp_dir, f"{compiler}.ass")
+            AnimationGenerator(args.resolution, args.fps, compiler=compiler).prepare_global_subtitles(
+                scenes, ass_path, style_id=args.style, font_name=args.font)
+            with open(ass_path, encoding="utf-8") as f:
+                events = sum(1 for line in f if line.startswith("Dialogue:"))
+            results.append((compiler, events, run_filter(args.resolution, seconds, args.fps, synth._subtitle_filter(ass_path))))
+
+    print()
+    print(f"场景数: {len(scenes)}  时长: {seconds:.1f}s  分辨率: {args.resolution}  样式: {args.style}")
+    print(f"{'编译方式':<16}{'事件数':>10}{'fps':>10}")
+    for name, events, fps in results:
+        print(f"{name:<16}{events:>10}{fps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+本地图像服务商替身：兼容火山引擎 / OpenAI 的图片生成接口，供离线基准测试使用
+
+    POST /images/generations   按 latency (+ 随机 jitter) 延迟后返回 {"data": [{"url": ".../img/<尺寸>.jpg"}]}，
+                               按 failure_rate 返回 500 / 429（走客户端的退避重试）
+    GET  /img/<W>x<H>.jpg      返回该尺寸的测试图（首次请求时用 ffmpeg 生成并缓存）
+
+随机数使用固定种子，同样的参数下失败序列可复现。
+单独运行: python benchmarks/fake_image_server.py --port 9100 --latency 0.8 --failure-rate 0.05
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeImageServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, jitter=0.0, failure_rate=0.0, seed=0, image_dir=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._image_dir = image_dir or tempfile.mkdtemp(prefix="fake_images_")
+        self._image_lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "downloads": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def generation_url(self):
+        return f"{self.base_url}/images/generations"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-image-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _draw(self):
+        """返回 (延迟秒数, 失败时的 HTTP 状态码或 None)，在锁内取随机数保证序列确定"""
+        with self._random_lock:
+            self.stats["requests"] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() >= self.failure_rate:
+                return delay, None
+            self.stats["failures"] += 1
+            # 限流与服务端错误交替出现
+            return delay, 429 if self.stats["failures"] % 2 else 500
+
+    def image_path(self, size):
+        path = os.path.join(self._image_dir, f"{size}.jpg")
+        with self._image_lock:
+            if not os.path.exists(path):
+                subprocess.run([
+                    "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=s={size}:d=1", "-frames:v", "1",
+                    "-q:v", "3", path, "-loglevel", "error"
+                ], check=True, stdin=subprocess.DEVNULL)
+        return path
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                delay, status = server._draw()
+                time.sleep(delay)
+                if status:
+                    return self._reply(status, b'{"error": "injected failure"}', headers={"Retry-After": "1"} if status == 429 else None)
+                size = payload.get("size") or "1024x1024"
+                if not re.fullmatch(r"\d{2,5}x\d{2,5}", size):
+                    return self._reply(400, b'{"error": "bad size"}')
+                body = json.dumps({"data": [{"url": f"{server.base_url}/img/{size}.jpg"}]}).encode()
+                self._reply(200, body)
+
+            def do_GET(self):
+                match = re.fullmatch(r"/img/(\d{2,5}x\d{2,5})\.jpg", self.path)
+                if not match:
+                    return self._reply(404, b"{}")
+                with server._random_lock:
+                    server.stats["downloads"] += 1
+                with open(server.image_path(match.group(1)), "rb") as f:
+                    self._reply(200, f.read(), content_type="image/jpeg")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地图像服务商替身")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="生成接口的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="在固定延迟上叠加 [0, jitter) 的随机延迟")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeImageServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                             failure_rate=args.failure_rate, seed=args.seed).start()
+    print(f"🖼️ 本地图像服务: {server.generation_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import os
 # Edge TTS 配置（完全免费）
 EDGE_TTS_VOICE = "zh-CN-XiaoxiaoNeural"  # 晓晓（自然女声）
 # 其他可选音色: zh-CN-YunxiNeural (云溪男声), zh-CN-XiaoyiNeural (小伊女声)
+TTS_TIMING_MODE = "boundary"  # boundary: 使用 Edge TTS 词边界时间戳，缺失时回退 Whisper / whisper: 始终 Whisper 对齐
 
 # 火山引擎方舟 Ark 图像生成 (建议通过 Web 界面配置，保存在浏览器缓存中)
 ARK_API_KEY = ""
@@ -19,7 +20,86 @@ SCENES_DIR = os.path.join(ASSETS_DIR, "scenes")
 # Video Settings
 VIDEO_RES = "1080x1920"  # 9:16 default
 FPS = 30
+RENDER_MODE = "scene"  # scene: 逐场景编码后拼接 / single_pass: 整条视频一个滤镜图一次编码
+MOTION_ENGINE = "zoompan"  # Ken Burns 实现: zoompan (原始实现) / scale_crop (预缩放一次，逐帧轻量缩放裁剪，切换前先跑 benchmarks/bench_motion.py)
+ENCODER_PROFILE = "balanced"  # 编码档位: draft (最快，预览用) / balanced / archive (最高画质，最慢)
+ENCODER_PREFERENCE = []  # 优先尝试的编码器，如 ["h264_videotoolbox"]；为空时按档位默认顺序，探测不可用的自动跳过
+SUBTITLE_MODE = "scene"  # scene: 逐场景烧录 / global: 整条视频一份 ASS 拼接后烧录一次 / soft: 封装为可开关的软字幕轨
+SUBTITLE_COMPILER = "token"  # 字幕特效编译: token (每词独立事件) / karaoke (每行一条事件，\kf / \t 行内标签，libass 开销更低)
+STREAM_OUTPUT = True  # 边渲染边输出 HLS 分片，网页端可在第一个场景完成后开始播放（仅逐场景渲染模式）
+STREAM_DIR = os.path.join(OUTPUT_DIR, "hls")
+HLS_TARGET_DURATION = 30  # 播放列表声明的分片最大时长（秒），单个场景一般不会超过
 
 # Mock Settings
 MOCK_AUDIO = False  # Edge TTS + Whisper: False (真实 API)
+MOCK_AUDIO_ENGINE = "auto"  # 模拟配音: say (macOS 朗读) / tone (正弦音，跨平台且可复现) / auto (有 say 用 say)
 MOCK_IMAGE = False  # Seedream: False (真实 API)
+
+# Task Store
+TASK_STORE_BACKEND = "sqlite"  # sqlite (WAL, 按行增量更新) / json (旧版 tasks.json)
+TASK_DB_PATH = os.path.join(ASSETS_DIR, "tasks.db")
+TASK_HISTORY_MAX_AGE = 7 * 24 * 3600  # 已结束任务保留时长（秒）
+TASK_HISTORY_MAX_COUNT = 1000  # 已结束任务最多保留条数
+RESUME_ON_STARTUP = False  # 启动时自动续跑上次中断的任务（否则标记为中断，由 /api/resume 手动继续）
+
+# Progress SSE
+# 大于 0 时在该端口启动独立的 asyncio SSE 服务（一个线程承载全部观看者），/api/progress 重定向过去；
+# 0 时由 Flask 直接推送，每个连接占一个 Werkzeug 线程
+PROGRESS_SSE_PORT = 0
+PROGRESS_SSE_URL = None  # 反向代理后面时填写 SSE 服务的对外地址，如 "https://example.com/sse"；缺省为 当前主机:端口
+
+# Worker Pool
+WORKER_POOL_SIZE = 2  # 常驻生成进程数量
+WORKER_MAX_JOBS = 20  # 单个进程执行多少个任务后回收
+WORKER_MAX_RSS_MB = 3072  # 单个进程常驻内存上限，超过后回收
+
+# Scheduler
+SCHEDULER_MAX_QUEUE = 50  # 全局排队上限
+SCHEDULER_MAX_PER_CLIENT = 10  # 单个客户端 (API Key / IP) 排队上限
+SCHEDULER_CPU_BUDGET = 1.5  # 1 分钟负载 / 核心数 超过该值时拒绝新任务
+SCHEDULER_MIN_FREE_MEM_MB = 1024  # 可用内存低于该值时拒绝新任务
+SCHEDULER_DEFAULT_JOB_SECONDS = 120  # 初始预估单任务耗时（之后按实际耗时滑动平均）
+BATCH_MAX_SCRIPTS = 500  # 单个批次最多的文案数（/api/batch）
+
+# Scene Pipeline
+PIPELINE_TTS_WORKERS = 8  # 配音并发（网络等待型）
+PIPELINE_IMAGE_WORKERS = 8  # 生图并发（网络等待型，上游并发另由 IMAGE_PROVIDER_CONCURRENCY 限制）
+PIPELINE_ALIGN_WORKERS = 1  # Whisper 对齐并发
+PIPELINE_RENDER_WORKERS = 0  # 场景渲染并发，0 表示按 CPU 核心数自动决定
+PIPELINE_QUEUE_SIZE = 4  # 阶段之间的队列长度
+ALIGN_MODE = "scene"  # scene: 逐场景对齐，边合成边渲染 / batch: 整篇拼接后一次 Whisper 推理
+
+# Distributed Rendering (场景编码分发到多台渲染节点: python -m service.render_worker)
+RENDER_BACKEND = "local"  # local: 本机编码 / distributed: 场景单元发布到共享队列，由远程节点领取编码
+RENDER_QUEUE_PATH = os.path.join(ASSETS_DIR, "render_queue.db")  # 队列库文件，各节点需能访问
+RENDER_SHARED_DIR = os.path.join(ASSETS_DIR, "shared")  # 场景素材与成片的共享存储目录
+RENDER_REMOTE_INFLIGHT = 16  # 单个任务同时在队列中等待 / 渲染的场景数
+RENDER_LEASE_SECONDS = 60  # 租约时长，节点每 1/3 租约续约一次，失联超过该时长的单元重新派发
+RENDER_MAX_ATTEMPTS = 3  # 单个单元最多派发次数
+RENDER_WORKER_TIMEOUT = 30  # 超过该时长没有任何远程节点在线时，协调进程就地渲染
+
+# TTS Cache
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = os.path.join(ASSETS_DIR, "cache", "tts")
+TTS_CACHE_MAX_MB = 2048  # 超过后按最久未使用淘汰
+TTS_CACHE_TTL = 30 * 24 * 3600  # 超过该时长未使用的条目直接删除（秒）
+
+# Image HTTP Client
+IMAGE_HTTP_POOL_SIZE = 16  # 每个主机保持的连接数
+IMAGE_HTTP_MAX_RETRIES = 4  # 429 / 5xx / 连接错误的最大重试次数
+IMAGE_PROVIDER_CONCURRENCY = {  # 每个服务商的并发请求上限（下载单独计数）
+    "volcengine": 4, "volcengine:download": 8,
+    "openai": 4, "openai:download": 8,
+}
+
+# Image Cache
+IMAGE_CACHE_ENABLED = True
+IMAGE_CACHE_DIR = os.path.join(ASSETS_DIR, "cache", "images")
+IMAGE_CACHE_MAX_MB = 4096
+IMAGE_CACHE_TTL = 30 * 24 * 3600
+
+# Scene Cache (渲染好的场景视频，按场景全部输入的哈希寻址，重新生成时未改动的场景直接复用)
+SCENE_CACHE_ENABLED = True
+SCENE_CACHE_DIR = os.path.join(ASSETS_DIR, "cache", "scenes")
+SCENE_CACHE_MAX_MB = 8192
+SCENE_CACHE_TTL = 7 * 24 * 3600
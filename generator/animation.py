@@ -2,7 +2,8 @@
 import os
 import subprocess
 import json
-import re
+
+from generator.text_layout import tokenize, token_weight, get_glyph_metrics, layout_lines, PUNC
 
 class AnimationGenerator:
     # 预设风格配置
@@ -41,9 +42,17 @@ class AnimationGenerator:
         }
     }
 
-    def __init__(self, resolution="1080x1920", fps=30):
+    SUBTITLE_COMPILERS = ("token", "karaoke")
+
+    def __init__(self, resolution="1080x1920", fps=30, compiler="token"):
+        """
+        compiler: 字幕特效的编译方式
+          token   - 每个词独立 \\pos 定位，每词最多 3 条事件（基础层前/后 + 激活层）
+          karaoke - 每行每层 1 条事件，逐词效果用行内 \\kf / \\t 标签表达，libass 每帧需要计算的事件少一个数量级
+        """
         self.resolution = resolution
         self.fps = fps
+        self.compiler = compiler if compiler in self.SUBTITLE_COMPILERS else "token"
 
     def prepare_subtitles(self, text, timestamps, output_ass_path, duration=3.0, style_id="classic_yellow", font_name="PingFang SC"):
         """根据预设样式生成 ASS 字幕"""
@@ -51,152 +60,225 @@ class AnimationGenerator:
         self._write_ass_file(text, timestamps, duration, output_ass_path, preset, font_name)
         return output_ass_path
 
+    def prepare_global_subtitles(self, scenes, output_ass_path, style_id="classic_yellow", font_name="PingFang SC"):
+        """
+        整条视频一份 ASS：每个场景的事件按之前场景的累计时长平移，拼接后只需烧录（或封装）一次。
+        scenes: 按播放顺序排列的 [{"sentence", "timestamps", "duration", "span"}, ...]
+          duration 为配音时长（场景内的字幕时间轴），span 为场景在成片中的实际长度（按帧 / 音频帧取整后）
+        """
+        preset = self.SUBTITLE_PRESETS.get(style_id, self.SUBTITLE_PRESETS["classic_yellow"])
+        out = [self._ass_header(preset, font_name)]
+        offset = 0.0
+        for scene in scenes:
+            out += self._scene_events(scene["sentence"], scene["timestamps"], scene["duration"], preset, font_name, offset)
+            # 按实际长度累计，长视频里每个场景的取整误差不会叠加
+            offset += scene["span"]
+        with open(output_ass_path, "w", encoding="utf-8") as f:
+            f.write("".join(out))
+        return output_ass_path
+
+    def prepare_soft_subtitles(self, scenes, output_srt_path):
+        """软字幕：每个场景一条整句 SRT 字幕（播放器按句显示，不带逐字动画）"""
+        out = []
+        offset = 0.0
+        for i, scene in enumerate(scenes, 1):
+            start, end = offset, offset + scene["span"]
+            out.append(f"{i}\n{self._srt_time(start)} --> {self._srt_time(end)}\n{scene['sentence']}\n\n")
+            offset = end
+        with open(output_srt_path, "w", encoding="utf-8") as f:
+            f.write("".join(out))
+        return output_srt_path
+
+    def _srt_time(self, seconds):
+        ms = max(0, int(round(seconds * 1000)))
+        return f"{ms // 3600000:02d}:{(ms % 3600000) // 60000:02d}:{(ms % 60000) // 1000:02d},{ms % 1000:03d}"
+
     def _write_ass_file(self, full_text, timestamps, duration, ass_path, preset, font_name):
+        events = self._scene_events(full_text, timestamps, duration, preset, font_name)
+        if not events: return
+        with open(ass_path, "w", encoding="utf-8") as f:
+            f.write(self._ass_header(preset, font_name) + "".join(events))
+
+    def _layout_params(self):
         try:
             w_res, h_res = map(int, self.resolution.split("x"))
         except:
             w_res, h_res = 1080, 1920
-            
+        is_vertical = w_res < h_res
+        font_size = int(h_res * (0.055 if is_vertical else 0.08))
+        return w_res, h_res, is_vertical, font_size
+
+    def _ass_header(self, preset, font_name):
+        w_res, h_res, _, font_size = self._layout_params()
+        # \\kf 从 SecondaryColour 扫到 PrimaryColour：未读为基础色，已读为高亮色
+        karaoke_style = "" if self.compiler != "karaoke" else (
+            f"Style: Karaoke,{font_name},{font_size},{preset['primary_color']},{preset['base_color']},"
+            f"{preset['outline_color']},{preset['shadow_color']},1,0,0,0,100,100,0,0,1,3,2,5,0,0,0,1\n"
+        )
+        return f"""[Script Info]
+ScriptType: v4.00+
+PlayResX: {w_res}
+PlayResY: {h_res}
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Base,{font_name},{font_size},{preset['base_color']},{preset['base_color']},{preset['outline_color']},{preset['shadow_color']},1,0,0,0,100,100,0,0,1,3,2,5,0,0,0,1
+Style: Active,{font_name},{font_size},{preset['primary_color']},{preset['primary_color']},{preset['outline_color']},{preset['shadow_color']},1,0,0,0,100,100,0,0,1,4,3,5,0,0,0,1
+{karaoke_style}
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+    def _scene_events(self, full_text, timestamps, duration, preset, font_name, offset=0.0):
+        """单个场景的 Dialogue 行列表；offset 为该场景在整条视频中的起始时间（秒）"""
+        w_res, h_res, is_vertical, font_size = self._layout_params()
+
         # 1. 文本对齐 (保持原逻辑)
-        tokens_raw = re.findall(r'[\u4e00-\u9fa5]|[a-zA-Z0-9\-\'\"]+|[，。！？；：\"“”]', full_text)
-        if not tokens_raw: return
+        tokens = tokenize(full_text)
+        if not tokens: return []
 
         whisper_start = timestamps[0].get("start", 0) if timestamps else 0
         time_span = max(0.1, duration - whisper_start)
 
-        def get_weight(tok):
-            if re.match(r'[\u4e00-\u9fa5]', tok): return 1.0
-            if re.match(r'[，。！？；：\"“”]', tok): return 0.2
-            return max(0.5, len(tok) * 0.4)
-
-        total_weight = sum(get_weight(t) for t in tokens_raw)
+        weights = [token_weight(tok, kind) for tok, kind in tokens]
+        total_weight = sum(weights)
         aligned = []
         curr = whisper_start
-        for tok in tokens_raw:
-            w = get_weight(tok)
+        for (tok, kind), w in zip(tokens, weights):
             dur = (w / total_weight) * time_span if total_weight > 0 else 0.1
-            aligned.append({"text": tok, "start": curr, "end": curr + dur})
+            aligned.append({"text": tok, "kind": kind, "start": curr, "end": curr + dur})
             curr += dur
 
         # 2. 布局参数
-        is_vertical = w_res < h_res
-        font_size = int(h_res * (0.055 if is_vertical else 0.08))
         y_center = int(h_res * 0.72) if is_vertical else int(h_res * 0.82)
-        spacing = -int(font_size * 0.12) 
         line_max_w = int(w_res * 0.85)
         line_height = int(font_size * 1.5)
 
-        def get_tok_width(tok):
-            if re.match(r'[\u4e00-\u9fa5]', tok): return int(font_size * 0.9)
-            if re.match(r'[，。！？；：\"“”]', tok): return int(font_size * 0.4)
-            return len(tok) * (font_size * 0.5)
-
-        # 3. 分行逻辑
-        lines = []
-        curr_line = []
-        curr_w = 0
-        for item in aligned:
-            w = get_tok_width(item['text'])
-            if curr_w + w > line_max_w and curr_line:
-                lines.append(curr_line)
-                curr_line = []
-                curr_w = 0
-            curr_line.append({**item, "w": w})
-            curr_w += w + spacing
-        if curr_line:
-            lines.append(curr_line)
-
-        # 4. 计算坐标
-        final_layout = []
-        for row_idx, line in enumerate(lines):
-            def get_gap(i):
-                if i >= len(line) - 1: return 0
-                is_punc = lambda x: re.match(r'[，。！？；：\"“”]', x)
-                if is_punc(line[i]['text']) or is_punc(line[i+1]['text']):
-                    return int(font_size * 0.05)
-                return spacing
-
-            line_w = sum(t['w'] for t in line)
-            for i in range(len(line) - 1):
-                line_w += get_gap(i)
-            
-            start_x = (w_res - line_w) / 2
-            y_row = y_center + (row_idx - (len(lines)-1)/2) * line_height
-            
-            x_curr = start_x
-            for i, t in enumerate(line):
-                final_layout.append({**t, "x": x_curr + t['w']/2, "y": y_row})
-                x_curr += t['w'] + get_gap(i)
-
-        # 5. 构造 ASS 内容
-        header = f"""[Script Info]
-ScriptType: v4.00+
-PlayResX: {w_res}
-PlayResY: {h_res}
-ScaledBorderAndShadow: yes
+        # 3. 分行 + 4. 计算坐标（字宽来自字体文件，按字体/字号缓存）
+        metrics = get_glyph_metrics(font_name, font_size)
+        final_layout = layout_lines(aligned, metrics, w_res, y_center, line_max_w, line_height)
 
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Base,{font_name},{font_size},{preset['base_color']},{preset['base_color']},{preset['outline_color']},{preset['shadow_color']},1,0,0,0,100,100,0,0,1,3,2,5,0,0,0,1
-Style: Active,{font_name},{font_size},{preset['primary_color']},{preset['primary_color']},{preset['outline_color']},{preset['shadow_color']},1,0,0,0,100,100,0,0,1,4,3,5,0,0,0,1
-"""
+        # 5. 构造事件
+        offset_ms = offset * 1000
+        ass_time = lambda ms: self._ms_to_ass_time(offset_ms + ms)
+        if self.compiler == "karaoke":
+            return self._karaoke_events(final_layout, preset['effect'], whisper_start, duration, w_res, ass_time)
 
-        body = "\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
-        start_all_str = self._ms_to_ass_time(whisper_start * 1000)
-        end_all_str = self._ms_to_ass_time(duration * 1000)
+        out = []
+        start_all_str = ass_time(whisper_start * 1000)
+        end_all_str = ass_time(duration * 1000)
+        zero_str = ass_time(0)
+        effect = preset['effect']
         TIMING_OFFSET_MS = 200
 
         for item in final_layout:
-            x, y = item['x'], item['y']
+            pos = f"{{\\pos({item['x']:.1f},{item['y']:.1f})"
+            text = item['text']
             s_time_ms = max(0, item['start'] * 1000 - TIMING_OFFSET_MS)
             e_time_ms = max(0, item['end'] * 1000 - TIMING_OFFSET_MS)
-            is_punc = re.match(r'[，。！？；：\"“”]', item['text'])
             
-            if is_punc or preset['effect'] == 'none':
-                body += f"Dialogue: 0,{start_all_str},{end_all_str},Base,,0,0,0,,{{\\pos({x:.1f},{y:.1f})}}{item['text']}\n"
-            else:
-                # 背景层避让
-                if s_time_ms > 0:
-                    body += f"Dialogue: 0,{self._ms_to_ass_time(0)},{self._ms_to_ass_time(s_time_ms)},Base,,0,0,0,,{{\\pos({x:.1f},{y:.1f})}}{item['text']}\n"
-                if e_time_ms < duration * 1000:
-                    body += f"Dialogue: 0,{self._ms_to_ass_time(e_time_ms)},{end_all_str},Base,,0,0,0,,{{\\pos({x:.1f},{y:.1f})}}{item['text']}\n"
-
-                # 激活动画层
-                s_str, e_str = self._ms_to_ass_time(s_time_ms), self._ms_to_ass_time(e_time_ms)
-                if preset['effect'] == 'zoom_pop':
-                    dur_ms = int(max(50, e_time_ms - s_time_ms))
-                    p1, p2 = min(150, int(dur_ms * 0.4)), min(300, int(dur_ms * 0.8))
-                    tags = "{\\pos(" + f"{x:.1f},{y:.1f}" + ")\\t(0," + str(p1) + ",\\fscx130\\fscy130)\\t(" + str(p1) + "," + str(p2) + ",\\fscx100\\fscy100)}"
-                    body += f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{tags}{item['text']}\n"
-                elif preset['effect'] == 'explode':
-                    dur_ms = int(max(50, e_time_ms - s_time_ms))
-                    # 炸裂效果：从100%快速放大到250%，同时透明度从不透明变为全透明
-                    tags = "{\\pos(" + f"{x:.1f},{y:.1f}" + ")\\t(0," + str(dur_ms) + ",\\fscx250\\fscy250\\alpha&HFF&)}"
-                    body += f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{tags}{item['text']}\n"
-                elif preset['effect'] == 'karaoke_wipe':
-                    # 模仿 K 帧效果的简化版：激活时间段变色
-                    body += f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{{\\pos({x:.1f},{y:.1f})}}{item['text']}\n"
+            if item['kind'] == PUNC or effect == 'none':
+                out.append(f"Dialogue: 0,{start_all_str},{end_all_str},Base,,0,0,0,,{pos}}}{text}\n")
+                continue
 
-        with open(ass_path, "w", encoding="utf-8") as f:
-            f.write(header + body)
+            s_str, e_str = ass_time(s_time_ms), ass_time(e_time_ms)
+            # 背景层避让
+            if s_time_ms > 0:
+                out.append(f"Dialogue: 0,{zero_str},{s_str},Base,,0,0,0,,{pos}}}{text}\n")
+            if e_time_ms < duration * 1000:
+                out.append(f"Dialogue: 0,{e_str},{end_all_str},Base,,0,0,0,,{pos}}}{text}\n")
 
-    def _ms_to_ass_time(self, ms):
-        ms = max(0, int(ms))
-        h, m, s, cs = ms // 3600000, (ms % 3600000) // 60000, (ms % 60000) // 1000, (ms % 1000) // 10
-        return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+            # 激活动画层
+            if effect == 'zoom_pop':
+                dur_ms = int(max(50, e_time_ms - s_time_ms))
+                p1, p2 = min(150, int(dur_ms * 0.4)), min(300, int(dur_ms * 0.8))
+                out.append(f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{pos}\\t(0,{p1},\\fscx130\\fscy130)\\t({p1},{p2},\\fscx100\\fscy100)}}{text}\n")
+            elif effect == 'explode':
+                dur_ms = int(max(50, e_time_ms - s_time_ms))
+                # 炸裂效果：从100%快速放大到250%，同时透明度从不透明变为全透明
+                out.append(f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{pos}\\t(0,{dur_ms},\\fscx250\\fscy250\\alpha&HFF&)}}{text}\n")
+            elif effect == 'karaoke_wipe':
+                # 模仿 K 帧效果的简化版：激活时间段变色
+                out.append(f"Dialogue: 1,{s_str},{e_str},Active,,0,0,0,,{pos}}}{text}\n")
+        return out
 
-    def create_text_animation(self, *args, **kwargs):
-        pass
+    def _karaoke_events(self, layout, effect, whisper_start, duration, w_res, ass_time):
+        """
+        行级编译：每行输出一条（或两条）事件，整行以行中心 \\pos 定位，由 libass 负责行内排版。
+          karaoke_wipe     - 1 层：\\kf 逐词扫色
+          zoom_pop/explode - 基础层：词激活期间用 \\t 切换透明度隐藏；
+                             激活层：整行透明，仅激活中的词显现并做缩放动画
+        \\t 的时间相对事件起点；同一事件内标签状态会延续到后续文本，所以每段开头都显式复位。
+        """
+        TIMING_OFFSET_MS = 200
+        end_ms = duration * 1000
+        start_all_ms = whisper_start * 1000
 
-        with open(ass_path, "w", encoding="utf-8") as f:
-            f.write(header + body)
+        rows = []
+        for item in layout:
+            if not rows or rows[-1][0]["y"] != item["y"]:
+                rows.append([])
+            rows[-1].append({
+                **item,
+                "s": max(0, item["start"] * 1000 - TIMING_OFFSET_MS),
+                "e": max(0, item["end"] * 1000 - TIMING_OFFSET_MS),
+            })
+
+        out = []
+        for row in rows:
+            pos = f"\\pos({w_res / 2:.1f},{row[0]['y']:.1f})"
+            if effect == 'none':
+                out.append(f"Dialogue: 0,{ass_time(start_all_ms)},{ass_time(end_ms)},Base,,0,0,0,,{{{pos}}}{''.join(t['text'] for t in row)}\n")
+                continue
+
+            if effect == 'karaoke_wipe':
+                # 以厘秒累计边界再取差值，避免逐词取整造成的漂移
+                parts = [f"{{{pos}\\k{round(row[0]['s'] / 10)}}}"]
+                prev_cs = round(row[0]["s"] / 10)
+                for t in row:
+                    end_cs = max(prev_cs, round(t["e"] / 10))
+                    parts.append(f"{{\\kf{end_cs - prev_cs}}}{t['text']}")
+                    prev_cs = end_cs
+                out.append(f"Dialogue: 0,{ass_time(0)},{ass_time(end_ms)},Karaoke,,0,0,0,,{''.join(parts)}\n")
+                continue
+
+            # 基础层：整个场景可见，词激活期间隐藏；标点从首词开始显示
+            base = [f"{{{pos}}}"]
+            for t in row:
+                if t["kind"] == PUNC:
+                    sa = int(start_all_ms)
+                    base.append(f"{{\\alpha&HFF&\\t({sa},{sa + 1},\\alpha&H00&)}}{t['text']}")
+                else:
+                    s, e = int(t["s"]), int(t["e"])
+                    base.append(f"{{\\alpha&H00&\\t({s},{s + 1},\\alpha&HFF&)\\t({e},{e + 1},\\alpha&H00&)}}{t['text']}")
+            out.append(f"Dialogue: 0,{ass_time(0)},{ass_time(end_ms)},Base,,0,0,0,,{''.join(base)}\n")
+
+            # 激活层：事件覆盖整行的激活区间
+            words = [t for t in row if t["kind"] != PUNC]
+            if not words: continue
+            row_s, row_e = words[0]["s"], max(t["e"] for t in words)
+            active = [f"{{{pos}}}"]
+            for t in row:
+                if t["kind"] == PUNC:
+                    active.append(f"{{\\alpha&HFF&}}{t['text']}")
+                    continue
+                s, e = int(t["s"] - row_s), int(t["e"] - row_s)
+                dur_ms = int(max(50, t["e"] - t["s"]))
+                reset = f"\\alpha&HFF&\\fscx100\\fscy100\\t({s},{s + 1},\\alpha&H00&)"
+                if effect == 'zoom_pop':
+                    p1, p2 = min(150, int(dur_ms * 0.4)), min(300, int(dur_ms * 0.8))
+                    anim = f"\\t({s},{s + p1},\\fscx130\\fscy130)\\t({s + p1},{s + p2},\\fscx100\\fscy100)\\t({e},{e + 1},\\alpha&HFF&)"
+                else:
+                    # explode：放大到 250% 的同时淡出
+                    anim = f"\\t({s},{s + dur_ms},\\fscx250\\fscy250\\alpha&HFF&)"
+                active.append(f"{{{reset}{anim}}}{t['text']}")
+            out.append(f"Dialogue: 1,{ass_time(row_s)},{ass_time(row_e)},Active,,0,0,0,,{''.join(active)}\n")
+        return out
 
     def _ms_to_ass_time(self, ms):
         ms = max(0, int(ms))
-        h = ms // 3600000
-        m = (ms % 3600000) // 60000
-        s = (ms % 60000) // 1000
-        cs = (ms % 1000) // 10
+        h, m, s, cs = ms // 3600000, (ms % 3600000) // 60000, (ms % 60000) // 1000, (ms % 1000) // 10
         return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
 
     def create_text_animation(self, *args, **kwargs):
@@ -3,19 +3,50 @@ import os
 import json
 import subprocess
 import asyncio
+import bisect
+import re
+import zlib
+import shutil
+import unicodedata
+
+from generator import tracing
+from generator.cache import FileCache
+
+_ALNUM_RE = re.compile(r'[\u4e00-\u9fa5]|[a-zA-Z0-9]')
 
 class AudioGenerator:
-    def __init__(self, voice="zh-CN-XiaoxiaoNeural", mock_mode=False):
+    # 进程级共享的 Whisper 模型，常驻工作进程只加载一次
+    _shared_whisper_model = None
+
+    # 音频处理流程版本，改动合成/补静音/对齐逻辑时递增，使旧缓存失效
+    PIPELINE_VERSION = 2
+    # 场景末尾的静音缓冲：音频文件本身不再补静音，由合成阶段解码时 apad 到场景时长
+    PAD_SECONDS = 0.3
+    # Edge TTS 默认输出 audio-24khz-48kbitrate-mono-mp3（CBR），可直接由文件大小推算时长
+    EDGE_TTS_BITRATE = 48000
+    # 正弦音模拟配音的语速（有效字符/秒），接近 Edge TTS 中文默认语速
+    MOCK_CHARS_PER_SECOND = 4.5
+
+    def __init__(self, voice="zh-CN-XiaoxiaoNeural", mock_mode=False, timing_mode="boundary", cache=None, mock_engine="auto"):
         """
         初始化音频生成器
         voice: Edge TTS 音色，默认使用晓晓（自然女声）
+        timing_mode: boundary 使用 Edge TTS 自带的 WordBoundary 时间戳，缺失时才用 Whisper；
+                     whisper 始终用 Whisper 对齐
+        cache: 可选 FileCache，按 (音色, 规范化文本, 补静音, 流程版本) 缓存音频、时长和时间戳
+        mock_engine: 模拟配音方式，say (macOS 朗读) / tone (ffmpeg 正弦音，任何平台可用且结果确定) / auto
         """
         self.voice = voice
         self.mock_mode = mock_mode
+        self.mock_engine = mock_engine
+        self.timing_mode = timing_mode
+        self.cache = cache
         self.whisper_model = None
         
     def _load_whisper(self):
-        """延迟加载 Faster-Whisper 模型"""
+        """延迟加载 Faster-Whisper 模型（同一进程内的所有实例共享）"""
+        if self.whisper_model is None and AudioGenerator._shared_whisper_model is not None:
+            self.whisper_model = AudioGenerator._shared_whisper_model
         if self.whisper_model is None:
             from faster_whisper import WhisperModel
             import torch
@@ -34,19 +65,38 @@ class AudioGenerator:
             # 加载模型（base 模型平衡速度和精度）
             # download_root 会自动处理模型下载
             self.whisper_model = WhisperModel("base", device=device, compute_type=compute_type)
+            AudioGenerator._shared_whisper_model = self.whisper_model
         return self.whisper_model
 
     def generate_tts(self, text, scene_id, output_path):
         """
         使用 Edge TTS 生成语音，然后用 Faster-Whisper 提取精准时间戳
         """
+        timestamps, duration = self.synthesize(text, output_path)
+        if timestamps is None:
+            timestamps, duration = self.align(text, output_path, duration=duration)
+        return timestamps, duration
+
+    def synthesize(self, text, output_path):
+        """
+        只做语音合成（网络等待型，可高并发）。
+        返回 (timestamps, duration)；timestamps 为 None 表示还需要 align() 对齐。
+        duration 为场景时长（语音 + PAD_SECONDS 静音），output_path 中只有语音本身
+        """
         if self.mock_mode:
             return self._mock_generate(text, output_path)
+
+        cache_key = self.cache_key(text)
+        if self.cache is not None:
+            meta = self.cache.fetch(cache_key, "audio.mp3", output_path)
+            if meta is not None:
+                print(f"      [TTS Cache] 命中: {text[:20]}...")
+                return meta.get("timestamps"), meta.get("duration")
         
-        # 1. 使用 Edge TTS 生成音频
+        # 1. 使用 Edge TTS 生成音频（同时收集词边界事件）
         try:
             print(f"      [Edge TTS] 正在合成语音: {text[:20]}...")
-            asyncio.run(self._edge_tts_generate(text, output_path))
+            boundaries, speech_seconds = asyncio.run(self._edge_tts_generate(text, output_path))
         except Exception as e:
             print(f"      ⚠️ Edge TTS 合成出错: {e}，切换到 Mock 模式")
             return self._mock_generate(text, output_path)
@@ -54,74 +104,216 @@ class AudioGenerator:
         if not os.path.exists(output_path):
             print("      ⚠️ Edge TTS 生成结果不存在，切换到 Mock 模式")
             return self._mock_generate(text, output_path)
-        
-        # 2. 使用 Faster-Whisper 提取精准时间戳
+
+        tracing.record_output(output_path)
+
+        # 2. 有词边界时直接使用，省去 Whisper 推理
+        timestamps, duration = None, speech_seconds + self.PAD_SECONDS
+        if self.timing_mode == "boundary" and boundaries:
+            timestamps = boundaries
+        if self.cache is not None:
+            try:
+                self.cache.put(cache_key, {"audio.mp3": output_path}, {"timestamps": timestamps, "duration": duration})
+            except OSError as e:
+                print(f"      ⚠️ TTS 缓存写入失败: {e}")
+        return timestamps, duration
+
+    def align(self, text, audio_path, duration=None):
+        """
+        使用 Faster-Whisper 提取精准时间戳（CPU 密集型，建议单线程串行调用）
+        duration: synthesize() 已给出的场景时长，缺省时才探测音频
+        """
         print(f"      [Faster-Whisper] 正在提取词级时间戳...")
+        if duration is None:
+            duration = self._get_audio_duration(audio_path) + self.PAD_SECONDS
         try:
-            timestamps, duration = self._extract_timestamps_with_whisper(output_path, text)
+            timestamps = self._extract_timestamps_with_whisper(audio_path, text, duration)
         except Exception as e:
             print(f"      ⚠️ Whisper 提取时间戳出错: {e}，使用估算时间")
             import traceback
             traceback.print_exc()
-            duration = self._get_audio_duration(output_path)
             timestamps = self._simulate_timestamps(text, duration)
-        
+            return timestamps, duration
+
+        self._cache_timestamps(text, timestamps, duration)
         return timestamps, duration
 
+    @staticmethod
+    def is_estimated(timestamps):
+        """
+        时间戳是否为估算值（模拟配音、Edge TTS 失败后的兜底、Whisper 对齐失败），而非上游真实结果。
+        估算的词带有 estimated 标记，随时间戳一起进入检查点 / 缓存也不会丢失
+        """
+        return any(w.get("estimated") for w in timestamps or ())
+
+    def cache_key(self, text):
+        """配音的内容键：同一音色、同一（规范化后）文本得到同一个键"""
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return FileCache.make_key("tts", self.voice, normalized, self.PAD_SECONDS, self.timing_mode, self.PIPELINE_VERSION)
+
+    def _cache_timestamps(self, text, timestamps, duration):
+        """Whisper 对齐结果回写缓存，下次命中即可跳过对齐"""
+        if self.cache is None or self.mock_mode: return
+        try:
+            self.cache.update_meta(self.cache_key(text), {"timestamps": timestamps, "duration": duration})
+        except Exception as e:
+            print(f"      ⚠️ TTS 缓存更新失败: {e}")
+
     async def _edge_tts_generate(self, text, output_path):
-        """使用 edge-tts 异步生成语音，并添加 300ms 的静音缓冲防止截断"""
+        """
+        使用 edge-tts 流式生成语音：音频块边到边写盘，同时收集 WordBoundary 事件。
+        原始 MP3 直接作为输出，不再解码补静音再重编码（静音在合成阶段补）。
+        返回 (与 Whisper 相同结构的 timestamps 列表, 语音时长秒数)
+        """
         import edge_tts
         
-        communicate = edge_tts.Communicate(text, self.voice)
-        temp_path = output_path + ".tmp.mp3"
-        await communicate.save(temp_path)
-        
-        # 使用 FFmpeg 增加 0.3 秒静音缓冲
-        # adelay 会导致整个音频推迟，我们这里使用 afilter 或者简单的拼接静音
-        # 方案：在末尾增加 300ms 静音
-        cmd = [
-            "ffmpeg", "-y", "-i", temp_path,
-            "-af", "apad=pad_dur=0.3", 
-            "-c:a", "libmp3lame", "-b:a", "192k",
-            output_path, "-loglevel", "error"
-        ]
-        subprocess.run(cmd, check=True)
-        if os.path.exists(temp_path): os.remove(temp_path)
-
-    def _extract_timestamps_with_whisper(self, audio_path, original_text):
-        """使用 Faster-Whisper 提取词级时间戳，强制使用 ffprobe 获取准确时长"""
+        try:
+            # edge-tts >= 7 默认只推送 SentenceBoundary，需要显式请求词边界
+            communicate = edge_tts.Communicate(text, self.voice, boundary="WordBoundary")
+        except TypeError:
+            communicate = edge_tts.Communicate(text, self.voice)
+        temp_path = output_path + ".part"
+        boundaries = []
+        size = 0
+        with open(temp_path, "wb") as f:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    f.write(chunk["data"])
+                    size += len(chunk["data"])
+                elif chunk["type"] == "WordBoundary":
+                    # offset / duration 单位为 100ns
+                    start = chunk["offset"] / 1e7
+                    boundaries.append({
+                        "word": chunk["text"],
+                        "start": start,
+                        "end": start + chunk["duration"] / 1e7
+                    })
+        if size == 0:
+            os.remove(temp_path)
+            return boundaries, 0.0
+        os.replace(temp_path, output_path)
+
+        # CBR：时长 = 字节数 / 码率；与词边界明显矛盾时（服务端改了输出格式）再用 ffprobe
+        seconds = size * 8 / self.EDGE_TTS_BITRATE
+        if boundaries and not (boundaries[-1]["end"] - 0.5 <= seconds <= boundaries[-1]["end"] + 3.0):
+            seconds = self._get_audio_duration(output_path)
+        return boundaries, seconds
+
+    def _extract_timestamps_with_whisper(self, audio_path, original_text, duration):
+        """使用 Faster-Whisper 提取词级时间戳，识别不到词时按场景时长估算"""
+        timestamps = self._transcribe_words(audio_path, original_text)
+        if not timestamps:
+            timestamps = self._simulate_timestamps(original_text, duration)
+        return timestamps
+
+    def align_batch(self, items):
+        """
+        整篇批量对齐：把所有场景音频拼成一条，只调用一次 transcribe，
+        再按各场景在拼接音频中的偏移把词级时间戳拆回去。
+        items: [(text, audio_path), ...]，返回 [(timestamps, duration), ...]
+        边界无法匹配的场景退回单场景对齐。
+        """
+        if len(items) <= 1:
+            return [self.align(text, path) for text, path in items]
+
+        import tempfile
+
+        print(f"      [Faster-Whisper] 批量对齐 {len(items)} 个场景...")
+        words = []
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                merged_path = os.path.join(tmp_dir, "merged.wav")
+                # 偏移量按实际解码出的采样数计算，避免 mp3 时长估算误差逐场景累积
+                offsets, total = self._concat_audio([path for _, path in items], merged_path)
+                full_text = "".join(text for text, _ in items)
+                words = self._transcribe_words(merged_path, full_text[-200:])
+        except Exception as e:
+            print(f"      ⚠️ 批量对齐失败: {e}，退回逐场景对齐")
+            return [self.align(text, path) for text, path in items]
+
+        # 各场景语音时长直接由解码出的采样数得到，无需再探测
+        speech = [end - start for start, end in zip(offsets, offsets[1:] + [total])]
+        durations = [sec + self.PAD_SECONDS for sec in speech]
+
+        # 按词中点归属场景，跨越边界过多的词标记该场景不可信
+        buckets = [[] for _ in items]
+        suspect = set()
+        for w in words:
+            mid = (w["start"] + w["end"]) / 2
+            idx = max(0, min(len(items) - 1, bisect.bisect_right(offsets, mid) - 1))
+            boundary_end = offsets[idx] + speech[idx]
+            if w["start"] < offsets[idx] - 0.15 or w["end"] > boundary_end + 0.15:
+                suspect.add(idx)
+            buckets[idx].append({
+                "word": w["word"],
+                "start": max(0.0, w["start"] - offsets[idx]),
+                "end": min(durations[idx], w["end"] - offsets[idx]),
+            })
+
+        results = []
+        for idx, (text, path) in enumerate(items):
+            if idx in suspect or not self._bucket_matches(text, buckets[idx]):
+                print(f"      ⚠️ 场景 {idx + 1} 边界无法匹配，单独对齐")
+                results.append(self.align(text, path, duration=durations[idx]))
+            else:
+                results.append((buckets[idx], durations[idx]))
+                self._cache_timestamps(text, buckets[idx], durations[idx])
+        return results
+
+    def _transcribe_words(self, audio_path, prompt):
         model = self._load_whisper()
-        
         segments, info = model.transcribe(
             audio_path,
             language="zh",
             word_timestamps=True,
-            initial_prompt=original_text,
+            initial_prompt=prompt,
             beam_size=1
         )
-        
-        timestamps = []
+        words = []
         for segment in segments:
-            if segment.words:
-                for word_info in segment.words:
-                    word = word_info.word.strip()
-                    if word:
-                        timestamps.append({
-                            "word": word,
-                            "start": word_info.start,
-                            "end": word_info.end
-                        })
-        
-        # 关键：使用 ffprobe 获取包含 pad 后的总时长
-        duration = self._get_audio_duration(audio_path)
-        
-        if not timestamps:
-            timestamps = self._simulate_timestamps(original_text, duration)
-        
-        return timestamps, duration
+            for word_info in segment.words or []:
+                word = word_info.word.strip()
+                if word:
+                    words.append({"word": word, "start": word_info.start, "end": word_info.end})
+        return words
+
+    def _concat_audio(self, paths, output_path, sample_rate=16000):
+        """
+        逐个解码为 16kHz 单声道 PCM（Whisper 原生输入格式）并拼接成 wav，
+        返回 (每个场景在拼接音频中的起始秒数, 总秒数)
+        """
+        import wave
+        offsets = []
+        total_samples = 0
+        with wave.open(output_path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(sample_rate)
+            for path in paths:
+                pcm = tracing.run([
+                    "ffmpeg", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(sample_rate),
+                    "-loglevel", "error", "-"
+                ], check=True, capture_output=True, stdin=subprocess.DEVNULL).stdout
+                offsets.append(total_samples / sample_rate)
+                total_samples += len(pcm) // 2
+                out.writeframes(pcm)
+        return offsets, total_samples / sample_rate
+
+    def _bucket_matches(self, text, bucket):
+        """识别出的有效字符数与原文差距过大时视为边界错位"""
+        expected = len(_ALNUM_RE.findall(text))
+        got = len(_ALNUM_RE.findall("".join(w["word"] for w in bucket)))
+        if expected == 0: return True
+        return 0.6 <= got / expected <= 1.5
 
     def _mock_generate(self, text, output_path):
-        """使用 Mac say 命令生成模拟配音"""
+        """生成模拟配音：macOS 上默认用 say 朗读，其他平台用正弦音"""
+        engine = self.mock_engine
+        if engine == "auto":
+            engine = "say" if shutil.which("say") else "tone"
+        if engine == "tone":
+            return self._mock_tone(text, output_path)
+
         print(f"      [Mock] 正在为内容生成模拟配音: {text[:15]}...")
         temp_aiff = output_path.replace(".mp3", ".aiff")
         subprocess.run(["say", "-v", "Tingting", text, "-o", temp_aiff])
@@ -129,10 +321,26 @@ class AudioGenerator:
         if os.path.exists(temp_aiff):
             os.remove(temp_aiff)
         
-        duration = self._get_audio_duration(output_path)
+        duration = self._get_audio_duration(output_path) + self.PAD_SECONDS
         timestamps = self._simulate_timestamps(text, duration)
         return timestamps, duration
 
+    def _mock_tone(self, text, output_path):
+        """
+        按语速估算时长生成正弦音（与 Edge TTS 相同的 24kHz / 48kbps 单声道 MP3）。
+        同一文本的时长与音高固定，离线基准测试可复现
+        """
+        print(f"      [Mock] 正在生成模拟配音 (正弦音): {text[:15]}...")
+        seconds = round(max(1.0, len(_ALNUM_RE.findall(text)) / self.MOCK_CHARS_PER_SECOND), 2)
+        frequency = 220 + zlib.crc32(text.encode("utf-8")) % 440
+        tracing.run([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency={frequency}:sample_rate=24000:duration={seconds}",
+            "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k", output_path, "-loglevel", "error"
+        ], check=True, stdin=subprocess.DEVNULL)
+        tracing.record_output(output_path)
+        duration = seconds + self.PAD_SECONDS
+        return self._simulate_timestamps(text, duration), duration
+
     def _get_audio_duration(self, audio_path):
         """使用 ffprobe 获取音频时长"""
         result = subprocess.run(
@@ -162,7 +370,8 @@ class AudioGenerator:
             timestamps.append({
                 "word": tok,
                 "start": current_time,
-                "end": current_time + duration
+                "end": current_time + duration,
+                "estimated": True
             })
             current_time += duration
         
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为仅进程内去重
+    fcntl = None
+
+
+class FileCache:
+    """
+    内容寻址的磁盘缓存，多个工作进程可安全共享：
+
+        root/
+          index.db              键 -> 大小 / 访问时间 / 元数据，及命中统计（SQLite WAL）
+          objects/ab/<key>/     每个条目一个目录，存放若干文件
+          tmp/                  写入中的临时目录，完成后原子 rename 到 objects/
+          locks/                按 key 的进程间互斥锁文件（singleflight）
+
+    淘汰策略：超过 ttl 未访问的条目删除；总大小超过 max_bytes 时按最久未访问 (LRU) 删除。
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, ttl=30 * 24 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "locks"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                meta TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    def get(self, key, record=True):
+        """命中返回 {"dir", "meta"}，否则 None；record 时记录命中统计"""
+        conn = self._conn()
+        row = conn.execute("SELECT meta, last_access FROM entries WHERE key=?", (key,)).fetchone()
+        entry_dir = self._entry_dir(key)
+        if row is None or not os.path.isdir(entry_dir) or (self.ttl and row[1] < time.time() - self.ttl):
+            if record: self._count("misses")
+            return None
+        conn.execute("UPDATE entries SET last_access=? WHERE key=?", (time.time(), key))
+        if record: self._count("hits")
+        return {"dir": entry_dir, "meta": json.loads(row[0])}
+
+    def fetch(self, key, name, dest_path, record=True, link=False):
+        """
+        命中时把条目中的文件复制到 dest_path，返回元数据；未命中或条目已被淘汰返回 None。
+        link=True 时优先硬链接（大文件免复制），调用方不得原地修改 dest_path
+        """
+        entry = self.get(key, record)
+        if entry is None: return None
+        src = os.path.join(entry["dir"], name)
+        try:
+            if link:
+                if os.path.exists(dest_path): os.remove(dest_path)
+                try:
+                    os.link(src, dest_path)
+                    return entry["meta"]
+                except OSError:
+                    pass  # 跨文件系统等情况退回复制
+            shutil.copyfile(src, dest_path)
+        except OSError:
+            return None
+        return entry["meta"]
+
+    def put(self, key, files, meta=None):
+        """
+        写入条目。files: {文件名: 源路径}。
+        先写入 tmp 目录再 rename，其他进程永远看不到写了一半的条目；并发写同一 key 时保留先完成的一份
+        """
+        tmp_dir = os.path.join(self.root, "tmp", f"{key}.{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        size = 0
+        try:
+            for name, src in files.items():
+                dst = os.path.join(tmp_dir, name)
+                shutil.copyfile(src, dst)
+                size += os.path.getsize(dst)
+            entry_dir = self._entry_dir(key)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # 其他进程已写入同一 key
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (key, size, created, last_access, meta) VALUES (?, ?, ?, ?, ?)",
+            (key, size, now, now, json.dumps(meta or {}))
+        )
+        self.evict()
+
+    @contextmanager
+    def lock(self, key):
+        """
+        按 key 互斥（singleflight）：线程间用进程内锁，进程间用 flock。
+        用法：未命中 -> 加锁 -> 再查一次 -> 仍未命中才真正请求上游并写入，
+        同一 key 的并发请求只有第一个会打到上游，其余等待后直接命中缓存
+        """
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                lock_file = self._acquire_lock_file(key)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._key_locks.pop(key, None)
+
+    def _lock_path(self, key):
+        return os.path.join(self.root, "locks", f"{key}.lock")
+
+    def _acquire_lock_file(self, key):
+        """
+        打开并 flock 锁文件。evict() 可能在我们等锁期间删除了该文件：
+        拿到锁后确认手上的 inode 仍是路径上的那个文件，否则换新文件重试，保证所有进程锁的是同一个 inode
+        """
+        path = self._lock_path(key)
+        while True:
+            lock_file = open(path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _remove_lock_file(self, key):
+        """只在无人持有 / 等待时删除锁文件：非阻塞拿到 flock 后在持锁状态下删除"""
+        path = self._lock_path(key)
+        if fcntl is None:
+            return
+        try:
+            lock_file = open(path, "a")
+        except OSError:
+            return
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update_meta(self, key, meta):
+        self._conn().execute("UPDATE entries SET meta=json_patch(meta, ?) WHERE key=?", (json.dumps(meta), key))
+
+    def evict(self):
+        """删除过期条目，再按 LRU 把总大小压到 max_bytes 以内"""
+        conn = self._conn()
+        victims = []
+        if self.ttl:
+            victims += [r[0] for r in conn.execute(
+                "SELECT key FROM entries WHERE last_access < ?", (time.time() - self.ttl,)
+            )]
+        if self.max_bytes:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                    if total <= self.max_bytes: break
+                    if key not in victims:
+                        victims.append(key)
+                        total -= size
+        for key in victims:
+            conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._remove_lock_file(key)
+        return len(victims)
+
+    def _count(self, name):
+        self._conn().execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value=value+1", (name,)
+        )
+
+    def stats(self):
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM stats"))
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries, "bytes": size, "hits": hits, "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
@@ -0,0 +1,36 @@
+import hashlib
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_entry(key, path=None, **meta):
+    """
+    场景某个阶段的检查点：
+      key     阶段输入的内容键（与缓存键相同），参数变了检查点自然失效
+      path    阶段产物及其 sha256，断点续跑时校验文件仍在且内容未变
+      meta    阶段输出（时长、时间戳等）
+    """
+    entry = {"key": key, **meta}
+    if path:
+        entry.update(path=path, sha256=file_digest(path))
+    return entry
+
+
+def verify_entry(entry, key):
+    """输入键一致、产物完好时返回检查点，否则返回 None（该阶段需要重做）"""
+    if not entry or entry.get("key") != key:
+        return None
+    path = entry.get("path")
+    if path:
+        try:
+            if file_digest(path) != entry.get("sha256"):
+                return None
+        except OSError:
+            return None
+    return entry
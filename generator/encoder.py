@@ -0,0 +1,105 @@
+import os
+import threading
+import subprocess
+
+# 每个档位按优先级排列的候选编码器及参数
+PROFILES = {
+    "draft": {
+        "h264_videotoolbox": ["-b:v", "2500k", "-realtime", "1"],
+        "h264_vaapi": ["-qp", "28"],
+        "libx264": ["-preset", "ultrafast", "-crf", "28"],
+        "libopenh264": ["-b:v", "2500k"],
+    },
+    "balanced": {
+        "libx264": ["-preset", "veryfast", "-crf", "23"],
+        "h264_videotoolbox": ["-b:v", "4000k"],
+        "h264_vaapi": ["-qp", "24"],
+        "libopenh264": ["-b:v", "4000k"],
+    },
+    "archive": {
+        "libx265": ["-preset", "slow", "-crf", "22", "-tag:v", "hvc1"],
+        "libsvtav1": ["-preset", "6", "-crf", "30"],
+        "libx264": ["-preset", "slow", "-crf", "18"],
+        "h264_videotoolbox": ["-b:v", "8000k"],
+    },
+}
+
+# 硬件编码器仅出现在 -encoders 列表里不代表可用，需要实际编码一帧确认
+HARDWARE_ENCODERS = {"h264_videotoolbox", "h264_vaapi"}
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+_available = None
+_probe_lock = threading.Lock()
+
+
+def probe_encoders():
+    """探测当前 ffmpeg 可用的视频编码器（每个进程只探测一次）"""
+    global _available
+    with _probe_lock:
+        if _available is not None:
+            return _available
+        candidates = {name for profile in PROFILES.values() for name in profile}
+        try:
+            listing = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True).stdout
+        except OSError:
+            listing = ""
+        listed = {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1 and line.split()[1] in candidates}
+        _available = [name for name in sorted(listed) if name not in HARDWARE_ENCODERS or _test_encode(name)]
+        print(f"      [Encoder] 可用编码器: {', '.join(_available) or '无'}")
+        return _available
+
+
+def _test_encode(name):
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    vf = []
+    if name == "h264_vaapi":
+        if not os.path.exists(VAAPI_DEVICE): return False
+        cmd += ["-vaapi_device", VAAPI_DEVICE]
+        vf = ["-vf", "format=nv12,hwupload"]
+    cmd += ["-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1", *vf, "-frames:v", "1", "-c:v", name, "-f", "null", "-"]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=20).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+class Encoder:
+    """
+    选定的编码器 + 档位：
+      input_args()   - 放在所有 -i 之前的参数（如 VAAPI 设备）
+      filter_suffix()- 追加到视频滤镜链末尾的格式转换
+      codec_args()   - 编码参数（含线程数）
+    """
+
+    def __init__(self, profile="balanced", threads=0, preference=None):
+        self.profile = profile if profile in PROFILES else "balanced"
+        self.threads = threads
+        available = probe_encoders()
+        order = list(preference or []) + list(PROFILES[self.profile])
+        self.name = next((n for n in order if n in available and n in PROFILES[self.profile]), None)
+        if self.name is None:
+            # 探测失败时退回 libx264（绝大多数 ffmpeg 构建自带）
+            self.name = "libx264"
+
+    def input_args(self):
+        if self.name == "h264_vaapi":
+            return ["-vaapi_device", VAAPI_DEVICE]
+        return []
+
+    def filter_suffix(self):
+        if self.name == "h264_vaapi":
+            return ",format=nv12,hwupload"
+        return ""
+
+    def codec_args(self):
+        args = ["-c:v", self.name, *PROFILES[self.profile][self.name]]
+        if self.name != "h264_vaapi":
+            args += ["-pix_fmt", "yuv420p"]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+
+def threads_per_render(parallel_renders):
+    """多个场景并行渲染时平分 CPU 核心，避免编码线程互相抢占"""
+    return max(1, (os.cpu_count() or 2) // max(1, parallel_renders))
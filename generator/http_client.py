@@ -0,0 +1,115 @@
+import os
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from generator import tracing
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PooledHttpClient:
+    """
+    图像服务商共用的 HTTP 客户端：
+    - 单个 requests.Session + 连接池，同一主机（API / CDN）复用 TLS 连接
+    - 每个 provider 独立的并发上限，避免一次性打满上游或耗尽 socket
+    - 429 / 5xx / 连接错误按指数退避 + 全抖动重试，优先遵循 Retry-After
+    - 下载按块流式写盘，不在内存中缓存整张图片
+    """
+
+    def __init__(self, pool_size=16, max_retries=4, backoff_base=1.0, backoff_max=30.0, concurrency=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = concurrency or {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._limits = {}
+        self._limits_lock = threading.Lock()
+
+    def _limit(self, provider):
+        with self._limits_lock:
+            if provider not in self._limits:
+                self._limits[provider] = threading.BoundedSemaphore(self.concurrency.get(provider, 4))
+            return self._limits[provider]
+
+    def post_json(self, provider, url, payload, headers=None, timeout=60):
+        """POST JSON 并返回解析后的响应体"""
+        response = self._request(provider, "POST", url, json=payload, headers=headers, timeout=timeout)
+        try:
+            if response.status_code != 200:
+                print(f"      ❌ API Error: {response.text}")
+            response.raise_for_status()
+            return response.json()
+        finally:
+            response.close()
+
+    def download(self, provider, url, path, timeout=30, chunk_size=256 * 1024):
+        """流式下载到 path（先写 .part 再原子替换）"""
+        part_path = f"{path}.part"
+        response = self._request(f"{provider}:download", "GET", url, stream=True, timeout=timeout)
+        try:
+            response.raise_for_status()
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk: f.write(chunk)
+            os.replace(part_path, path)
+        finally:
+            response.close()
+            if os.path.exists(part_path): os.remove(part_path)
+        return path
+
+    def _request(self, provider, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                limit = self._limit(provider)
+                t0 = time.perf_counter()
+                with limit:
+                    # 等待并发名额的时间记为排队而非请求耗时
+                    tracing.add_wait(time.perf_counter() - t0)
+                    response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                print(f"      ⏳ [{provider}] HTTP {response.status_code}，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries: raise
+                delay = self._backoff(attempt)
+                print(f"      ⏳ [{provider}] 连接异常 {type(e).__name__}，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt):
+        # Full Jitter：在 [0, base * 2^n] 内随机，避免大量请求同时重试
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        try:
+            return min(self.backoff_max, float(value)) if value else None
+        except ValueError:
+            return None
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """进程级单例（连接池不能跨 fork 复用）"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            from config import IMAGE_HTTP_POOL_SIZE, IMAGE_HTTP_MAX_RETRIES, IMAGE_PROVIDER_CONCURRENCY
+            _client = PooledHttpClient(pool_size=IMAGE_HTTP_POOL_SIZE, max_retries=IMAGE_HTTP_MAX_RETRIES,
+                                       concurrency=IMAGE_PROVIDER_CONCURRENCY)
+            _client_pid = os.getpid()
+        return _client
@@ -1,40 +1,115 @@
 
 import os
-import requests
 import time
 import subprocess
 import json
 
+from generator import tracing
+from generator.cache import FileCache
+from generator.http_client import get_http_client
+
 class ImageGenerator:
-    def __init__(self, api_key=None, model_id=None, base_url=None, mock_mode=False):
+    # 报错提示：image size must be at least 3686400 pixels (即 1440 * 2560)
+    VOLCENGINE_SIZES = {
+        "1080x1920": "1440x2560", 
+        "1920x1080": "2560x1440",
+        "1080x1080": "1920x1920"
+    }
+    # OpenAI 的尺寸映射
+    OPENAI_SIZES = {
+        "1080x1920": "1024x1792",
+        "1920x1080": "1792x1024",
+        "1080x1080": "1024x1024"
+    }
+
+    def __init__(self, api_key=None, model_id=None, base_url=None, mock_mode=False, cache=None):
+        """
+        cache: 可选 FileCache，按 (provider, model_id, prompt, 目标尺寸) 缓存生成结果，
+               同一 key 的并发请求只会调用一次上游
+        """
         self.api_key = api_key
         self.model_id = model_id
         self.base_url = base_url
         self.mock_mode = mock_mode
+        self.cache = cache
+
+    @property
+    def http(self):
+        return get_http_client()
 
     def generate_image(self, prompt, output_path, resolution="1080x1920", full_config=None):
         """
         根据不同的 Provider 调用不同的生成逻辑
         full_config: {provider, api_key, model_id, base_url, local_path}
+        返回 output_path；上游失败改用兜底图时返回 None（兜底图同样已写入 output_path）
         """
         config = full_config or {}
         provider = config.get('provider', 'volcengine')
         
-        # 如果开启了全局 Mock 模式，直接走 Mock
+        # 如果开启了全局 Mock 模式，直接走 Mock；模拟图与兜底图一样返回 None，不会被当作真实结果写入检查点和场景缓存
         if self.mock_mode:
-            return self._generate_mock(prompt, output_path, resolution)
+            self._generate_mock(prompt, output_path, resolution)
+            return None
 
+        if self.cache is None:
+            return self._generate_uncached(provider, prompt, output_path, resolution, config)
+
+        cache_key = self.cache_key(prompt, resolution, config)
+        if self.cache.fetch(cache_key, "image", output_path) is not None:
+            print(f"      [Image Cache] 命中: {prompt[:20]}...")
+            return output_path
+        # singleflight：同一张图的并发请求排队，第一个请求上游，其余等待后直接命中
+        with self.cache.lock(cache_key):
+            if self.cache.fetch(cache_key, "image", output_path, record=False) is not None:
+                print(f"      [Image Cache] 复用并发请求结果: {prompt[:20]}...")
+                return output_path
+            return self._generate_uncached(provider, prompt, output_path, resolution, config, cache_key)
+
+    def cache_key(self, prompt, resolution="1080x1920", full_config=None):
+        """图片的内容键：不含 api_key，换密钥不影响复用"""
+        config = full_config or {}
+        provider = config.get('provider', 'volcengine')
+        if provider == 'openai':
+            model_id = config.get('model_id') or "dall-e-3"
+        elif provider == 'local_zimage':
+            model_id = config.get('local_path', 'z-image')
+        else:
+            model_id = config.get('model_id') or self.model_id
+        return FileCache.make_key("image", provider, model_id, prompt, self._provider_size(provider, resolution))
+
+    def source_size(self, resolution="1080x1920", full_config=None):
+        """请求 resolution 时实际得到的图片尺寸（模拟模式按请求尺寸生成）"""
+        if self.mock_mode: return resolution
+        return self._provider_size((full_config or {}).get('provider', 'volcengine'), resolution)
+
+    def _provider_size(self, provider, resolution):
+        if provider == 'openai':
+            return self.OPENAI_SIZES.get(resolution, "1024x1024")
+        if provider == 'local_zimage':
+            return resolution
+        return self.VOLCENGINE_SIZES.get(resolution, "1920x1920")
+
+    def _generate_uncached(self, provider, prompt, output_path, resolution, config, cache_key=None):
         try:
             if provider == 'openai':
-                return self._generate_openai(prompt, output_path, resolution, config)
+                self._generate_openai(prompt, output_path, resolution, config)
             elif provider == 'local_zimage':
-                return self._generate_local(prompt, output_path, resolution, config)
+                self._generate_local(prompt, output_path, resolution, config)
             else:
                 # 默认走火山引擎 (volcengine)
-                return self._generate_volcengine(prompt, output_path, resolution, config)
+                self._generate_volcengine(prompt, output_path, resolution, config)
         except Exception as e:
             print(f"      ⚠️ [{provider}] 生成失败: {e}")
-            return self._generate_fallback(output_path, resolution)
+            # 兜底图不进缓存，下次仍会重试上游
+            self._generate_fallback(output_path, resolution)
+            return None
+
+        if cache_key is not None:
+            try:
+                self.cache.put(cache_key, {"image": output_path})
+            except OSError as e:
+                print(f"      ⚠️ 图片缓存写入失败: {e}")
+        return output_path
 
     def _generate_volcengine(self, prompt, output_path, resolution, config):
         api_key = config.get('api_key') or self.api_key
@@ -48,13 +123,7 @@ class ImageGenerator:
             "Authorization": f"Bearer {api_key}"
         }
 
-        # 报错提示：image size must be at least 3686400 pixels (即 1440 * 2560)
-        size_map = {
-            "1080x1920": "1440x2560", 
-            "1920x1080": "2560x1440",
-            "1080x1080": "1920x1920"
-        }
-        target_size = size_map.get(resolution, "1920x1920")
+        target_size = self.VOLCENGINE_SIZES.get(resolution, "1920x1920")
 
         payload = {
             "model": model_id,
@@ -65,14 +134,10 @@ class ImageGenerator:
             "sequential_image_generation": "disabled"
         }
         
-        response = requests.post(base_url, json=payload, headers=headers, timeout=60)
-        if response.status_code != 200:
-            print(f"      ❌ API Error: {response.text}")
-        response.raise_for_status()
-        
-        res_data = response.json()
+        with tracing.span("image_request"):
+            res_data = self.http.post_json("volcengine", base_url, payload, headers=headers, timeout=60)
         image_url = res_data["data"][0]["url"]
-        self._download_image(image_url, output_path)
+        self._download_image(image_url, output_path, "volcengine")
         return output_path
 
     def _generate_openai(self, prompt, output_path, resolution, config):
@@ -83,23 +148,17 @@ class ImageGenerator:
         print(f"      [OpenAI] 正在请求 DALL-E: {prompt[:20]}...")
         
         headers = { "Authorization": f"Bearer {api_key}" }
-        # OpenAI 的尺寸映射
-        size_map = {
-            "1080x1920": "1024x1792",
-            "1920x1080": "1792x1024",
-            "1080x1080": "1024x1024"
-        }
         payload = {
             "model": model_id,
             "prompt": prompt,
             "n": 1,
-            "size": size_map.get(resolution, "1024x1024")
+            "size": self.OPENAI_SIZES.get(resolution, "1024x1024")
         }
         
-        response = requests.post(base_url, json=payload, headers=headers, timeout=60)
-        response.raise_for_status()
-        image_url = response.json()["data"][0]["url"]
-        self._download_image(image_url, output_path)
+        with tracing.span("image_request"):
+            res_data = self.http.post_json("openai", base_url, payload, headers=headers, timeout=60)
+        image_url = res_data["data"][0]["url"]
+        self._download_image(image_url, output_path, "openai")
         return output_path
 
     def _generate_local(self, prompt, output_path, resolution, config):
@@ -115,7 +174,9 @@ class ImageGenerator:
                 "--output", output_path,
                 "--size", resolution
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            with tracing.span("image_request"):
+                tracing.run(cmd, check=True, capture_output=True)
+                tracing.record_output(output_path)
             if os.path.exists(output_path):
                 return output_path
             raise Exception("本地命令运行成功但未找到输出文件")
@@ -123,11 +184,10 @@ class ImageGenerator:
             print(f"      ❌ 本地调用失败: {e}")
             raise
 
-    def _download_image(self, url, path):
-        r = requests.get(url, timeout=30)
-        r.raise_for_status()
-        with open(path, 'wb') as f:
-            f.write(r.content)
+    def _download_image(self, url, path, provider="default"):
+        with tracing.span("image_download"):
+            self.http.download(provider, url, path, timeout=30)
+            tracing.record_output(path)
 
     def _generate_mock(self, prompt, output_path, resolution):
         print(f"      [Mock] 模拟成像: {prompt[:20]}...")
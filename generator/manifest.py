@@ -0,0 +1,45 @@
+import re
+
+from generator.cache import FileCache
+
+
+def split_sentences(text):
+    """按句末标点把文案切成场景（单任务与批量规划共用，保证两边切分一致）"""
+    sentences = re.findall(r'[^。！？；\n\r]+[。！？；\n\r]*[”"’\']?', text)
+    sentences = [s.strip() for s in sentences if re.search(r'[\u4e00-\u9fa5a-zA-Z0-9]', s)]
+    return sentences or [text.strip()]
+
+
+class SceneManifest:
+    """
+    场景级构建清单，随任务一起保存：
+
+        {"1": {"sentence": "...", "audio": <配音键>, "image": {<源图尺寸>: <图片键>}, "scenes": {<分辨率>: <场景键>}}, ...}
+
+    audio / image 即 TTS、图片缓存的键；每个输出分辨率的场景键由配音键、该分辨率所用源图的图片键加上全部渲染参数派生。
+    重新生成时，场景键不变的场景可直接从场景缓存取回成片，其余场景才走流水线。
+    """
+
+    # 场景渲染逻辑（字幕、运镜、编码）改动时递增，使旧的场景缓存失效
+    VERSION = 1
+
+    def __init__(self, entries=None):
+        self.entries = {str(k): dict(v) for k, v in (entries or {}).items()}
+
+    @classmethod
+    def scene_key(cls, audio_key, image_key, **render_params):
+        return FileCache.make_key("scene", cls.VERSION, audio_key, image_key, render_params)
+
+    def record(self, index, sentence, audio_key, image_keys, scene_keys):
+        self.entries[str(index)] = {"sentence": sentence, "audio": audio_key, "image": dict(image_keys), "scenes": dict(scene_keys)}
+
+    def scene_keys(self):
+        return {key for entry in self.entries.values() for key in entry["scenes"].values()}
+
+    def diff(self, base):
+        """返回与 base 相比任一输出的场景键发生变化（或新增）的场景序号"""
+        unchanged = base.scene_keys() if base else set()
+        return sorted(int(i) for i, entry in self.entries.items() if not set(entry["scenes"].values()) <= unchanged)
+
+    def to_dict(self):
+        return self.entries
@@ -0,0 +1,160 @@
+import os
+import time
+import queue
+import threading
+
+from generator import tracing
+
+_STOP = object()
+
+
+class Stage:
+    """流水线中的一个阶段：有界输入队列 + 固定数量的工作线程"""
+
+    def __init__(self, name, func, workers=1, maxsize=0, batch=False):
+        self.name = name
+        self.func = func
+        self.workers = 1 if batch else max(1, workers)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.threads = []
+        # 批量阶段：攒齐所有场景后调用一次 func(ctx_list)
+        self.batch = batch
+        self.buffer = []
+
+
+class ScenePipeline:
+    """
+    分阶段的场景流水线：
+
+        tts ──> align ──┐
+                        ├──> render
+        image ──────────┘
+
+    - 配音、生图是网络等待型，可以高并发
+    - Whisper 对齐单独一个阶段（默认 1 个线程），避免推理互相抢占
+    - 渲染是 CPU 密集型，按核心数决定并发
+    场景在上一阶段完成后立即进入下一阶段，总耗时接近最慢阶段而不是各阶段之和。
+    阶段函数接收并修改场景上下文 dict；任一阶段抛错时该场景跳过后续阶段并回调 on_error。
+    batch_align=True 时对齐阶段攒齐全部场景后一次性调用 align(ctx_list)。
+    每次阶段调用都记为一个计时段（generator.tracing），包含场景在该阶段队列中的等待时间。
+    """
+
+    def __init__(self, tts, align, image, render, tts_workers=8, align_workers=1, image_workers=4,
+                 render_workers=None, queue_size=4, on_error=None, on_done=None, batch_align=False):
+        render_workers = render_workers or default_render_workers()
+        self.stages = {
+            "tts": Stage("tts", tts, tts_workers, queue_size),
+            "align": Stage("align", align, align_workers, queue_size, batch=batch_align),
+            "image": Stage("image", image, image_workers, queue_size),
+            "render": Stage("render", render, render_workers, queue_size),
+        }
+        # 每个阶段完成后流向哪里；None 表示汇合到 render 前的 join
+        self.routes = {"tts": "align", "align": None, "image": None, "render": "done"}
+        self.on_error = on_error
+        self.on_done = on_done
+
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._pending = 0
+        self._total = 0
+        self._joins = {}
+
+    def run(self, scenes):
+        """处理全部场景并阻塞到结束，返回场景上下文列表"""
+        scenes = list(scenes)
+        if not scenes: return scenes
+        self._pending = self._total = len(scenes)
+
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                t = threading.Thread(target=self._work, args=(stage,), name=f"pipeline-{stage.name}-{i}", daemon=True)
+                t.start()
+                stage.threads.append(t)
+
+        # 投喂线程独立运行，入口队列满时在这里阻塞，不影响下游消费
+        def _feed():
+            for ctx in scenes:
+                ctx.setdefault("error", None)
+                self._joins[id(ctx)] = 2
+                self._put("tts", ctx)
+                self._put("image", ctx)
+        threading.Thread(target=_feed, name="pipeline-feed", daemon=True).start()
+
+        with self._finished:
+            while self._pending > 0:
+                self._finished.wait()
+
+        for stage in self.stages.values():
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+        for stage in self.stages.values():
+            for t in stage.threads:
+                t.join()
+        return scenes
+
+    def _work(self, stage):
+        while True:
+            ctx = stage.queue.get()
+            if ctx is _STOP: return
+            if stage.batch:
+                self._work_batch(stage, ctx)
+                continue
+            wait = time.perf_counter() - ctx["queued_at"].pop(stage.name)
+            if ctx["error"] is None:
+                try:
+                    with tracing.span(stage.name, scene=ctx.get("scene_id"), wait=wait):
+                        stage.func(ctx)
+                except Exception as e:
+                    ctx["error"] = e
+                    if self.on_error: self.on_error(ctx, stage.name, e)
+            self._advance(stage.name, ctx)
+
+    def _work_batch(self, stage, ctx):
+        stage.buffer.append(ctx)
+        if len(stage.buffer) < self._total: return
+        batch, stage.buffer = stage.buffer, []
+        # 批量阶段的等待从第一个场景到达算起
+        wait = time.perf_counter() - min(c["queued_at"].pop(stage.name) for c in batch)
+        ok = [c for c in batch if c["error"] is None]
+        if ok:
+            try:
+                with tracing.span(stage.name, wait=wait):
+                    stage.func(ok)
+            except Exception as e:
+                for c in ok:
+                    c["error"] = e
+                    if self.on_error: self.on_error(c, stage.name, e)
+        for c in batch:
+            self._advance(stage.name, c)
+
+    def _advance(self, stage_name, ctx):
+        route = self.routes[stage_name]
+        if route == "done":
+            self._complete(ctx)
+        elif route is None:
+            with self._lock:
+                self._joins[id(ctx)] -= 1
+                ready = self._joins[id(ctx)] == 0
+            if not ready: return
+            if ctx["error"] is not None:
+                self._complete(ctx)
+            else:
+                self._put("render", ctx)
+        else:
+            self._put(route, ctx)
+
+    def _put(self, stage_name, ctx):
+        ctx.setdefault("queued_at", {})[stage_name] = time.perf_counter()
+        self.stages[stage_name].queue.put(ctx)
+
+    def _complete(self, ctx):
+        if self.on_done and ctx["error"] is None:
+            self.on_done(ctx)
+        with self._finished:
+            self._pending -= 1
+            self._finished.notify_all()
+
+
+def default_render_workers():
+    """ffmpeg 编码本身是多线程的，渲染并发取核心数的一半"""
+    return max(1, (os.cpu_count() or 2) // 2)
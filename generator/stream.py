@@ -0,0 +1,126 @@
+import os
+import math
+import threading
+import subprocess
+
+from generator import tracing
+from generator.synthesis import probe_duration
+
+
+class HlsStream:
+    """
+    边渲染边播放的 HLS 输出（EVENT 类型播放列表，只追加不删除）。
+
+    每个渲染完成的场景视频直接封装（-c copy，不重新编码）成一个 MPEG-TS 分片。
+    场景在流水线中乱序完成，这里按场景序号依次发布：序号之前的场景全部完成（或失败跳过）后才写入播放列表，
+    分片时间戳按已发布时长连续排列，播放器无需处理断点。最终 MP4 也由这些分片直接拼接得到。
+
+    EXT-X-TARGETDURATION 在 EVENT 列表中不能改变（播放器只读第一次的值），因此播放列表要等
+    set_max_duration() 给出全部场景时长的上界后才写出；在此之前完成的场景照常封装，只是暂不列出。
+    """
+
+    PLAYLIST = "index.m3u8"
+
+    def __init__(self, out_dir, target_duration=30):
+        self.out_dir = out_dir
+        self.target_duration = target_duration     # 目标时长的下限
+        self._target = None                        # 确定后不再改变
+        self._lock = threading.Lock()
+        self._ready = {}        # 序号 -> (场景视频, 时长)，None 表示失败跳过
+        self._next = 0
+        self._offset = 0.0
+        self._segments = []     # [(分片文件名, 时长)]
+        self._ended = False
+        os.makedirs(out_dir, exist_ok=True)
+
+    @property
+    def playlist_path(self):
+        return os.path.join(self.out_dir, self.PLAYLIST)
+
+    @property
+    def live(self):
+        """播放列表已写出且至少有一个分片，可以开始播放"""
+        with self._lock:
+            return self._target is not None and bool(self._segments)
+
+    def set_max_duration(self, seconds):
+        """
+        给出全部场景时长的上界（配音时长），确定目标时长并写出播放列表，只生效一次。
+        场景文件按整帧 / 音频帧取整后略长于配音时长，留出半秒余量
+        """
+        with self._lock:
+            if self._target is not None: return
+            self._target = max(self.target_duration, math.ceil(seconds + 0.5))
+            self._write_playlist()
+
+    def add(self, index, scene_path, duration):
+        """场景渲染完成，返回本次新发布的分片数"""
+        return self._mark(index, (scene_path, duration))
+
+    def skip(self, index):
+        """场景失败，不再等待它"""
+        return self._mark(index, None)
+
+    def _mark(self, index, entry):
+        with self._lock:
+            if self._ended: return 0
+            self._ready[index] = entry
+            published = 0
+            while self._next in self._ready:
+                entry = self._ready.pop(self._next)
+                self._next += 1
+                if entry is None: continue
+                scene_path, duration = entry
+                # 场景文件的实际时长（按帧 / 音频帧取整后）才是下一个分片的起点，配音时长只作兜底
+                duration = probe_duration(scene_path) or duration
+                name = f"seg_{self._next - 1:05d}.ts"
+                self._remux(scene_path, os.path.join(self.out_dir, name))
+                self._segments.append((name, duration))
+                self._offset += duration
+                published += 1
+            if published:
+                self._write_playlist()
+            return published
+
+    def _remux(self, scene_path, segment_path):
+        cmd = [
+            "ffmpeg", "-y", "-i", scene_path,
+            # mpegts 封装器会自动插入 h264/hevc 的 mp4toannexb 转换
+            "-map", "0:v", "-map", "0:a", "-c", "copy",
+            "-output_ts_offset", f"{self._offset:.3f}",
+            "-f", "mpegts", segment_path + ".part",
+            "-loglevel", "error"
+        ]
+        tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        os.replace(segment_path + ".part", segment_path)
+        tracing.record_output(segment_path)
+
+    def finish(self):
+        """写入 EXT-X-ENDLIST，播放器据此停止轮询"""
+        with self._lock:
+            self._ended = True
+            if self._target is None:
+                self._target = max([self.target_duration] + [math.ceil(d) for _, d in self._segments])
+            self._write_playlist()
+
+    def segments(self):
+        with self._lock:
+            return [os.path.join(self.out_dir, name) for name, _ in self._segments]
+
+    def _write_playlist(self):
+        if self._target is None: return
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self._target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for name, duration in self._segments:
+            lines += [f"#EXTINF:{duration:.3f},", name]
+        if self._ended:
+            lines.append("#EXT-X-ENDLIST")
+        tmp = self.playlist_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.playlist_path)
@@ -1,49 +1,188 @@
 
 import os
+import math
+import time
+import threading
 import subprocess
 
+from generator import tracing
+from generator.encoder import Encoder
+
+
+def probe_duration(path):
+    """媒体文件的实际时长（秒，容器内最长的流）；探测失败返回 0"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return 0
+
 class VideoSynthesizer:
-    def __init__(self, resolution="1080:1920", fps=30):
+    MOTION_ENGINES = ("zoompan", "scale_crop")
+
+    def __init__(self, resolution="1080:1920", fps=30, motion_engine="zoompan", encoder=None):
+        """
+        motion_engine: Ken Burns 实现方式
+          zoompan    - 原始实现，每帧重新解码并缩放整张原图
+          scale_crop - 原图只解码、预缩放一次，之后逐帧在目标尺寸附近缩放 + 裁剪
+        encoder: generator.encoder.Encoder，决定编码器、速度/质量档位和线程数；默认 balanced
+        """
         self.resolution = resolution
         self.fps = fps
+        self.motion_engine = motion_engine if motion_engine in self.MOTION_ENGINES else "zoompan"
+        self._encoder = encoder
+        self._stats_lock = threading.Lock()
+        self._encoded = [0, 0.0]  # [帧数, 耗时]
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = Encoder()
+        return self._encoder
+
+    def encode_stats(self):
+        """本实例累计的编码速度"""
+        with self._stats_lock:
+            frames, seconds = self._encoded
+        return {
+            "encoder": self.encoder.name, "profile": self.encoder.profile, "threads": self.encoder.threads,
+            "frames": frames, "fps": round(frames / seconds, 1) if seconds else 0.0,
+        }
+
+    def _run_encode(self, cmd, frames, output_path):
+        t0 = time.perf_counter()
+        tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        tracing.record_output(output_path)
+        self.record_encode(frames, time.perf_counter() - t0)
+
+    def record_encode(self, frames, seconds):
+        """计入一次编码（含远程渲染节点回报的场景）"""
+        with self._stats_lock:
+            self._encoded[0] += frames
+            self._encoded[1] += seconds
+
+    def _motion_input(self, image_path):
+        """背景图输入参数：zoompan 需要 -loop 1 逐帧读图，scale_crop 只读一帧再用 loop 滤镜复用"""
+        if self.motion_engine == "scale_crop":
+            return ["-i", image_path]
+        return ["-loop", "1", "-i", image_path]
+
+    def _motion_filter(self, total_frames):
+        """
+        Ken Burns 缩放滤镜链：以左上角为锚点，每帧放大 0.05%，最大 1.2 倍
+        两种引擎输出的画面一致，只是计算方式不同
+        """
+        w, h = self.resolution.split(":")
+        if self.motion_engine == "scale_crop":
+            return (
+                # 1. 只做一次：缩放裁剪到恰好覆盖目标画面
+                f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},setsar=1,"
+                # 2. 复用已解码的帧，不再逐帧解码 JPEG
+                # fps 固定输出帧率：图片输入默认 25 fps，不指定的话编码时会按 25 fps 丢帧
+                f"loop=loop={total_frames}:size=1:start=0,settb=AVTB,setpts=N/{self.fps}/TB,fps={self.fps},"
+                # 3. 逐帧只在目标尺寸附近放大后裁剪
+                f"scale=w='trunc({w}*min(1+0.0005*(n+1),1.2)/2)*2':h=-2:eval=frame,"
+                f"crop={w}:{h}:0:0,setsar=1"
+            )
+        # Ken Burns effect: Zoom In + 强制重置时间基准防止漂移
+        # 源图比例与目标不同时（多画幅共用一张源图）先居中裁到目标比例，比例相同时裁剪不生效
+        return f"crop='min(iw,ih*{w}/{h})':'min(ih,iw*{h}/{w})',scale=1080:-1,zoompan=z='min(zoom+0.0005,1.2)':d={total_frames}:s={w}x{h}:fps={self.fps},setpts=PTS-STARTPTS"
 
     def merge_scene(self, image_path, audio_path, ass_path, output_path, duration=3.0):
         """
         核心渲染引擎：将背景图片（Ken Burns）、音频和动态 ASS 字幕合成为一个场景。
+        ass_path 为 None 时只合成背景与配音（字幕在拼接后统一处理）
         """
-        w, h = self.resolution.split(":")
         total_frames = int(duration * self.fps)
-        
-        # Ken Burns effect: Zoom In + 强制重置时间基准防止漂移
-        kb_filter = f"scale=1080:-1,zoompan=z='min(zoom+0.0005,1.2)':d={total_frames}:s={w}x{h}:fps={self.fps},setpts=PTS-STARTPTS"
-        
-        # 分离路径处理
-        safe_ass_path = ass_path.replace("\\", "/").replace(":", "\\:")
+        kb_filter = self._motion_filter(total_frames)
+        if ass_path:
+            kb_filter += f",{self._subtitle_filter(ass_path)}"
         
         cmd = [
             "ffmpeg", "-y",
-            "-loop", "1", "-i", image_path,      # 背景图
+            *self.encoder.input_args(),
+            *self._motion_input(image_path),     # 背景图
             "-i", audio_path,                    # 配音
             "-filter_complex",
-            f"[0:v]{kb_filter},subtitles='{safe_ass_path}':force_style='Alignment=2'[outv]",
+            # 配音只含语音，解码时补静音到场景时长（-t 截断），不再单独重编码补静音
+            f"[0:v]{kb_filter}{self.encoder.filter_suffix()}[outv];[1:a]apad[outa]",
             "-map", "[outv]",
-            "-map", "1:a",
-            "-c:v", "h264_videotoolbox", "-b:v", "4000k", "-preset", "ultrafast", 
-            "-pix_fmt", "yuv420p",
+            "-map", "[outa]",
+            *self._video_codec_args(),
             "-c:a", "aac", "-b:a", "192k",
             "-t", f"{duration:.2f}",             # 精准时长
             output_path,
             "-loglevel", "error"
         ]
         
-        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        self._run_encode(cmd, total_frames, output_path)
+
+    def _subtitle_filter(self, ass_path):
+        # 分离路径处理
+        safe_ass_path = ass_path.replace("\\", "/").replace(":", "\\:")
+        return f"subtitles='{safe_ass_path}':force_style='Alignment=2'"
+
+    def _video_codec_args(self):
+        return self.encoder.codec_args()
+
+    def render_single_pass(self, scenes, output_path, bgm_path=None, bgm_volume=0.3, ass_path=None):
+        """
+        单次渲染整条视频：所有场景的背景运动、字幕、配音拼接和 BGM 混音放在同一个滤镜图里一次编码完成，
+        省去逐场景编码 -> concat -> 再混音的中间文件和多余读写，场景边界按采样精确裁剪，避免音画漂移。
+        scenes: [{"image_path", "audio_path", "ass_path", "duration"}, ...]
+        ass_path: 整条视频的全局字幕，给定时在拼接后只烧录一次，忽略各场景的 ass_path
+        """
+        inputs, chains, concat_pads = [], [], []
+        for i, scene in enumerate(scenes):
+            v_idx, a_idx = 2 * i, 2 * i + 1
+            duration = scene["duration"]
+            inputs += self._motion_input(scene["image_path"]) + ["-i", scene["audio_path"]]
+            scene_subs = f",{self._subtitle_filter(scene['ass_path'])}" if scene.get("ass_path") and not ass_path else ""
+            chains.append(
+                f"[{v_idx}:v]{self._motion_filter(int(duration * self.fps))},"
+                f"trim=duration={duration:.3f},setpts=PTS-STARTPTS,setsar=1{scene_subs}[v{i}]"
+            )
+            chains.append(
+                f"[{a_idx}:a]aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo,"
+                f"apad,atrim=duration={duration:.3f},asetpts=PTS-STARTPTS[a{i}]"
+            )
+            concat_pads.append(f"[v{i}][a{i}]")
+        chains.append(f"{''.join(concat_pads)}concat=n={len(scenes)}:v=1:a=1[catv][voice]")
+        chains.append(f"[catv]{self._subtitle_filter(ass_path) if ass_path else 'null'}{self.encoder.filter_suffix()}[outv]")
+
+        audio_out = "[voice]"
+        use_bgm = bgm_path and os.path.exists(bgm_path)
+        if bgm_path and not use_bgm:
+            print(f"      ⚠️ BGM 文件不存在: {bgm_path}, 跳过混音")
+        if use_bgm:
+            total = sum(scene["duration"] for scene in scenes)
+            inputs += ["-stream_loop", "-1", "-i", bgm_path]
+            chains.append(self._bgm_filter(f"{2 * len(scenes)}:a", "voice", max(0, total - 2), bgm_volume))
+            audio_out = "[outa]"
+
+        cmd = [
+            "ffmpeg", "-y", *self.encoder.input_args(), *inputs,
+            "-filter_complex", ";".join(chains),
+            "-map", "[outv]", "-map", audio_out,
+            *self._video_codec_args(),
+            "-c:a", "aac", "-b:a", "192k",
+            *(["-shortest"] if use_bgm else []),
+            output_path,
+            "-loglevel", "error"
+        ]
+        self._run_encode(cmd, sum(int(scene["duration"] * self.fps) for scene in scenes), output_path)
 
     def concatenate_scenes(self, scene_files, final_output):
-        # Create a concat list
-        list_file = "scenes.txt"
+        # 列表文件放在输出文件旁边并带上输出文件名，避免多个任务同时写同一个 scenes.txt
+        list_file = f"{final_output}.scenes.txt"
         with open(list_file, "w") as f:
             for scene in scene_files:
-                f.write(f"file '{scene}'\n")
+                safe_path = os.path.abspath(scene).replace("'", "'\\''")
+                f.write(f"file '{safe_path}'\n")
         
         cmd = [
             "ffmpeg", "-y",
@@ -53,8 +192,11 @@ class VideoSynthesizer:
             "-loglevel", "error"
         ]
         
-        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
-        os.remove(list_file)
+        try:
+            tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+            tracing.record_output(final_output)
+        finally:
+            os.remove(list_file)
 
     def add_background_music(self, video_path, bgm_path, output_path, bgm_volume=0.3):
         """
@@ -70,17 +212,9 @@ class VideoSynthesizer:
         # -stream_loop -1: 循环 BGM 直到视频结束
         # sidechaincompress: 人声大时 BGM 自动变小
         # afade: 结尾 2 秒淡出
-        filter_complex = (
-            f"[1:a]volume={bgm_volume}[music];"
-            f"[0:a]asplit[vocal][trigger];"
-            f"[music][trigger]sidechaincompress=threshold=0.1:ratio=20:attack=100:release=800,afade=t=out:st=ST_PLACEHOLDER:d=2[music_ducked];"
-            f"[vocal][music_ducked]amix=inputs=2:duration=first[outa]"
-        )
-        
         # 获取视频时长以便设置淡出起始点
         video_dur = self._get_video_duration(video_path)
-        fade_start = max(0, video_dur - 2)
-        filter_complex = filter_complex.replace("ST_PLACEHOLDER", f"{fade_start:.2f}")
+        filter_complex = self._bgm_filter("1:a", "0:a", max(0, video_dur - 2), bgm_volume)
 
         cmd = [
             "ffmpeg", "-y",
@@ -96,15 +230,60 @@ class VideoSynthesizer:
             "-loglevel", "error"
         ]
         
-        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        tracing.record_output(output_path)
 
-    def _get_video_duration(self, video_path):
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", 
-             "-of", "default=noprint_wrappers=1:nokey=1", video_path],
-            capture_output=True, text=True
+    def burn_subtitles(self, video_path, ass_path, output_path, bgm_path=None, bgm_volume=0.3):
+        """
+        对拼接好的整条视频烧录全局字幕（一次 libass 初始化）。
+        视频本来就要重新编码，给定 bgm_path 时顺带完成混音，省去单独的混音步骤。
+        """
+        video_dur = self._get_video_duration(video_path)
+        use_bgm = bgm_path and os.path.exists(bgm_path)
+        if bgm_path and not use_bgm:
+            print(f"      ⚠️ BGM 文件不存在: {bgm_path}, 跳过混音")
+        chains = [f"[0:v]{self._subtitle_filter(ass_path)}{self.encoder.filter_suffix()}[outv]"]
+        if use_bgm:
+            chains.append(self._bgm_filter("1:a", "0:a", max(0, video_dur - 2), bgm_volume))
+
+        cmd = [
+            "ffmpeg", "-y", *self.encoder.input_args(),
+            "-i", video_path,
+            *(["-stream_loop", "-1", "-i", bgm_path] if use_bgm else []),
+            "-filter_complex", ";".join(chains),
+            "-map", "[outv]", "-map", "[outa]" if use_bgm else "0:a",
+            *self._video_codec_args(),
+            *(["-c:a", "aac", "-b:a", "192k", "-shortest"] if use_bgm else ["-c:a", "copy"]),
+            output_path,
+            "-loglevel", "error"
+        ]
+        self._run_encode(cmd, int(video_dur * self.fps), output_path)
+
+    def mux_soft_subtitles(self, video_path, subtitle_path, output_path):
+        """把字幕作为可开关的软字幕轨 (mov_text) 封装进 MP4，音视频流直接复制"""
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path, "-i", subtitle_path,
+            "-map", "0:v", "-map", "0:a", "-map", "1:s",
+            "-c:v", "copy", "-c:a", "copy", "-c:s", "mov_text",
+            "-metadata:s:s:0", "language=chi",
+            output_path,
+            "-loglevel", "error"
+        ]
+        tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        tracing.record_output(output_path)
+
+    def _bgm_filter(self, music_pad, voice_pad, fade_start, bgm_volume):
+        return (
+            f"[{music_pad}]volume={bgm_volume}[music];"
+            f"[{voice_pad}]asplit[vocal][trigger];"
+            f"[music][trigger]sidechaincompress=threshold=0.1:ratio=20:attack=100:release=800,afade=t=out:st={fade_start:.2f}:d=2[music_ducked];"
+            f"[vocal][music_ducked]amix=inputs=2:duration=first[outa]"
         )
-        try:
-            return float(result.stdout.strip())
-        except:
-            return 0
+
+    def _get_video_duration(self, video_path):
+        return probe_duration(video_path)
+
+    def frame_span(self, duration):
+        """单次渲染时场景在时间线上的实际长度：视频被 trim 截到整帧（向上取整），配音补静音与之对齐"""
+        return math.ceil(round(round(duration, 3) * self.fps, 6)) / self.fps
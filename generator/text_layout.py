@@ -0,0 +1,156 @@
+import re
+import threading
+import subprocess
+from functools import lru_cache
+
+# 分词与字符类别（模块加载时编译一次）
+TOKEN_RE = re.compile(r'[\u4e00-\u9fa5]|[a-zA-Z0-9\-\'\"]+|[，。！？；：\"“”]')
+HAN_RE = re.compile(r'[\u4e00-\u9fa5]')
+PUNC_RE = re.compile(r'[，。！？；：\"“”]')
+
+HAN, PUNC, WORD = "han", "punc", "word"
+
+
+def tokenize(text):
+    """切分为 [(token, kind)]：汉字逐字、英文数字按词、标点单独成词"""
+    tokens = []
+    for tok in TOKEN_RE.findall(text):
+        if HAN_RE.match(tok): kind = HAN
+        elif PUNC_RE.match(tok): kind = PUNC
+        else: kind = WORD
+        tokens.append((tok, kind))
+    return tokens
+
+
+def token_weight(tok, kind):
+    """按朗读时长估算的权重，用于在整句时长内分配每个词的高亮时间"""
+    if kind == HAN: return 1.0
+    if kind == PUNC: return 0.2
+    return max(0.5, len(tok) * 0.4)
+
+
+class GlyphMetrics:
+    """
+    某字体在某字号下的字宽表。
+    有 fontTools 且 fc-match 能找到字体文件时读取真实的 advance width（按 libass 的字号换算），
+    否则退回按字符类别的比例估算。逐词宽度在实例内缓存，实例按 (字体, 字号) 进程内复用。
+    """
+
+    def __init__(self, font_name, font_size):
+        self.font_name = font_name
+        self.font_size = font_size
+        self._widths = {}
+        self._lock = threading.Lock()
+        self._advances, self._scale = None, None
+        table = _load_font_table(font_name)
+        if table is not None:
+            cmap, advances, units = table
+            self._advances = (cmap, advances)
+            self._scale = font_size / units
+        # 估算宽度偏大，靠负字距收紧；真实字宽本身已是紧排
+        self.tracking = 0 if self.measured else -int(font_size * 0.12)
+        self.punc_gap = int(font_size * 0.05)
+
+    @property
+    def measured(self):
+        return self._advances is not None
+
+    def width(self, tok, kind):
+        w = self._widths.get(tok)
+        if w is None:
+            w = self._measure(tok) if self.measured else None
+            if w is None: w = self._estimate(tok, kind)
+            with self._lock:
+                self._widths[tok] = w
+        return w
+
+    def _measure(self, tok):
+        cmap, advances = self._advances
+        total = 0
+        for ch in tok:
+            glyph = cmap.get(ord(ch))
+            if glyph is None: return None  # 字体缺字时 libass 会回退到其他字体，宽度不可知
+            total += advances[glyph]
+        return int(round(total * self._scale))
+
+    def _estimate(self, tok, kind):
+        if kind == HAN: return int(self.font_size * 0.9)
+        if kind == PUNC: return int(self.font_size * 0.4)
+        return len(tok) * (self.font_size * 0.5)
+
+
+@lru_cache(maxsize=64)
+def get_glyph_metrics(font_name, font_size):
+    return GlyphMetrics(font_name, font_size)
+
+
+@lru_cache(maxsize=16)
+def _load_font_table(font_name):
+    """返回 (cmap, advances, units_per_font_size)；缺少 fontTools 或找不到字体时返回 None"""
+    try:
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        return None
+    located = _find_font_file(font_name)
+    if located is None: return None
+    path, index = located
+    try:
+        font = TTFont(path, fontNumber=index, lazy=True)
+        cmap = font.getBestCmap()
+        metrics = font["hmtx"].metrics
+        advances = {name: metrics[name][0] for name in set(cmap.values())}
+        # libass 以 (winAscent + winDescent) 作为字号对应的高度，缺失时用 hhea 的 ascent - descent
+        os2 = font["OS/2"] if "OS/2" in font else None
+        units = (os2.usWinAscent + os2.usWinDescent) if os2 is not None else 0
+        if not units:
+            units = font["hhea"].ascent - font["hhea"].descent
+        font.close()
+    except Exception as e:
+        print(f"      ⚠️ [Layout] 读取字体 {path} 失败: {e}，使用估算字宽")
+        return None
+    return cmap, advances, units or 1000
+
+
+def _find_font_file(font_name):
+    try:
+        out = subprocess.run(["fc-match", "-f", "%{file}\n%{index}", font_name],
+                             capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = out.splitlines()
+    if not lines or not lines[0]: return None
+    index = int(lines[1]) if len(lines) > 1 and lines[1].isdigit() else 0
+    return lines[0], index
+
+
+def layout_lines(aligned, metrics, w_res, y_center, line_max_w, line_height):
+    """
+    贪心分行并计算每个词的中心坐标。
+    aligned: [{"text", "kind", "start", "end"}]，返回同样的 dict 补上 w / x / y
+    """
+    tracking, punc_gap = metrics.tracking, metrics.punc_gap
+    lines, curr_line, curr_w = [], [], 0
+    for item in aligned:
+        w = metrics.width(item["text"], item["kind"])
+        if curr_w + w > line_max_w and curr_line:
+            lines.append(curr_line)
+            curr_line, curr_w = [], 0
+        curr_line.append({**item, "w": w})
+        curr_w += w + tracking
+    if curr_line:
+        lines.append(curr_line)
+
+    placed = []
+    n_lines = len(lines)
+    for row_idx, line in enumerate(lines):
+        # 与标点相邻处留小间隙，其余按字距
+        gaps = [punc_gap if PUNC in (line[i]["kind"], line[i + 1]["kind"]) else tracking for i in range(len(line) - 1)]
+        gaps.append(0)
+        line_w = sum(t["w"] for t in line) + sum(gaps)
+        x_curr = (w_res - line_w) / 2
+        y_row = y_center + (row_idx - (n_lines - 1) / 2) * line_height
+        for t, gap in zip(line, gaps):
+            t["x"], t["y"] = x_curr + t["w"] / 2, y_row
+            placed.append(t)
+            x_curr += t["w"] + gap
+    return placed
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+
+_local = threading.local()
+_current = None
+
+
+class Trace:
+    """
+    一个任务的分阶段计时记录（运行在工作进程内，每个进程同一时间只跑一个任务）。
+
+    每个计时段记录：
+      stage / scene  阶段名与场景序号（嵌套的计时段继承外层的场景序号）
+      start          相对任务开始的秒数
+      wait           排队时间：流水线阶段队列、上游并发限制等
+      run            实际执行时间（墙钟时间减去段内的排队时间）
+      cpu            段内启动的子进程 (ffmpeg 等) 消耗的 user + sys CPU 秒数
+      bytes          段内写出的文件字节数
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def summary(self):
+        """按阶段汇总 {stage: {count, wait, run, cpu, bytes}}"""
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            agg = stages.setdefault(span["stage"], {"count": 0, "wait": 0.0, "run": 0.0, "cpu": 0.0, "bytes": 0})
+            agg["count"] += 1
+            for field in ("wait", "run", "cpu", "bytes"):
+                agg[field] += span[field]
+        for agg in stages.values():
+            for field in ("wait", "run", "cpu"):
+                agg[field] = round(agg[field], 3)
+        return stages
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {"spans": spans, "stages": self.summary()}
+
+
+def start_trace():
+    global _current
+    _current = Trace()
+    return _current
+
+
+def end_trace():
+    global _current
+    trace, _current = _current, None
+    return trace
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def span(stage, scene=None, wait=0.0):
+    """计时一个阶段；没有进行中的任务时不记录"""
+    trace = _current
+    if trace is None:
+        yield None
+        return
+    stack = _stack()
+    if scene is None and stack:
+        scene = stack[-1]["scene"]
+    record = {"stage": stage, "scene": scene, "start": round(time.perf_counter() - trace.started, 3),
+              "wait": wait, "run": 0.0, "cpu": 0.0, "bytes": 0}
+    t0 = time.perf_counter()
+    outer_wait = record["wait"]
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        stack.pop()
+        record["run"] = round(max(0.0, time.perf_counter() - t0 - (record["wait"] - outer_wait)), 3)
+        record["wait"] = round(record["wait"], 3)
+        record["cpu"] = round(record["cpu"], 3)
+        with trace._lock:
+            trace.spans.append(record)
+
+
+def _add(field, value):
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1][field] += value
+
+
+def add_wait(seconds):
+    """记到当前线程正在进行的计时段上（如等待上游并发名额）"""
+    _add("wait", seconds)
+
+
+def record_output(path):
+    """把写出的文件大小记到当前计时段上"""
+    try:
+        _add("bytes", os.path.getsize(path))
+    except OSError:
+        pass
+
+
+class _MeasuredPopen(subprocess.Popen):
+    """
+    wait() 先自己用 wait4 回收子进程，顺带拿到该子进程自己的资源占用（多线程并发时互不干扰）。
+    只覆盖公开的 wait()：communicate() 与 with 退出时都经由它回收，回收后 returncode 已设置，父类不会再 waitpid
+    """
+    rusage = None
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            delay = 0.0005
+            while True:
+                try:
+                    pid, status, rusage = os.wait4(self.pid, 0 if deadline is None else os.WNOHANG)
+                except ChildProcessError:
+                    break  # 已被别处回收，交给父类处理
+                if pid:
+                    self.rusage, self.returncode = rusage, os.waitstatus_to_exitcode(status)
+                    break
+                # 带超时时与父类相同，逐步拉长间隔轮询
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(self.args, timeout)
+                delay = min(delay * 2, remaining, 0.05)
+                time.sleep(delay)
+        return super().wait(timeout)
+
+
+def run(cmd, check=False, capture_output=False, timeout=None, **kwargs):
+    """subprocess.run 的替身：额外把子进程的 CPU 时间记到当前计时段上"""
+    if not hasattr(os, "wait4"):
+        return subprocess.run(cmd, check=check, capture_output=capture_output, timeout=timeout, **kwargs)
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    with _MeasuredPopen(cmd, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        except BaseException:
+            process.kill()
+            raise
+    if process.rusage is not None:
+        _add("cpu", process.rusage.ru_utime + process.rusage.ru_stime)
+    result = subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
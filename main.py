@@ -53,7 +53,7 @@ def main():
     
     # 初始化引擎
     script_engine = ScriptEngine()
-    audio_gen = AudioGenerator(EDGE_TTS_VOICE, MOCK_AUDIO)
+    audio_gen = AudioGenerator(EDGE_TTS_VOICE, MOCK_AUDIO, mock_engine=MOCK_AUDIO_ENGINE)
     image_gen = ImageGenerator(ARK_API_KEY, mock_mode=MOCK_IMAGE)
     anim_gen = AnimationGenerator(VIDEO_RES, FPS)
     synth = VideoSynthesizer(VIDEO_RES.replace("x", ":"), FPS)
@@ -1,30 +1,214 @@
 import os
+import re
 import json
 import uuid
 import multiprocessing
 import time
-from flask import Flask, request, jsonify, send_file, Response
+from flask import Flask, request, jsonify, send_file, Response, redirect
 from flask_cors import CORS
 
 app = Flask(__name__, static_folder='web', static_url_path='')
 CORS(app)
 
+# 任务 ID 为 uuid 前缀（十六进制），用作目录名前先校验
+TASK_ID_RE = re.compile(r'[0-9a-f-]+')
+
 # 任务文件路径
 TASKS_FILE = os.path.join(os.getcwd(), "assets", "tasks.json")
 
+_task_store = None
+
+def get_task_store():
+    """按进程懒加载任务存储（SQLite 连接不能跨 fork 复用）"""
+    global _task_store
+    if _task_store is None:
+        from config import TASK_STORE_BACKEND, TASK_DB_PATH
+        from service.task_store import create_task_store
+        path = TASKS_FILE if TASK_STORE_BACKEND == "json" else TASK_DB_PATH
+        _task_store = create_task_store(TASK_STORE_BACKEND, path)
+    return _task_store
+
 def load_tasks_from_disk():
-    if not os.path.exists(TASKS_FILE): return {}
-    try:
-        with open(TASKS_FILE, 'r') as f:
-            return json.load(f)
-    except: return {}
+    return get_task_store().load_all()
+
+def load_task(task_id):
+    return get_task_store().get_task(task_id)
 
 def save_task_to_disk(task_id, task_data):
-    all_tasks = load_tasks_from_disk()
-    all_tasks[task_id] = task_data
-    os.makedirs(os.path.dirname(TASKS_FILE), exist_ok=True)
-    with open(TASKS_FILE, 'w') as f:
-        json.dump(all_tasks, f, indent=2)
+    get_task_store().put_task(task_id, task_data)
+
+_last_prune = 0
+
+def prune_task_history(interval=600):
+    """定期压缩历史任务，避免任务表无限增长"""
+    global _last_prune
+    if time.time() - _last_prune < interval: return
+    _last_prune = time.time()
+    from config import TASK_HISTORY_MAX_AGE, TASK_HISTORY_MAX_COUNT
+    try:
+        removed = get_task_store().prune(max_age=TASK_HISTORY_MAX_AGE, max_count=TASK_HISTORY_MAX_COUNT)
+        if removed: print(f"🧹 已清理 {removed} 条历史任务")
+        sweep_task_artifacts()
+    except Exception as e:
+        print(f"History prune error: {e}")
+
+def sweep_task_artifacts():
+    """
+    回收不再能续跑的任务留下的中间产物（配音、背景图、字幕、场景成片）：
+    中断 / 失败的任务会保留这些文件供 /api/resume 使用，任务记录过期被清理后才删除
+    """
+    import glob
+    assets_dir = os.path.join(os.getcwd(), "assets")
+    paths = [p for prefix in ("audio", "bg", "anim", "subs") for p in glob.glob(os.path.join(assets_dir, f"{prefix}_*"))]
+    paths += glob.glob(os.path.join(assets_dir, "scenes", "scene_*"))
+    keep = {}
+    removed = 0
+    for path in paths:
+        task_id = os.path.basename(path).split("_")[1]
+        if task_id not in keep:
+            task = load_task(task_id)
+            keep[task_id] = bool(task and (task.get("status") in ("pending", "running") or task.get("resumable")))
+        if keep[task_id] or not os.path.isfile(path): continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            print(f"Artifact sweep error {path}: {e}")
+    if removed: print(f"🧹 已回收 {removed} 个过期任务的中间产物")
+
+def recover_interrupted_tasks():
+    """
+    启动时的恢复扫描：上次服务退出时仍在排队 / 执行的任务已无人推进（调度队列与工作进程都不在了），
+    标记为中断；生成任务可通过 /api/resume 从检查点继续，RESUME_ON_STARTUP 开启时自动续跑
+    """
+    import config
+    interrupted = []
+    for task_id, task in load_tasks_from_disk().items():
+        if task.get("status") not in ("pending", "running"): continue
+        resumable = task.get("kind") is None and bool(task.get("text"))
+        get_task_store().update_task(task_id, status="error", error="服务重启，任务已中断", resumable=resumable)
+        if resumable: interrupted.append(task_id)
+    if interrupted:
+        print(f"⏯️ 发现 {len(interrupted)} 个中断的任务")
+    if config.RESUME_ON_STARTUP:
+        for task_id in interrupted:
+            try:
+                _resume(task_id, client_key="recovery")
+            except Exception as e:
+                print(f"  - 任务 {task_id} 自动续跑失败: {e}")
+
+_progress_broker = None
+_progress_channel = None
+
+def get_progress_broker():
+    """懒加载进度推送中心及其 IPC 通道（仅在 Web 进程内创建）"""
+    global _progress_broker, _progress_channel
+    if _progress_broker is None:
+        from service.progress import ProgressBroker
+        _progress_channel = multiprocessing.Queue()
+        _progress_broker = ProgressBroker(load_task)
+        _progress_broker.listen(_progress_channel)
+        from config import PROGRESS_SSE_PORT
+        if PROGRESS_SSE_PORT:
+            from service.progress_server import SseServer
+            SseServer(_progress_broker, port=PROGRESS_SSE_PORT, heartbeat=SSE_HEARTBEAT).start()
+    return _progress_broker
+
+_worker_pool = None
+
+def warm_generation_worker():
+    """工作进程启动时执行一次：导入重量级依赖并加载 Whisper 模型"""
+    from config import TTS_TIMING_MODE
+    from generator.audio import AudioGenerator
+    from generator.encoder import probe_encoders
+    import generator.image, generator.animation, generator.synthesis
+    probe_encoders()
+    # 词边界模式下 Whisper 只是兜底，首次需要时再加载
+    if TTS_TIMING_MODE == "whisper":
+        print(f"[Pool] 🔥 pid={os.getpid()} 正在预热 Whisper 模型...")
+        AudioGenerator()._load_whisper()
+
+def get_worker_pool():
+    global _worker_pool
+    if _worker_pool is None:
+        from config import WORKER_POOL_SIZE, WORKER_MAX_JOBS, WORKER_MAX_RSS_MB
+        from service.worker_pool import WorkerPool
+        get_progress_broker()
+        _worker_pool = WorkerPool(
+            run_job, size=WORKER_POOL_SIZE, max_jobs=WORKER_MAX_JOBS, max_rss_mb=WORKER_MAX_RSS_MB,
+            initializer=warm_generation_worker, worker_kwargs={"progress_channel": _progress_channel},
+            on_job_done=_on_job_done
+        ).start()
+    return _worker_pool
+
+# 各编码档位的累计编码速度 {profile: {encoder: [帧数, 秒数]}}
+_encode_totals = {}
+_job_metrics = None
+
+def get_job_metrics():
+    global _job_metrics
+    if _job_metrics is None:
+        from service.metrics import JobMetrics
+        _job_metrics = JobMetrics()
+    return _job_metrics
+
+def _on_job_done(task_id, lost):
+    task = load_task(task_id) or {}
+    if lost:
+        # 进程被杀（OOM 等）时已完成的场景阶段都有检查点，可以续跑
+        get_task_store().update_task(task_id, status="error", error="工作进程异常退出", resumable=task.get("kind") is None)
+        get_progress_broker().publish(task_id, {"status": "error", "error": "工作进程异常退出"})
+        get_job_metrics().observe_job({"status": "lost"})
+    else:
+        get_job_metrics().observe_job(task)
+        stats = task.get("encode")
+        if stats and stats.get("fps"):
+            totals = _encode_totals.setdefault(stats["profile"], {}).setdefault(stats["encoder"], [0, 0.0])
+            totals[0] += stats["frames"]
+            totals[1] += stats["frames"] / stats["fps"]
+    get_scheduler().job_finished(task_id)
+    # 预热结束（含失败）后放行整批任务；任意任务结束都可能腾出排队名额，继续放行积压的批量任务
+    if task.get("kind") == "prewarm":
+        get_batch_feeder().release(task["batch_id"])
+    get_batch_feeder().pump()
+
+_scheduler = None
+
+def get_scheduler():
+    """调度器只在有空闲工作进程时派发任务，其余任务在 Web 进程内排队"""
+    global _scheduler
+    if _scheduler is None:
+        import config
+        from service.scheduler import JobScheduler
+        _scheduler = JobScheduler(
+            dispatch=lambda task_id, payload: get_worker_pool().submit(task_id, **payload),
+            capacity=config.WORKER_POOL_SIZE, max_queue=config.SCHEDULER_MAX_QUEUE,
+            max_per_client=config.SCHEDULER_MAX_PER_CLIENT, cpu_budget=config.SCHEDULER_CPU_BUDGET,
+            min_free_mem_mb=config.SCHEDULER_MIN_FREE_MEM_MB, default_job_seconds=config.SCHEDULER_DEFAULT_JOB_SECONDS,
+            on_queue_update=_on_queue_update
+        )
+    return _scheduler
+
+_batch_feeder = None
+
+def get_batch_feeder():
+    global _batch_feeder
+    if _batch_feeder is None:
+        from service.batch import BatchFeeder
+
+        def submit(task_id, payload, client_key, priority):
+            get_worker_pool()
+            get_scheduler().submit(task_id, payload, client_key=client_key, priority=priority)
+        _batch_feeder = BatchFeeder(submit)
+    return _batch_feeder
+
+def _on_queue_update(task_id, position, eta):
+    get_task_store().update_task(task_id, status=None, queue_position=position, eta_seconds=eta)
+    get_progress_broker().publish(task_id, {"queue_position": position, "eta_seconds": eta})
+
+def get_client_key():
+    """公平调度的客户端标识：优先 API Key，其次来源 IP"""
+    return request.headers.get('X-API-Key') or request.headers.get('X-Forwarded-For', request.remote_addr or 'anonymous').split(',')[0].strip()
 
 # Edge TTS 可用音色
 VOICES = [
@@ -42,168 +226,626 @@ RESOLUTIONS = {
     "1:1": "1080x1080",
 }
 
-def run_generation_process(task_id, text, voice, resolution, bgm="none", subtitle_style="classic_yellow", font_name="PingFang SC", image_config=None):
-    """后台进程独立运行，内部使用线程池并行处理场景"""
-    from concurrent.futures import ThreadPoolExecutor
-    import threading
-    import re
+def run_job(task_id, kind="generate", **kwargs):
+    """工作进程的任务入口：按 kind 分发到视频生成或批量预热"""
+    if kind == "prewarm":
+        return run_prewarm_process(task_id, **kwargs)
+    return run_generation_process(task_id, **kwargs)
+
+def run_prewarm_process(task_id, voice, sentences, images, image_config=None, progress_channel=None, cancel_event=None):
+    """
+    批量任务的预热：整批去重后的配音与背景图各生成一次写入缓存，之后各文案的任务直接命中。
+    单个素材失败不影响整批，对应任务届时自己重试上游
+    """
+    import shutil
     import traceback
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import config
+    from service.progress import publish_delta
+    from service.worker_pool import JobCancelled
+
+    work_dir = os.path.join(os.getcwd(), "assets", f"prewarm_{task_id}")
+    total = len(sentences) + len(images)
+    counts = {"audio": 0, "images": 0, "failed": 0}
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+
+    def update_task_state(progress, status=None, **extra):
+        try:
+            cols = get_task_store().update_task(task_id, progress=progress, status=status, **extra)
+            publish_delta(progress_channel, task_id, progress=progress, status=status,
+                          last_update=(cols or {}).get("last_update"), **extra)
+        except Exception as e:
+            print(f"Update state error: {e}")
+
+    def warm_audio(i, sentence):
+        check_cancelled()
+        path = os.path.join(work_dir, f"audio_{i}.mp3")
+        timestamps, duration = audio_gen.synthesize(sentence, path)
+        # 需要 Whisper 对齐的留到最后串行处理，对齐结果同样回写配音缓存
+        return "audio", True, (sentence, path, duration) if timestamps is None else None
+
+    def warm_image(i, prompt, source_res):
+        check_cancelled()
+        ok = image_gen.generate_image(prompt, os.path.join(work_dir, f"bg_{i}.jpg"), source_res, full_config=image_config)
+        return "images", ok is not None, None
+
+    try:
+        print(f"[{task_id}] 🔥 批量预热: {len(sentences)} 句配音, {len(images)} 张背景图")
+        os.makedirs(work_dir, exist_ok=True)
+        audio_gen, image_gen = build_generators(voice, image_config)
+        update_task_state(0, status="running")
+        to_align = []
+        with ThreadPoolExecutor(config.PIPELINE_TTS_WORKERS) as tts_pool, ThreadPoolExecutor(config.PIPELINE_IMAGE_WORKERS) as image_pool:
+            futures = [tts_pool.submit(warm_audio, i, s) for i, s in enumerate(sentences)]
+            futures += [image_pool.submit(warm_image, i, prompt, source_res) for i, (prompt, source_res) in enumerate(images)]
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    kind, ok, align = future.result()
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    print(f"[{task_id}] ⚠️ 预热失败: {e}")
+                    kind, ok, align = None, False, None
+                counts[kind if ok else "failed"] += 1
+                if align: to_align.append(align)
+                update_task_state(int(done / max(1, total) * 90))
+        for sentence, path, duration in to_align:
+            check_cancelled()
+            audio_gen.align(sentence, path, duration=duration)
+        update_task_state(100, status="completed", warmed=counts)
+        print(f"[{task_id}] 🔥 预热完成: {counts}")
+    except JobCancelled:
+        update_task_state(None, status="error", error="任务已被用户中止", warmed=counts)
+    except Exception as e:
+        traceback.print_exc()
+        update_task_state(None, status="error", error=str(e), warmed=counts)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def build_generators(voice, image_config=None, caches=True):
+    """按任务参数创建配音与生图生成器（优先使用前端传来的图片配置）；caches=False 时只用于计算内容键"""
+    import config
     from generator.audio import AudioGenerator
     from generator.image import ImageGenerator
+    from generator.cache import FileCache
+
+    api_key, model_id = config.ARK_API_KEY, config.ARK_MODEL_ID
+    if image_config:
+        if image_config.get('api_key'): api_key = image_config['api_key']
+        if image_config.get('model_id'): model_id = image_config['model_id']
+
+    tts_cache = image_cache = None
+    if caches and config.TTS_CACHE_ENABLED:
+        tts_cache = FileCache(config.TTS_CACHE_DIR, max_bytes=config.TTS_CACHE_MAX_MB * 1024 * 1024, ttl=config.TTS_CACHE_TTL)
+    if caches and config.IMAGE_CACHE_ENABLED:
+        image_cache = FileCache(config.IMAGE_CACHE_DIR, max_bytes=config.IMAGE_CACHE_MAX_MB * 1024 * 1024, ttl=config.IMAGE_CACHE_TTL)
+    audio_gen = AudioGenerator(voice, mock_mode=config.MOCK_AUDIO, timing_mode=config.TTS_TIMING_MODE, cache=tts_cache,
+                               mock_engine=config.MOCK_AUDIO_ENGINE)
+    image_gen = ImageGenerator(api_key, model_id=model_id, mock_mode=config.MOCK_IMAGE, cache=image_cache)
+    return audio_gen, image_gen
+
+def source_resolutions(resolutions, image_gen, image_config=None):
+    """
+    每个输出分辨率所用背景源图的请求尺寸。
+    多画幅时优先共用一张正方形源图（如火山引擎 1920x1920），各画幅从中居中裁剪；
+    服务商给出的正方形图裁到某个画幅会低于目标分辨率时（如 OpenAI 最大 1024x1024），改为每个画幅各生成一张，避免放大
+    """
+    if len(set(resolutions)) > 1:
+        side = min(map(int, image_gen.source_size("1080x1080", image_config).split("x")))
+        if all(side >= max(map(int, res.split("x"))) for res in resolutions):
+            return {res: "1080x1080" for res in resolutions}
+    return {res: res for res in resolutions}
+
+def run_generation_process(task_id, text, voice, resolution, bgm="none", subtitle_style="classic_yellow", font_name="PingFang SC", image_config=None, motion_engine=None, render_mode=None, encoder_profile=None, subtitle_mode=None, resolutions=None, base_task_id=None, stream=None, resume=False, progress_channel=None, cancel_event=None):
+    """
+    在常驻工作进程中运行，内部使用分阶段流水线并行处理场景。
+    resume=True 时从各场景的检查点继续：已完成且产物校验通过的阶段直接沿用
+    """
+    import threading
+    import shutil
+    import traceback
     from generator.animation import AnimationGenerator
-    from generator.synthesis import VideoSynthesizer
+    from generator.synthesis import VideoSynthesizer, probe_duration
+    from generator.pipeline import ScenePipeline, default_render_workers
+    from generator.encoder import Encoder, threads_per_render
+    from generator.manifest import SceneManifest, split_sentences
+    from generator.checkpoint import make_entry, verify_entry
+    from generator.stream import HlsStream
+    from generator import tracing
+    from service.progress import publish_delta
+    from service.worker_pool import JobCancelled
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+
+    assets_dir = os.path.join(os.getcwd(), "assets")
+    output_dir = os.path.join(os.getcwd(), "output")
+    scenes_dir = os.path.join(assets_dir, "scenes")
+    bgm_dir = os.path.join(assets_dir, "bgm")
+    hls, hls_dir = None, None
+    stream_announced = False
+    remote = None
+    completed = False
+    started = time.time()
+    tracing.start_trace()
     
     try:
         print(f"[{task_id}] 🎬 引擎启动...")
         
-        disk_lock = threading.Lock()
-
-        def update_task_state(progress, status="running", scene_updates=None, video_path=None, error=None):
+        def update_task_state(progress, status=None, scene_updates=None, video_path=None, error=None, **extra):
             """
             scene_updates 格式: { scene_id: { "text": "...", "step": "...", "done": bool } }
+            只提交增量：任务存储按行合并落盘，同时推送给 Web 进程的订阅者。
+            status 只在开始 / 结束时显式传入，进度更新不改状态（避免覆盖 /api/abort 已写入的 error）
             """
-            with disk_lock:
-                try:
-                    tasks = load_tasks_from_disk()
-                    task = tasks.get(task_id, {})
-                    
-                    if status: task["status"] = status
-                    if progress is not None: task["progress"] = progress
-                    if video_path: task["video_path"] = video_path
-                    if error: task["error"] = error
-                    task["last_update"] = time.time()
-                    
-                    if "scenes_status" not in task: task["scenes_status"] = {}
-                    if scene_updates:
-                        for s_id, s_data in scene_updates.items():
-                            s_id_str = str(s_id)
-                            if s_id_str not in task["scenes_status"]:
-                                task["scenes_status"][s_id_str] = s_data
-                            else:
-                                # 增量更新属性
-                                task["scenes_status"][s_id_str].update(s_data)
-                    
-                    tasks[task_id] = task
-                    with open(TASKS_FILE, 'w') as f:
-                        json.dump(tasks, f, indent=2)
-                except Exception as e:
-                    print(f"Update state error: {e}")
+            try:
+                cols = get_task_store().update_task(task_id, progress=progress, status=status, scene_updates=scene_updates,
+                                                    video_path=video_path, error=error, **extra)
+                publish_delta(progress_channel, task_id, progress=progress, status=status, scene_updates=scene_updates,
+                              video_path=video_path, error=error, last_update=(cols or {}).get("last_update"), **extra)
+            except Exception as e:
+                print(f"Update state error: {e}")
 
-        update_task_state(2, scene_updates={"0": {"text": "系统信息", "step": "正在预热音视频引擎...", "done": False}})
-        res = RESOLUTIONS.get(resolution, "1080x1920")
+        update_task_state(2, status="running", scene_updates={"0": {"text": "系统信息", "step": "正在预热音视频引擎...", "done": False}})
+        # 一个任务可以输出多个画幅：配音、时间戳、背景图只生产一次，字幕排版与编码按画幅分别进行
+        aspects = list(dict.fromkeys(resolutions or [resolution]))
         
-        from config import ARK_API_KEY, ARK_MODEL_ID, MOCK_IMAGE
-        
-        # 优先使用前端传来的配置
-        curr_api_key = ARK_API_KEY
-        curr_model_id = ARK_MODEL_ID
-        if image_config:
-            if image_config.get('api_key'): curr_api_key = image_config['api_key']
-            if image_config.get('model_id'): curr_model_id = image_config['model_id']
-
-        audio_gen = AudioGenerator(voice, mock_mode=False)
-        audio_gen._load_whisper() 
-        image_gen = ImageGenerator(curr_api_key, model_id=curr_model_id, mock_mode=MOCK_IMAGE)
-        anim_gen = AnimationGenerator(res, 30)
-        synth = VideoSynthesizer(res.replace("x", ":"), 30)
+        import config
+        from generator.cache import FileCache
+
+        audio_gen, image_gen = build_generators(voice, image_config)
+        tts_cache = audio_gen.cache
+        single_pass = (render_mode or config.RENDER_MODE) == "single_pass"
+        subtitle_mode = subtitle_mode if subtitle_mode in ("scene", "global", "soft") else config.SUBTITLE_MODE
+        # 多个场景并行编码时平分核心；一次性渲染只有一个 ffmpeg 进程，交给编码器自行决定线程数
+        parallel_renders = config.PIPELINE_RENDER_WORKERS or default_render_workers()
+        encoder = Encoder(encoder_profile or config.ENCODER_PROFILE,
+                          threads=0 if single_pass else threads_per_render(parallel_renders),
+                          preference=config.ENCODER_PREFERENCE)
+        # 分布式渲染：场景编码发布到共享队列，由远程渲染节点领取（一次性渲染只有一个编码进程，不分发）
+        if config.RENDER_BACKEND == "distributed" and not single_pass:
+            from service.render_queue import RenderQueue
+            from service.render_worker import RenderWorker
+            queue = RenderQueue(config.RENDER_QUEUE_PATH, lease_seconds=config.RENDER_LEASE_SECONDS,
+                                max_attempts=config.RENDER_MAX_ATTEMPTS)
+            os.makedirs(os.path.join(config.RENDER_SHARED_DIR, task_id), exist_ok=True)
+            remote = {
+                "queue": queue, "shared_dir": config.RENDER_SHARED_DIR,
+                "local": RenderWorker(queue, config.RENDER_SHARED_DIR, worker_id=f"coordinator-{task_id}",
+                                      threads=encoder.threads, preference=config.ENCODER_PREFERENCE, role="coordinator"),
+                "local_slots": threading.Semaphore(parallel_renders),
+            }
+
+        targets = []
+        for aspect in aspects:
+            res = RESOLUTIONS.get(aspect, "1080x1920")
+            if any(t["res"] == res for t in targets): continue
+            targets.append({
+                "aspect": aspect, "res": res,
+                "anim": AnimationGenerator(res, 30, compiler=config.SUBTITLE_COMPILER),
+                "synth": VideoSynthesizer(res.replace("x", ":"), 30, motion_engine=motion_engine or config.MOTION_ENGINE, encoder=encoder),
+                # 第一个画幅沿用原来的文件名，其余带上分辨率
+                "final": os.path.join(output_dir, f"video_{task_id}.mp4" if not targets else f"video_{task_id}_{res}.mp4"),
+            })
+        sources = source_resolutions([t["res"] for t in targets], image_gen, image_config)
+        for t in targets: t["source"] = sources[t["res"]]
+        # 第一个源图沿用原来的文件名，其余带上尺寸
+        image_names = {src: "" if i == 0 else f"_{src}" for i, src in enumerate(dict.fromkeys(sources.values()))}
 
         update_task_state(5, scene_updates={"0": {"step": "🚀 引擎预热完毕，准备流水线过程..."}})
-        
-        assets_dir = os.path.join(os.getcwd(), "assets")
-        output_dir = os.path.join(os.getcwd(), "output")
-        scenes_dir = os.path.join(assets_dir, "scenes")
-        bgm_dir = os.path.join(assets_dir, "bgm")
         for d in [assets_dir, output_dir, scenes_dir, bgm_dir]: os.makedirs(d, exist_ok=True)
         
-        sentences = re.findall(r'[^。！？；\n\r]+[。！？；\n\r]*[”"’\']?', text)
-        sentences = [s.strip() for s in sentences if re.search(r'[\u4e00-\u9fa5a-zA-Z0-9]', s)]
-        if not sentences: sentences = [text.strip()]
+        sentences = split_sentences(text)
         
         total_scenes = len(sentences)
-        scene_files = [None] * total_scenes
         completed_count = 0
         comp_lock = threading.Lock()
-        whisper_lock = threading.Lock() 
 
         # 字幕参数已作为函数参数传入
 
-        def process_single_scene(index, sentence):
-            nonlocal completed_count
-            scene_id = index + 1
+        def save_checkpoint(ctx, stage, entry):
+            """场景阶段完成后写入检查点（只落任务存储，不推送给前端）"""
             try:
-                # 初始显示
-                update_task_state(None, scene_updates={scene_id: {"text": sentence, "step": "🎙️ 正在合成配音...", "done": False}})
-                
-                audio_path = os.path.join(assets_dir, f"audio_{task_id}_{index}.mp3")
-                with whisper_lock:
-                    timestamps, duration = audio_gen.generate_tts(sentence, index, audio_path)
-
-                update_task_state(None, scene_updates={scene_id: {"step": "🎨 正在绘制背景图..."}})
-                image_path = os.path.join(assets_dir, f"bg_{task_id}_{index}.jpg")
-                image_gen.generate_image(sentence, image_path, res, full_config=image_config)
-
-                update_task_state(None, scene_updates={scene_id: {"step": "📐 正在生成动态字幕..."}})
-                ass_path = os.path.join(assets_dir, f"anim_{task_id}_{index}.ass")
-                anim_gen.prepare_subtitles(sentence, timestamps, ass_path, duration, style_id=subtitle_style, font_name=font_name)
-
-                update_task_state(None, scene_updates={scene_id: {"step": "🎬 正在合成场景视频..."}})
-                scene_output = os.path.join(scenes_dir, f"scene_{task_id}_{index}.mp4")
-                synth.merge_scene(image_path, audio_path, ass_path, scene_output, duration=duration)
-
-                scene_files[index] = scene_output
-                
-                with comp_lock:
-                    completed_count += 1
-                    current_pct = 5 + int((completed_count / total_scenes) * 80)
-                    update_task_state(current_pct, scene_updates={scene_id: {"step": "已完成", "done": True}})
-                
+                get_task_store().update_task(task_id, status=None, scene_updates={ctx["scene_id"]: {"checkpoint": {stage: entry}}})
             except Exception as e:
-                print(f"场景 {scene_id} 错误: {e}")
-                update_task_state(None, scene_updates={scene_id: {"step": f"❌ 失败: {str(e)[:20]}", "done": False}})
-
-        # 并发执行
-        update_task_state(10, scene_updates={"0": {"step": "🏭 并行生产车间运转中..."}})
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            for i, s in enumerate(sentences):
-                executor.submit(process_single_scene, i, s)
+                print(f"[{task_id}] ⚠️ 检查点写入失败: {e}")
+
+        def upstream_tts(ctx):
+            """配音与时间戳来自上游真实结果（而非模拟配音 / 估算时间戳），由 AudioGenerator 在估算的时间戳上标记"""
+            return not audio_gen.is_estimated(ctx["timestamps"])
+
+        def checkpoint_tts(ctx):
+            # 兜底结果不写检查点，续跑时重新请求上游
+            if upstream_tts(ctx):
+                save_checkpoint(ctx, "tts", make_entry(ctx["audio_key"], ctx["audio_path"], duration=ctx["duration"], timestamps=ctx["timestamps"]))
+
+        def stage_tts(ctx):
+            if "audio_path" in ctx: return  # 已从检查点恢复
+            check_cancelled()
+            update_task_state(None, scene_updates={ctx["scene_id"]: {"text": ctx["sentence"], "step": "🎙️ 正在合成配音...", "done": False}})
+            audio_path = os.path.join(assets_dir, f"audio_{task_id}_{ctx['index']}.mp3")
+            ctx["timestamps"], ctx["duration"] = audio_gen.synthesize(ctx["sentence"], audio_path)
+            ctx["audio_path"] = audio_path
+            checkpoint_tts(ctx)
+            settle_stream_target()
+
+        def stage_align(ctx):
+            if ctx["timestamps"] is not None: return
+            check_cancelled()
+            update_task_state(None, scene_updates={ctx["scene_id"]: {"step": "⏱️ 正在对齐时间轴..."}})
+            ctx["timestamps"], ctx["duration"] = audio_gen.align(ctx["sentence"], ctx["audio_path"], duration=ctx["duration"])
+            checkpoint_tts(ctx)
+
+        def stage_align_batch(ctxs):
+            todo = [c for c in ctxs if c["timestamps"] is None]
+            if not todo: return
+            check_cancelled()
+            update_task_state(None, scene_updates={c["scene_id"]: {"step": "⏱️ 正在批量对齐时间轴..."} for c in todo})
+            results = audio_gen.align_batch([(c["sentence"], c["audio_path"]) for c in todo])
+            for c, (timestamps, duration) in zip(todo, results):
+                c["timestamps"], c["duration"] = timestamps, duration
+                checkpoint_tts(c)
+
+        def stage_image(ctx):
+            for src, image_key in ctx["image_keys"].items():
+                if src in ctx["image_paths"]: continue  # 已从检查点恢复
+                check_cancelled()
+                update_task_state(None, scene_updates={ctx["scene_id"]: {"step": "🎨 正在绘制背景图..."}})
+                image_path = os.path.join(assets_dir, f"bg_{task_id}_{ctx['index']}{image_names[src]}.jpg")
+                ctx["image_ok"][src] = image_gen.generate_image(ctx["sentence"], image_path, src, full_config=image_config) is not None
+                ctx["image_paths"][src] = image_path
+                if ctx["image_ok"][src]:
+                    save_checkpoint(ctx, "image", {src: make_entry(image_key, image_path, image_ok=True)})
+
+        def stage_render(ctx):
+            for t in targets:
+                check_cancelled()
+                res = t["res"]
+                ass_path = None
+                # global / soft 模式下字幕在拼接后统一处理，场景只合成背景与配音
+                if subtitle_mode == "scene":
+                    update_task_state(None, scene_updates={ctx["scene_id"]: {"step": f"📐 正在生成动态字幕 ({t['aspect']})..."}})
+                    ass_path = os.path.join(assets_dir, f"anim_{task_id}_{ctx['index']}_{res}.ass")
+                    with tracing.span("ass"):
+                        t["anim"].prepare_subtitles(ctx["sentence"], ctx["timestamps"], ass_path, ctx["duration"], style_id=subtitle_style, font_name=font_name)
+                        tracing.record_output(ass_path)
+                ctx["ass_paths"][res] = ass_path
+                # 单次渲染模式下场景只准备素材，最后统一编码；已从场景缓存取回的画幅跳过
+                if single_pass or res in ctx["outputs"]: continue
+
+                check_cancelled()
+                step = "🛰️ 已分发到渲染节点" if remote is not None else "🎬 正在合成场景视频"
+                update_task_state(None, scene_updates={ctx["scene_id"]: {"step": f"{step} ({t['aspect']})..."}})
+                scene_output = os.path.join(scenes_dir, f"scene_{task_id}_{ctx['index']}_{res}.mp4")
+                with tracing.span("encode"):
+                    if remote is not None:
+                        encoder_name = render_remote(ctx, t, ass_path, scene_output)
+                    else:
+                        t["synth"].merge_scene(ctx["image_paths"][t["source"]], ctx["audio_path"], ass_path, scene_output, duration=ctx["duration"])
+                        encoder_name = encoder.name
+                ctx["outputs"][res] = scene_output
+                # 配音、背景图都来自上游真实结果（而非兜底）时才写入检查点与场景缓存
+                if not (ctx["image_ok"].get(t["source"]) and upstream_tts(ctx)): continue
+                save_checkpoint(ctx, "render", {res: make_entry(ctx["scene_keys"][res], scene_output)})
+                # 场景键包含编码器，渲染节点探测到的编码器与本机不同时不写入
+                if scene_cache is not None and encoder_name == encoder.name:
+                    try:
+                        scene_cache.put(ctx["scene_keys"][res], {"scene.mp4": scene_output},
+                                        {"duration": ctx["duration"], "timestamps": ctx["timestamps"]})
+                    except OSError as e:
+                        print(f"      ⚠️ 场景缓存写入失败: {e}")
+
+        def share_file(path):
+            """把素材放进共享目录（同一文件系统时硬链接），返回相对共享目录的路径"""
+            rel = os.path.join(task_id, os.path.basename(path))
+            dest = os.path.join(remote["shared_dir"], rel)
+            if not os.path.exists(dest):
+                try:
+                    os.link(path, dest)
+                except OSError:
+                    shutil.copyfile(path, dest)
+            return rel
+
+        def render_remote(ctx, t, ass_path, scene_output):
+            """
+            发布一个场景单元并等待渲染完成，返回实际使用的编码器。
+            没有远程节点在线时协调进程就地领取本任务的单元（占用本机的渲染名额）
+            """
+            queue = remote["queue"]
+            unit_id = queue.publish(task_id, {
+                "image": share_file(ctx["image_paths"][t["source"]]), "audio": share_file(ctx["audio_path"]),
+                "ass": share_file(ass_path) if ass_path else None,
+                "output": os.path.join(task_id, os.path.basename(scene_output)),
+                "duration": ctx["duration"], "resolution": t["res"], "fps": t["synth"].fps,
+                "motion_engine": t["synth"].motion_engine, "profile": encoder.profile,
+            })
+            while True:
+                check_cancelled()
+                unit = queue.get(unit_id)
+                if unit is None or unit["status"] == "failed":
+                    raise Exception(f"远程渲染失败: {(unit or {}).get('error') or '单元已丢失'}")
+                if unit["status"] == "done": break
+                workers = queue.live_workers(config.RENDER_WORKER_TIMEOUT)
+                if not any(w.get("role") != "coordinator" for w in workers) and remote["local_slots"].acquire(blocking=False):
+                    try:
+                        remote["local"].run_one(job_id=task_id)
+                    finally:
+                        remote["local_slots"].release()
+                    continue
                 time.sleep(0.5)
+            result = unit["result"]
+            shutil.move(os.path.join(remote["shared_dir"], result["output"]), scene_output)
+            t["synth"].record_encode(result["frames"], result["seconds"])
+            return result["encoder"]
 
-        update_task_state(85, scene_updates={"0": {"step": "🎥 正在进行全局视频合并...", "done": False}})
-        valid_scenes = [f for f in scene_files if f and os.path.exists(f)]
-        
-        temp_video = os.path.join(output_dir, f"temp_{task_id}.mp4")
-        final_video = os.path.join(output_dir, f"video_{task_id}.mp4")
-        synth.concatenate_scenes(valid_scenes, temp_video)
-        
-        if bgm != "none":
-            update_task_state(95, scene_updates={"0": {"step": "🎵 正在智能混音...", "done": False}})
-            bgm_path = os.path.join(bgm_dir, f"{bgm}.mp3")
-            synth.add_background_music(temp_video, bgm_path, final_video)
-            if os.path.exists(temp_video) and os.path.exists(final_video): os.remove(temp_video)
-            elif not os.path.exists(final_video): os.rename(temp_video, final_video)
-        else:
-            if os.path.exists(temp_video): os.rename(temp_video, final_video)
-        
-        update_task_state(100, status="completed", video_path=final_video, scene_updates={"0": {"step": "✨ 所有任务已圆满完成！", "done": True}})
+        def publish_segment(ctx, ok=True):
+            """按序号把完成的场景追加到 HLS 播放列表；封装失败时停用推流，最终视频改由场景文件拼接"""
+            nonlocal hls
+            stream = hls
+            if stream is None: return
+            res = targets[0]["res"]
+            try:
+                with tracing.span("segment", scene=ctx["scene_id"]):
+                    stream.add(ctx["index"], ctx["outputs"][res], ctx["duration"]) if ok and res in ctx["outputs"] else stream.skip(ctx["index"])
+            except Exception as e:
+                print(f"[{task_id}] ⚠️ HLS 分片封装失败: {e}，停止推流")
+                hls = None
+                return
+            announce_stream()
+
+        def settle_stream_target():
+            """全部场景的配音时长都已知（或场景已失败）时，以最长场景确定播放列表的目标时长"""
+            stream = hls
+            if stream is None: return
+            if any("duration" not in c and c.get("error") is None for c in scene_ctxs): return
+            stream.set_max_duration(max([c["duration"] for c in scene_ctxs if "duration" in c] + [0]))
+            announce_stream()
+
+        def announce_stream():
+            nonlocal stream_announced
+            stream = hls
+            with comp_lock:
+                if stream is None or stream_announced or not stream.live: return
+                stream_announced = True
+            update_task_state(None, stream_url=f"/api/stream/{task_id}/{HlsStream.PLAYLIST}")
+
+        def on_scene_done(ctx):
+            nonlocal completed_count
+            publish_segment(ctx)
+            with comp_lock:
+                completed_count += 1
+                current_pct = 10 + int((completed_count / total_scenes) * 75)
+                update_task_state(current_pct, scene_updates={ctx["scene_id"]: {"step": "已完成", "done": True}})
+
+        def on_scene_error(ctx, stage, e):
+            if isinstance(e, JobCancelled): return
+            publish_segment(ctx, ok=False)
+            settle_stream_target()
+            print(f"场景 {ctx['scene_id']} [{stage}] 错误: {e}")
+            update_task_state(None, scene_updates={ctx["scene_id"]: {"step": f"❌ 失败: {str(e)[:20]}", "done": False}})
+
+        # 场景级构建清单：记录每个场景各阶段的输入键，输入未变的场景直接取回上次渲染的成片
+        scene_cache = None
+        if config.SCENE_CACHE_ENABLED and tts_cache is not None and not single_pass:
+            scene_cache = FileCache(config.SCENE_CACHE_DIR, max_bytes=config.SCENE_CACHE_MAX_MB * 1024 * 1024, ttl=config.SCENE_CACHE_TTL)
+        render_params = dict(fps=30, motion_engine=targets[0]["synth"].motion_engine,
+                             encoder=encoder.name, profile=encoder.profile, subtitle_mode=subtitle_mode)
+        # 字幕不烧进场景时，换字幕样式/字体不影响场景复用
+        if subtitle_mode == "scene":
+            render_params.update(subtitle_style=subtitle_style, font_name=font_name, subtitle_compiler=config.SUBTITLE_COMPILER)
+        manifest = SceneManifest()
+        scene_ctxs = []
+        for i, s in enumerate(sentences):
+            audio_key = audio_gen.cache_key(s)
+            image_keys = {src: image_gen.cache_key(s, src, image_config) for src in image_names}
+            scene_keys = {t["res"]: SceneManifest.scene_key(audio_key, image_keys[t["source"]], resolution=t["res"], **render_params) for t in targets}
+            manifest.record(i, s, audio_key, image_keys, scene_keys)
+            scene_ctxs.append({"index": i, "scene_id": i + 1, "sentence": s, "audio_key": audio_key, "image_keys": image_keys, "scene_keys": scene_keys,
+                               "image_paths": {}, "image_ok": {},
+                               "outputs": {}, "ass_paths": {}})
+        get_task_store().update_task(task_id, manifest=manifest.to_dict())
+        if base_task_id:
+            base_manifest = SceneManifest((load_task(base_task_id) or {}).get("manifest"))
+            print(f"[{task_id}] 📋 相对任务 {base_task_id} 改动了 {len(manifest.diff(base_manifest))}/{total_scenes} 个场景")
+
+        # 边渲染边推流：第一个画幅的场景按序封装为 HLS 分片（AV1 无法放进 MPEG-TS，不推流）
+        stream = config.STREAM_OUTPUT if stream is None else stream
+        if stream and not single_pass and encoder.name != "libsvtav1":
+            hls_dir = os.path.join(config.STREAM_DIR, task_id)
+            hls = HlsStream(hls_dir, target_duration=config.HLS_TARGET_DURATION)
+
+        # 断点续跑：逐个场景校验检查点，输入键一致且产物完好的阶段直接沿用
+        if resume:
+            saved = (load_task(task_id) or {}).get("scenes_status", {})
+            restored = 0
+            for ctx in scene_ctxs:
+                ckpt = (saved.get(str(ctx["scene_id"])) or {}).get("checkpoint") or {}
+                tts = verify_entry(ckpt.get("tts"), ctx["audio_key"])
+                if tts:
+                    ctx["audio_path"], ctx["duration"], ctx["timestamps"] = tts["path"], tts["duration"], tts.get("timestamps")
+                for src, entry in (ckpt.get("image") or {}).items():
+                    image = verify_entry(entry, ctx["image_keys"][src]) if src in ctx["image_keys"] else None
+                    # 兜底图不沿用，续跑时重新请求上游
+                    if image and image.get("image_ok"):
+                        ctx["image_paths"][src], ctx["image_ok"][src] = image["path"], True
+                # 场景视频的时长、字幕都来自配音，配音需要重做时已渲染的场景一并作废
+                for res, entry in (ckpt.get("render") or {}).items():
+                    if tts and res in ctx["scene_keys"] and verify_entry(entry, ctx["scene_keys"][res]):
+                        ctx["outputs"][res] = entry["path"]
+                restored += bool(tts or ctx["image_paths"])
+            print(f"[{task_id}] ⏯️ 从检查点继续：{restored}/{total_scenes} 个场景有可沿用的阶段")
+
+        pending = []
+        for ctx in scene_ctxs:
+            for res, key in ctx["scene_keys"].items():
+                if scene_cache is None: break
+                if res in ctx["outputs"]: continue
+                scene_output = os.path.join(scenes_dir, f"scene_{task_id}_{ctx['index']}_{res}.mp4")
+                meta = scene_cache.fetch(key, "scene.mp4", scene_output, link=True)
+                if meta is not None:
+                    # 全局字幕需要各场景的时长与时间戳
+                    ctx["duration"], ctx["timestamps"] = meta["duration"], meta.get("timestamps")
+                    ctx["outputs"][res] = scene_output
+            if len(ctx["outputs"]) == len(targets):
+                completed_count += 1
+                publish_segment(ctx)
+                step = "⏯️ 已从检查点恢复" if resume else "♻️ 未改动，复用已渲染场景"
+                update_task_state(None, scene_updates={ctx["scene_id"]: {"text": ctx["sentence"], "step": step, "done": True}})
+            else:
+                pending.append(ctx)
+        # 全部场景都已复用时不会再经过配音阶段，在这里确定播放列表的目标时长
+        settle_stream_target()
+        if completed_count:
+            print(f"[{task_id}] ♻️ 复用 {completed_count} 个已渲染场景，重新生成 {len(pending)} 个")
+
+        # 分阶段流水线并发执行
+        update_task_state(10 + int((completed_count / total_scenes) * 75), reused_scenes=completed_count or None,
+                          scene_updates={"0": {"step": "🏭 并行生产车间运转中..."}})
+        from config import (PIPELINE_TTS_WORKERS, PIPELINE_ALIGN_WORKERS, PIPELINE_IMAGE_WORKERS,
+                            PIPELINE_RENDER_WORKERS, PIPELINE_QUEUE_SIZE, ALIGN_MODE)
+        batch_align = ALIGN_MODE == "batch"
+        pipeline = ScenePipeline(
+            stage_tts, stage_align_batch if batch_align else stage_align, stage_image, stage_render,
+            tts_workers=PIPELINE_TTS_WORKERS, align_workers=PIPELINE_ALIGN_WORKERS,
+            image_workers=PIPELINE_IMAGE_WORKERS,
+            # 分布式渲染时渲染线程只是等待远程结果，放宽并发让更多场景同时在队列中
+            render_workers=config.RENDER_REMOTE_INFLIGHT if remote is not None else PIPELINE_RENDER_WORKERS,
+            queue_size=PIPELINE_QUEUE_SIZE, on_error=on_scene_error, on_done=on_scene_done, batch_align=batch_align
+        )
+        pipeline.run(pending)
+        for ctx in scene_ctxs: ctx.setdefault("error", None)
+        check_cancelled()
+
+        bgm_path = os.path.join(bgm_dir, f"{bgm}.mp3") if bgm != "none" else None
+
+        def assemble_output(t):
+            """把一个画幅的全部场景合成为最终视频"""
+            res, synth, anim_gen, final_video = t["res"], t["synth"], t["anim"], t["final"]
+            label = f" ({t['aspect']})" if len(targets) > 1 else ""
+            temp_video = os.path.join(output_dir, f"temp_{task_id}_{res}.mp4")
+            ready = [
+                {**c, "ass_path": c["ass_paths"].get(res), "image_path": c["image_paths"].get(t["source"])} for c in scene_ctxs
+                if c["error"] is None and (single_pass or (c["outputs"].get(res) and os.path.exists(c["outputs"][res])))
+            ]
+            if not ready: raise Exception("没有可用的场景")
+
+            # 整条视频一份字幕按各场景在成片中的实际长度平移：逐场景编码的探测场景文件，单次渲染按整帧取整
+            if subtitle_mode in ("global", "soft"):
+                for c in ready:
+                    c["span"] = synth.frame_span(c["duration"]) if single_pass else (
+                        probe_duration(c["outputs"][res]) or round(c["duration"], 2))
+
+            # 整条视频一份字幕：global 拼接后烧录一次，soft 作为软字幕轨最后封装
+            global_ass = soft_subs = None
+            if subtitle_mode == "global":
+                with tracing.span("ass"):
+                    global_ass = anim_gen.prepare_global_subtitles(ready, os.path.join(assets_dir, f"anim_{task_id}_all_{res}.ass"),
+                                                                   style_id=subtitle_style, font_name=font_name)
+                    tracing.record_output(global_ass)
+            elif subtitle_mode == "soft":
+                with tracing.span("ass"):
+                    soft_subs = anim_gen.prepare_soft_subtitles(ready, os.path.join(assets_dir, f"subs_{task_id}_{res}.srt"))
+                    tracing.record_output(soft_subs)
+
+            if single_pass:
+                update_task_state(85, scene_updates={"0": {"step": f"🎥 正在一次性渲染整条视频{label}...", "done": False}})
+                current = temp_video if soft_subs else final_video
+                with tracing.span("encode"):
+                    synth.render_single_pass(ready, current, bgm_path=bgm_path, ass_path=global_ass)
+            else:
+                update_task_state(85, scene_updates={"0": {"step": f"🎥 正在进行全局视频合并{label}...", "done": False}})
+                current = temp_video
+                # 已推流的画幅直接拼接 HLS 分片（同样是流复制），与边看边播的内容完全一致
+                segments = hls.segments() if hls is not None and t is targets[0] else []
+                with tracing.span("concat"):
+                    synth.concatenate_scenes(segments if len(segments) == len(ready) else [c["outputs"][res] for c in ready], current)
+
+                if global_ass:
+                    # 烧录字幕本就要重新编码视频，BGM 在同一次编码中混入
+                    update_task_state(90, scene_updates={"0": {"step": f"🔤 正在烧录全局字幕{label}...", "done": False}})
+                    burned = os.path.join(output_dir, f"temp_{task_id}_{res}_subs.mp4")
+                    with tracing.span("burn_subtitles"):
+                        synth.burn_subtitles(current, global_ass, burned, bgm_path=bgm_path)
+                    os.remove(current)
+                    current = burned
+                elif bgm_path:
+                    update_task_state(95, scene_updates={"0": {"step": f"🎵 正在智能混音{label}...", "done": False}})
+                    mixed = os.path.join(output_dir, f"temp_{task_id}_{res}_bgm.mp4")
+                    with tracing.span("bgm_mix"):
+                        synth.add_background_music(current, bgm_path, mixed)
+                    if os.path.exists(current): os.remove(current)
+                    current = mixed
+
+                if not soft_subs:
+                    os.replace(current, final_video)
+                    current = final_video
+
+            if soft_subs:
+                update_task_state(97, scene_updates={"0": {"step": f"🔤 正在封装软字幕{label}...", "done": False}})
+                with tracing.span("mux_subtitles"):
+                    synth.mux_soft_subtitles(current, soft_subs, final_video)
+                os.remove(current)
+            return final_video
+
+        if hls is not None: hls.finish()
+        outputs = {}
+        for t in targets:
+            check_cancelled()
+            outputs[t["aspect"]] = assemble_output(t)
+
+        # 汇总各画幅的编码速度
+        stats = [t["synth"].encode_stats() for t in targets]
+        frames = sum(st["frames"] for st in stats)
+        seconds = sum(st["frames"] / st["fps"] for st in stats if st["fps"])
+        encode_stats = {**stats[0], "frames": frames, "fps": round(frames / seconds, 1) if seconds else 0.0}
+        print(f"[{task_id}] 🎞️ 编码器 {encode_stats['encoder']} ({encode_stats['profile']}): {encode_stats['fps']} fps")
+        update_task_state(100, status="completed", video_path=targets[0]["final"], outputs=outputs, encode=encode_stats,
+                          scene_updates={"0": {"step": "✨ 所有任务已圆满完成！", "done": True}})
+        completed = True
         
+    except JobCancelled:
+        print(f"[{task_id}] 🛑 任务已被用户强制中止")
+        update_task_state(None, status="error", error="任务已被用户中止", resumable=True)
     except Exception as e:
         print(f"[{task_id}] 致命错误: {e}")
         traceback.print_exc()
         try:
-            update_task_state(0, status="error", error=str(e))
+            update_task_state(0, status="error", error=str(e), resumable=True)
         except: pass
     finally:
-        # 清理临时文件 (更为激进的清理模式)
+        # 分阶段计时随任务保存，任务结束后由 Web 进程汇入 /metrics
+        trace = tracing.end_trace()
+        try:
+            created = (load_task(task_id) or {}).get("created", started)
+            get_task_store().update_task(task_id, status=None, timing={
+                "queue_wait": round(max(0.0, started - created), 3), "run": round(time.time() - started, 3), **trace.to_dict()
+            })
+        except Exception as e:
+            print(f"[{task_id}] ⚠️ 计时数据保存失败: {e}")
+
+        # 清理临时文件：完成的任务清理全部中间产物；中断 / 失败 / 中止的保留配音、背景图和场景成片
+        # 供 /api/resume 从检查点继续，任务记录过期后由 sweep_task_artifacts 回收
         print(f"[{task_id}] 🧹 正在清理现场...")
         import glob
         import shutil
         
-        # 匹配所有包含 task_id 的临时文件
-        patterns = [
-            os.path.join(assets_dir, f"*{task_id}*"),
-            os.path.join(scenes_dir, f"*{task_id}*"),
-            os.path.join(output_dir, f"temp_{task_id}.mp4"),
-        ]
+        patterns = [os.path.join(output_dir, f"temp_{task_id}*.mp4")]
+        if completed:
+            patterns += [os.path.join(assets_dir, f"*{task_id}*"), os.path.join(scenes_dir, f"*{task_id}*")]
+        # 完成的任务保留 HLS 分片供继续播放，失败 / 中止的一并清理
+        if hls_dir and not completed:
+            patterns.append(hls_dir)
+        # 撤下本任务在渲染队列中的单元（仍在渲染的节点续约失败后放弃），清理共享目录中的素材
+        if remote is not None:
+            try:
+                remote["queue"].purge(task_id)
+            except Exception as e:
+                print(f"  - 渲染队列清理失败: {e}")
+            patterns.append(os.path.join(remote["shared_dir"], task_id))
         
         for pattern in patterns:
             for f in glob.glob(pattern):
@@ -239,50 +881,254 @@ def get_bgm_list():
         {"id": "inspiring", "name": "昂扬向上 (Inspire)"},
     ])
 
+def _job_payload(data):
+    """整理生成参数，返回 (交给工作进程的参数, 随任务保存供重新生成沿用的参数)"""
+    import config
+    image_config = data.get('image_config')
+    # 多画幅输出：["9:16", "16:9", "1:1"]，配音与背景图只生成一次
+    resolutions = [r for r in (data.get('resolutions') or []) if r in RESOLUTIONS] or None
+    payload = dict(text=(data.get('text') or '').strip(), voice=data.get('voice') or config.EDGE_TTS_VOICE,
+                   resolution=resolutions[0] if resolutions else data.get('resolution'), bgm=data.get('bgm', 'none'),
+                   subtitle_style=data.get('subtitle_style', 'classic_yellow'), font_name=data.get('font_name', 'PingFang SC'),
+                   image_config=image_config, motion_engine=data.get('motion_engine'), render_mode=data.get('render_mode'),
+                   encoder_profile=data.get('encoder_profile'), subtitle_mode=data.get('subtitle_mode'),
+                   resolutions=resolutions, base_task_id=None, stream=data.get('stream'))
+    # 保存生成参数供之后重新生成时沿用（不落盘 api_key）
+    params = {k: v for k, v in payload.items() if k not in ("text", "base_task_id")}
+    if image_config: params["image_config"] = {k: v for k, v in image_config.items() if k != "api_key"}
+    return payload, params
+
+def _new_task_record(**extra):
+    now = time.time()
+    return {"status": "pending", "progress": 0, "scenes_status": {}, "video_path": None, "error": None,
+            "last_update": now, "created": now, **extra}
+
 @app.route('/api/generate', methods=['POST'])
 def generate():
     data = request.json
-    text, voice, res, bgm = data.get('text', '').strip(), data.get('voice'), data.get('resolution'), data.get('bgm', 'none')
-    if not text: return jsonify({"error": "请输入文案"}), 400
-    
-    subtitle_style = data.get('subtitle_style', 'classic_yellow')
-    font_name = data.get('font_name', 'PingFang SC')
-    image_config = data.get('image_config')
+    # 基于已有任务重新生成：未传的参数沿用原任务，未改动的场景直接复用
+    base_task_id = data.get('base_task_id')
+    if base_task_id:
+        base_task = load_task(base_task_id)
+        # 原任务已被清理时按全新任务处理（场景缓存仍按内容寻址生效）
+        if base_task: data = {**base_task.get("params", {}), **data}
+        else: base_task_id = None
+    payload, params = _job_payload(data)
+    if not payload["text"]: return jsonify({"error": "请输入文案"}), 400
+    payload["base_task_id"] = base_task_id
+    priority = data.get('priority', 'interactive')
     
     task_id = str(uuid.uuid4())[:8]
-    save_task_to_disk(task_id, {
-        "status": "pending", "progress": 0, "scenes_status": {}, "video_path": None, "error": None, "last_update": time.time()
-    })
+    prune_task_history()
+    # 文案随任务保存，中断后 /api/resume 据此继续
+    save_task_to_disk(task_id, _new_task_record(priority=priority, params=params, base_task_id=base_task_id, text=payload["text"]))
     
-    p = multiprocessing.Process(target=run_generation_process, args=(task_id, text, voice, res, bgm, subtitle_style, font_name, image_config))
-    p.start()
-    running_processes[task_id] = p
+    from service.scheduler import AdmissionRejected
+    try:
+        get_worker_pool()
+        get_scheduler().submit(task_id, payload, client_key=get_client_key(), priority=priority)
+    except AdmissionRejected as e:
+        get_task_store().delete_task(task_id)
+        resp = jsonify({"error": f"服务繁忙：{e.reason}，请稍后重试", "retry_after": e.retry_after})
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 429
     return jsonify({"task_id": task_id})
 
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """
+    批量生成：scripts 为文案列表（字符串或 {"text", "title"}），其余参数与 /api/generate 相同、整批共用。
+    整批场景先统一切分，配音与背景图按缓存内容键去重后由一个预热任务各生成一次，
+    之后各文案以 batch 优先级逐个进入调度器，直接命中缓存
+    """
+    import config
+    from service.batch import plan_batch
+    from service.scheduler import AdmissionRejected
+    data = request.json or {}
+    scripts = [s if isinstance(s, dict) else {"text": s} for s in (data.get('scripts') or [])]
+    scripts = [s for s in scripts if (s.get('text') or '').strip()]
+    if not scripts: return jsonify({"error": "请提供至少一篇文案"}), 400
+    if len(scripts) > config.BATCH_MAX_SCRIPTS:
+        return jsonify({"error": f"单个批次最多 {config.BATCH_MAX_SCRIPTS} 篇文案"}), 400
+
+    shared, params = _job_payload({k: v for k, v in data.items() if k != 'scripts'})
+    audio_gen, image_gen = build_generators(shared["voice"], shared["image_config"], caches=False)
+    sources = source_resolutions([RESOLUTIONS.get(a, "1080x1920") for a in (shared["resolutions"] or [shared["resolution"]])],
+                                 image_gen, shared["image_config"])
+    plan = plan_batch([s["text"] for s in scripts], audio_gen, image_gen, list(dict.fromkeys(sources.values())), shared["image_config"])
+
+    batch_id = f"batch-{str(uuid.uuid4())[:8]}"
+    client_key = f"{get_client_key()}:batch"
+    prune_task_history()
+    jobs = []
+    for i, (script, sentences) in enumerate(zip(scripts, plan["scripts"])):
+        task_id = str(uuid.uuid4())[:8]
+        save_task_to_disk(task_id, _new_task_record(priority="batch", params=params, batch_id=batch_id, text=script["text"].strip(),
+                                                    title=script.get('title') or f"#{i + 1}", scene_count=len(sentences)))
+        jobs.append((task_id, {**shared, "text": script["text"].strip()}))
+
+    # 模拟模式或关闭缓存时生成结果不进缓存，预热没有意义
+    warm_audio = config.TTS_CACHE_ENABLED and not config.MOCK_AUDIO
+    warm_images = config.IMAGE_CACHE_ENABLED and not config.MOCK_IMAGE
+    prewarm_id = f"{batch_id}-warm" if warm_audio or warm_images else None
+    save_task_to_disk(batch_id, _new_task_record(status="batch", kind="batch", plan=plan["stats"],
+                                                 task_ids=[job[0] for job in jobs], prewarm_task=prewarm_id))
+    feeder = get_batch_feeder()
+    feeder.add(batch_id, jobs, client_key, ready=prewarm_id is None)
+    if prewarm_id:
+        save_task_to_disk(prewarm_id, _new_task_record(priority="batch", kind="prewarm", batch_id=batch_id))
+        try:
+            get_worker_pool()
+            get_scheduler().submit(prewarm_id, {
+                "kind": "prewarm", "voice": shared["voice"], "image_config": shared["image_config"],
+                "sentences": list(plan["audio"].values()) if warm_audio else [],
+                "images": list(plan["images"].values()) if warm_images else [],
+            }, client_key=client_key, priority="batch")
+        except AdmissionRejected as e:
+            # 预热排不上队时不拦整批：各任务照常执行，只是失去跨任务去重
+            get_task_store().update_task(prewarm_id, status="error", error=f"未预热：{e.reason}")
+            feeder.release(batch_id)
+    feeder.pump()
+    print(f"📦 批次 {batch_id}: {plan['stats']}")
+    return jsonify({"batch_id": batch_id, "task_ids": [job[0] for job in jobs], "plan": plan["stats"]})
+
+@app.route('/api/batch/<batch_id>')
+def get_batch(batch_id):
+    """批次状态：各文案的进度与整批汇总"""
+    batch = load_task(batch_id)
+    if not batch or batch.get("kind") != "batch": return jsonify({"error": "找不到批次"}), 404
+    scripts, counts = [], {}
+    for task_id in batch["task_ids"]:
+        task = load_task(task_id) or {"status": "error", "error": "任务记录已清理"}
+        status = task.get("status") or "pending"
+        counts[status] = counts.get(status, 0) + 1
+        scripts.append({
+            "task_id": task_id, "title": task.get("title"), "status": status, "progress": task.get("progress") or 0,
+            "scenes": task.get("scene_count"), "reused_scenes": task.get("reused_scenes"),
+            "queue_position": task.get("queue_position"), "error": task.get("error"),
+            "download_url": f"/api/download/{task_id}" if task.get("video_path") else None,
+        })
+    prewarm = load_task(batch["prewarm_task"]) if batch.get("prewarm_task") else None
+    finished = counts.get("completed", 0) + counts.get("error", 0)
+    return jsonify({
+        "batch_id": batch_id, "created": batch.get("created"), "plan": batch.get("plan"),
+        "status": "completed" if finished == len(scripts) else "running",
+        "progress": round(sum(s["progress"] for s in scripts) / max(1, len(scripts)), 1),
+        "counts": counts, "held": get_batch_feeder().pending(batch_id),
+        "prewarm": {k: prewarm.get(k) for k in ("status", "progress", "warmed", "error")} if prewarm else None,
+        "scripts": scripts,
+    })
+
+@app.route('/api/encoders')
+def get_encoders():
+    """可用编码器、档位及各档位实测的平均编码速度"""
+    from generator.encoder import PROFILES, probe_encoders
+    available = probe_encoders()
+    return jsonify({
+        "available": available,
+        "profiles": {name: [e for e in encoders if e in available] for name, encoders in PROFILES.items()},
+        "fps": {profile: {enc: round(frames / seconds, 1) for enc, (frames, seconds) in encs.items() if seconds}
+                for profile, encs in _encode_totals.items()},
+    })
+
+@app.route('/api/queue')
+def get_queue():
+    return jsonify(get_scheduler().stats())
+
+_metric_caches = None
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文本格式：阶段耗时直方图、缓存命中率、队列深度"""
+    global _metric_caches
+    import config
+    from generator.cache import FileCache
+    from service.metrics import render_series
+    if _metric_caches is None:
+        # 命中统计保存在各缓存自己的 SQLite 索引里，工作进程共享，这里只读
+        _metric_caches = {name: FileCache(root) for name, root, enabled in (
+            ("tts", config.TTS_CACHE_DIR, config.TTS_CACHE_ENABLED),
+            ("image", config.IMAGE_CACHE_DIR, config.IMAGE_CACHE_ENABLED),
+            ("scene", config.SCENE_CACHE_DIR, config.SCENE_CACHE_ENABLED),
+        ) if enabled}
+    cache_stats = {name: cache.stats() for name, cache in _metric_caches.items()}
+    queue = get_scheduler().stats()
+
+    lines = get_job_metrics().render()
+    lines += render_series("aivideo_queue_depth", "排队中的任务数", "priority", queue["queued"])
+    lines += render_series("aivideo_jobs_running", "执行中的任务数", "pool", {"generation": queue["running"]})
+    lines += render_series("aivideo_worker_capacity", "工作进程数", "pool", {"generation": queue["capacity"]})
+    lines += render_series("aivideo_cache_hit_ratio", "缓存命中率", "cache", {n: s["hit_rate"] for n, s in cache_stats.items()})
+    lines += render_series("aivideo_cache_hits_total", "缓存累计命中次数", "cache", {n: s["hits"] for n, s in cache_stats.items()}, kind="counter")
+    lines += render_series("aivideo_cache_misses_total", "缓存累计未命中次数", "cache", {n: s["misses"] for n, s in cache_stats.items()}, kind="counter")
+    lines += render_series("aivideo_cache_bytes", "缓存占用字节数", "cache", {n: s["bytes"] for n, s in cache_stats.items()})
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+SSE_HEARTBEAT = 15  # 心跳间隔（秒），防止代理断开空闲连接
+
 @app.route('/api/progress/<task_id>')
 def get_progress(task_id):
+    """
+    SSE 进度流：由工作进程推送驱动，没有更新时只发心跳。
+    事件 ID 形如 <epoch>-<seq>，断线重连时浏览器自动带上 Last-Event-ID，只补发更新的快照。
+    配置了 PROGRESS_SSE_PORT 时重定向到独立的 asyncio SSE 服务（全部连接共用一个线程）；
+    否则在这里推送，每个连接占一个 Werkzeug 线程
+    """
+    from urllib.parse import quote
+    from config import PROGRESS_SSE_PORT, PROGRESS_SSE_URL
+    from service.progress import format_sse, not_found_event
+    broker = get_progress_broker()
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if PROGRESS_SSE_PORT:
+        base = PROGRESS_SSE_URL or f"{request.scheme}://{request.host.rsplit(':', 1)[0]}:{PROGRESS_SSE_PORT}"
+        return redirect(f"{base.rstrip('/')}/api/progress/{quote(task_id)}?last_event_id={quote(last_event_id)}", code=307)
+    last_seq = broker.last_seq(last_event_id)
+
     def generate_events():
+        nonlocal last_seq
+        yield format_sse(retry=2000)
         while True:
-            tasks = load_tasks_from_disk()
-            if task_id not in tasks: break
-            yield f"data: {json.dumps(tasks[task_id])}\n\n"
-            if tasks[task_id]["status"] in ["completed", "error"]: break
-            time.sleep(1)
-    return Response(generate_events(), mimetype='text/event-stream')
+            seq, task = broker.wait(task_id, last_seq, timeout=SSE_HEARTBEAT)
+            if seq is None:
+                yield not_found_event()
+                break
+            if task is None:
+                yield format_sse(comment="heartbeat")
+                continue
+            last_seq = seq
+            yield format_sse(event_id=f"{broker.epoch}-{seq}", data=json.dumps(task))
+            if task["status"] in ["completed", "error"]: break
+
+    return Response(generate_events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/download/<task_id>')
 def download(task_id):
-    tasks = load_tasks_from_disk()
-    if task_id not in tasks or not tasks[task_id]["video_path"]: return jsonify({"error": "找不到文件"}), 404
-    return send_file(tasks[task_id]["video_path"], as_attachment=True, download_name=f"ai_video_{task_id}.mp4")
+    task = load_task(task_id)
+    if not task or not task["video_path"]: return jsonify({"error": "找不到文件"}), 404
+    # 多画幅任务通过 ?resolution=16:9 选择输出，缺省为第一个画幅
+    aspect = request.args.get('resolution')
+    if aspect:
+        path = (task.get("outputs") or {}).get(aspect)
+        if not path: return jsonify({"error": f"该任务没有 {aspect} 画幅的输出"}), 404
+        return send_file(path, as_attachment=True, download_name=f"ai_video_{task_id}_{aspect.replace(':', 'x')}.mp4")
+    return send_file(task["video_path"], as_attachment=True, download_name=f"ai_video_{task_id}.mp4")
+
+@app.route('/api/stream/<task_id>/<path:filename>')
+def serve_stream(task_id, filename):
+    """HLS 播放列表与分片；播放列表随渲染进度增长，禁止缓存"""
+    from config import STREAM_DIR
+    if not TASK_ID_RE.fullmatch(task_id): return jsonify({"error": "找不到文件"}), 404
+    if filename.endswith(".m3u8"):
+        resp = send_from_directory(os.path.join(STREAM_DIR, task_id), filename, mimetype="application/vnd.apple.mpegurl")
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    return send_from_directory(os.path.join(STREAM_DIR, task_id), filename, mimetype="video/mp2t")
 
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
     return send_from_directory('assets', filename)
 
-# 全局进程管理
-running_processes = {}
-
 @app.route('/api/status/<task_id>', methods=['GET'])
 def get_status(task_id):
     """获取任务状态和进程日志"""
@@ -310,27 +1156,69 @@ def get_subtitle_presets():
         ]
     })
             
+@app.route('/api/resume/<task_id>', methods=['POST'])
+def resume_task(task_id):
+    """
+    从检查点继续中断 / 失败 / 中止的任务：各场景已完成且产物校验通过的阶段直接沿用。
+    api_key 不随任务保存，需要时在请求体的 image_config 中重新提供
+    """
+    from service.scheduler import AdmissionRejected
+    task = load_task(task_id)
+    if not task or task.get("kind") is not None: return jsonify({"error": "找不到任务"}), 404
+    if task.get("status") != "error" or not task.get("resumable") or not task.get("text"):
+        return jsonify({"error": "该任务当前无法继续"}), 409
+    try:
+        _resume(task_id, client_key=get_client_key(), image_config=(request.get_json(silent=True) or {}).get("image_config"))
+    except AdmissionRejected as e:
+        resp = jsonify({"error": f"服务繁忙：{e.reason}，请稍后重试", "retry_after": e.retry_after})
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 429
+    return jsonify({"task_id": task_id})
+
+def _resume(task_id, client_key, image_config=None):
+    task = load_task(task_id)
+    params = dict(task.get("params") or {})
+    if image_config: params["image_config"] = {**(params.get("image_config") or {}), **image_config}
+    payload = {**params, "text": task["text"], "base_task_id": task.get("base_task_id"), "resume": True}
+    # 先置为排队中再提交，避免覆盖工作进程随即写入的 running
+    # 上一轮的 error / video_path 一并清掉，否则前端和批次状态会把续跑中的任务当成失败
+    get_task_store().update_task(task_id, status="pending", created=time.time(), resumable=False, clear=("error", "video_path"))
+    try:
+        get_worker_pool()
+        get_scheduler().submit(task_id, payload, client_key=client_key, priority=task.get("priority") or "interactive")
+    except Exception:
+        get_task_store().update_task(task_id, status="error", resumable=True)
+        raise
+    get_progress_broker().publish(task_id, {"status": "pending", "clear": ["error", "video_path"]})
+
 @app.route('/api/abort/<task_id>', methods=['POST'])
 def abort_task(task_id):
-    if task_id in running_processes:
-        p = running_processes[task_id]
-        if p.is_alive():
-            p.terminate()
-            p.join()
-            print(f"[{task_id}] 🛑 任务已被用户强制中止")
-        del running_processes[task_id]
-    
-    # 更新任务状态
-    tasks = load_tasks_from_disk()
-    if task_id in tasks:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["error"] = "任务已被用户中止"
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(tasks, f, indent=2)
-            
+    task = load_task(task_id)
+    # 中止批次：撤下尚未放行的任务，其余逐个中止
+    if task and task.get("kind") == "batch":
+        get_batch_feeder().cancel(task_id)
+        for tid in [task.get("prewarm_task"), *task["task_ids"]]:
+            sub = load_task(tid) if tid else None
+            if sub and sub.get("status") in ("pending", "running"): _abort(tid)
+        return jsonify({"status": "aborted"})
+    _abort(task_id)
     return jsonify({"status": "aborted"})
 
+def _abort(task_id):
+    # 批量积压中的直接撤下，排队中的直接出队；运行中的只通知工作进程在检查点退出，不杀进程，保持模型常驻
+    if not get_batch_feeder().cancel_task(task_id) and not get_scheduler().cancel(task_id):
+        get_worker_pool().cancel(task_id)
+    
+    # 更新任务状态（中止的生成任务保留检查点，可继续）
+    task = load_task(task_id)
+    if task:
+        get_task_store().update_task(task_id, status="error", error="任务已被用户中止",
+                                     resumable=task.get("kind") is None and bool(task.get("text")))
+        get_progress_broker().publish(task_id, {"status": "error", "error": "任务已被用户中止"})
+
 from flask import send_from_directory
 
 if __name__ == '__main__':
+    recover_interrupted_tasks()
+    get_worker_pool()
     app.run(host='0.0.0.0', port=8888, threaded=True)
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict, deque
+
+from generator.manifest import split_sentences
+from service.scheduler import AdmissionRejected
+
+
+def plan_batch(texts, audio_gen, image_gen, source_sizes, image_config=None):
+    """
+    预先切分整批文案的场景，按缓存内容键去重：
+      配音按 (音色, 规范化句子)，背景图按 (服务商, 模型, 提示词, 尺寸)，每个源图尺寸各一张
+    返回 {"scripts": [[句子, ...], ...], "audio": {键: 句子}, "images": {键: (句子, 源图尺寸)}, "stats": {...}}
+    """
+    per_script, audio, images = [], {}, {}
+    for text in texts:
+        sentences = split_sentences(text)
+        per_script.append(sentences)
+        for sentence in sentences:
+            audio.setdefault(audio_gen.cache_key(sentence), sentence)
+            for source_res in source_sizes:
+                images.setdefault(image_gen.cache_key(sentence, source_res, image_config), (sentence, source_res))
+    scenes = sum(len(s) for s in per_script)
+    return {
+        "scripts": per_script, "audio": audio, "images": images,
+        "stats": {"scripts": len(per_script), "scenes": scenes, "unique_audio": len(audio), "unique_images": len(images)},
+    }
+
+
+class BatchFeeder:
+    """
+    批量任务的放行器（运行在 Web 进程内）：
+    - 预热任务完成前整批任务留在本地积压，避免与预热同时请求同一句配音 / 同一张图
+    - 之后逐个提交给调度器，被准入控制拒绝（排队已满、资源超预算）时停下，
+      等有任务结束或 retry_after 到期后继续，不会一次把几百个任务压进调度队列
+    """
+
+    def __init__(self, submit):
+        self.submit = submit    # (task_id, payload, client_key, priority) -> None，可能抛出 AdmissionRejected
+        self._lock = threading.Lock()
+        self._batches = OrderedDict()   # batch_id -> {"ready", "client_key", "jobs": deque[(task_id, payload)]}
+        self._timer = None
+
+    def add(self, batch_id, jobs, client_key, ready=True):
+        with self._lock:
+            self._batches[batch_id] = {"ready": ready, "client_key": client_key, "jobs": deque(jobs)}
+
+    def release(self, batch_id):
+        """预热结束（无论成败），放行整批任务"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch: batch["ready"] = True
+        self.pump()
+
+    def pending(self, batch_id):
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return len(batch["jobs"]) if batch else 0
+
+    def cancel(self, batch_id):
+        """撤下整批尚未放行的任务，返回其 task_id"""
+        with self._lock:
+            batch = self._batches.pop(batch_id, None)
+        return [job[0] for job in batch["jobs"]] if batch else []
+
+    def cancel_task(self, task_id):
+        """撤下单个尚未放行的任务，返回是否命中"""
+        with self._lock:
+            for batch_id, batch in self._batches.items():
+                for job in batch["jobs"]:
+                    if job[0] == task_id:
+                        batch["jobs"].remove(job)
+                        return True
+        return False
+
+    def pump(self):
+        while True:
+            with self._lock:
+                picked = next(((batch_id, batch) for batch_id, batch in self._batches.items() if batch["ready"] and batch["jobs"]), None)
+                if picked is None:
+                    self._drop_drained()
+                    return
+                batch_id, batch = picked
+                job = batch["jobs"].popleft()
+            try:
+                self.submit(job[0], job[1], batch["client_key"], "batch")
+            except AdmissionRejected as e:
+                with self._lock:
+                    batch["jobs"].appendleft(job)
+                self._retry_later(e.retry_after)
+                return
+
+    def _drop_drained(self):
+        for batch_id in [b for b, batch in self._batches.items() if batch["ready"] and not batch["jobs"]]:
+            del self._batches[batch_id]
+
+    def _retry_later(self, seconds):
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive(): return
+            self._timer = threading.Timer(max(1, seconds or 5), self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.pump()
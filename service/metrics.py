@@ -0,0 +1,104 @@
+import threading
+
+# 阶段耗时直方图的分桶（秒）：覆盖从毫秒级的字幕排版到分钟级的整条视频编码
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _fmt(number):
+    # 字节数等大整数不能用科学计数法截断精度
+    if isinstance(number, int): return str(number)
+    return f"{number:.6f}".rstrip("0").rstrip(".")
+
+
+class Histogram:
+    """Prometheus 直方图：累计分桶计数 + 总和 + 总数，按标签值分组"""
+
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}   # 标签值 -> [各桶计数..., sum, count]
+
+    def observe(self, label_value, value):
+        series = self._series.setdefault(label_value, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, series in sorted(self._series.items()):
+            tag = f'{self.label}="{value}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{tag},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{tag},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{tag}}} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{{{tag}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values = {}
+
+    def inc(self, label_value, amount=1):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for value, total in sorted(self._values.items()):
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {_fmt(total)}')
+        return lines
+
+
+class JobMetrics:
+    """
+    任务计时指标（运行在 Web 进程内）：任务结束时把工作进程写入任务存储的计时段汇入直方图，
+    /metrics 以 Prometheus 文本格式输出。计数从 Web 进程启动时开始累计。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_run = Histogram("aivideo_stage_run_seconds", "各阶段单次执行耗时（不含排队）", "stage")
+        self.stage_wait = Histogram("aivideo_stage_wait_seconds", "各阶段单次排队等待时间", "stage")
+        self.stage_cpu = Counter("aivideo_stage_cpu_seconds_total", "各阶段子进程消耗的 CPU 时间", "stage")
+        self.stage_bytes = Counter("aivideo_stage_bytes_written_total", "各阶段写出的文件字节数", "stage")
+        self.job_wait = Histogram("aivideo_job_queue_seconds", "任务从提交到开始执行的等待时间", "priority")
+        self.job_run = Histogram("aivideo_job_run_seconds", "任务执行耗时", "status")
+        self.jobs = Counter("aivideo_jobs_total", "结束的任务数", "status")
+
+    def observe_job(self, task):
+        timing = task.get("timing") or {}
+        with self._lock:
+            self.jobs.inc(task.get("status") or "unknown")
+            if "queue_wait" in timing:
+                self.job_wait.observe(task.get("priority") or "interactive", timing["queue_wait"])
+            if "run" in timing:
+                self.job_run.observe(task.get("status") or "unknown", timing["run"])
+            for span in timing.get("spans", []):
+                self.stage_run.observe(span["stage"], span["run"])
+                self.stage_wait.observe(span["stage"], span["wait"])
+                self.stage_cpu.inc(span["stage"], span["cpu"])
+                self.stage_bytes.inc(span["stage"], span["bytes"])
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.stage_run, self.stage_wait, self.stage_cpu, self.stage_bytes,
+                           self.job_wait, self.job_run, self.jobs):
+                lines += metric.render()
+        return lines
+
+
+def render_series(name, help_text, label, values, kind="gauge"):
+    """把别处维护的 {标签值: 数值}（队列长度、缓存统计等）渲染为一个指标"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for value, number in sorted(values.items()):
+        lines.append(f'{name}{{{label}="{value}"}} {_fmt(number)}')
+    return lines
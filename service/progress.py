@@ -0,0 +1,151 @@
+import os
+import copy
+import json
+import time
+import queue
+import itertools
+import threading
+
+
+class ProgressBroker:
+    """
+    进度推送中心（运行在 Web 进程内）：
+    - 工作进程通过 IPC 队列发布状态增量，listen() 线程负责合并
+    - 每个任务维护一份最新快照和递增序号，订阅者只关心"比我手上更新的快照"
+    - 客户端读得慢时，中间的多次更新自然合并为一次推送
+    """
+
+    FINISHED = ("completed", "error")
+
+    def __init__(self, loader, retain_finished=120):
+        self._loader = loader            # task_id -> 任务完整状态（用于冷启动/断线重连）
+        self._retain_finished = retain_finished
+        self._lock = threading.Lock()
+        self._tasks = {}                 # task_id -> {"seq", "state", "cond", "finished_at"}
+        self._watchers = []              # 每次发布后回调 watcher(task_id)，供不阻塞线程的订阅方（SseServer）唤醒协程
+        # 序号在整个纪元内全局递增：任务被淘汰后重新加载，新快照的序号也大于已发出的任何事件 ID，
+        # 带旧 Last-Event-ID 重连的客户端能立即拿到最终状态
+        self._seq = itertools.count(1)
+        # 每次服务启动生成新纪元，旧的 Last-Event-ID 自动失效
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+
+    def _entry(self, task_id):
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                state = self._loader(task_id)
+                if state is None: return None
+                finished_at = time.time() if state.get("status") in self.FINISHED else None
+                entry = {"seq": next(self._seq), "state": state, "cond": threading.Condition(), "finished_at": finished_at}
+                self._tasks[task_id] = entry
+            return entry
+
+    def publish(self, task_id, delta):
+        """合并一条增量并唤醒该任务的订阅者"""
+        entry = self._entry(task_id)
+        if entry is None: return
+        with entry["cond"]:
+            _merge_delta(entry["state"], delta)
+            entry["seq"] = next(self._seq)
+            # 续跑的任务重新回到进行中，不能再按已结束淘汰
+            entry["finished_at"] = time.time() if entry["state"].get("status") in self.FINISHED else None
+            entry["cond"].notify_all()
+        for watcher in self._watchers:
+            watcher(task_id)
+        self._evict_finished()
+
+    def add_watcher(self, watcher):
+        self._watchers.append(watcher)
+
+    def wait(self, task_id, last_seq=0, timeout=15):
+        """
+        阻塞直到出现比 last_seq 更新的快照。
+        返回 (seq, state)；超时返回 (last_seq, None)；任务不存在返回 (None, None)
+        """
+        return self._read(task_id, last_seq, timeout)
+
+    def snapshot(self, task_id, last_seq=0):
+        """与 wait 相同，但不等待：没有更新的快照时立即返回 (last_seq, None)"""
+        return self._read(task_id, last_seq, None)
+
+    def _read(self, task_id, last_seq, timeout):
+        entry = self._entry(task_id)
+        if entry is None: return None, None
+        with entry["cond"]:
+            if entry["seq"] <= last_seq and timeout:
+                entry["cond"].wait(timeout)
+            if entry["seq"] <= last_seq:
+                return last_seq, None
+            return entry["seq"], copy.deepcopy(entry["state"])
+
+    def last_seq(self, last_event_id):
+        """解析 Last-Event-ID（<epoch>-<seq>）；其他纪元的 ID 视为从头订阅"""
+        epoch, _, seq = (last_event_id or "").partition("-")
+        return int(seq) if epoch == self.epoch and seq.isdigit() else 0
+
+    def listen(self, channel):
+        """
+        启动后台线程，持续消费工作进程发来的增量。
+        这是一个真正的系统线程（multiprocessing.Queue 的等待不会让出协程调度），
+        订阅者等待的是 Condition / 事件循环而不是磁盘，单个连接几乎不占 CPU
+        """
+        def _loop():
+            while True:
+                try:
+                    msg = channel.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                except (EOFError, OSError):
+                    break
+                if msg is None: break
+                try:
+                    self.publish(msg.pop("task_id"), msg)
+                except Exception as e:
+                    print(f"Progress dispatch error: {e}")
+
+        t = threading.Thread(target=_loop, name="progress-listener", daemon=True)
+        t.start()
+        return t
+
+    def _evict_finished(self):
+        cutoff = time.time() - self._retain_finished
+        with self._lock:
+            for task_id in [k for k, e in self._tasks.items() if e["finished_at"] and e["finished_at"] < cutoff]:
+                del self._tasks[task_id]
+
+
+def publish_delta(channel, task_id, **delta):
+    """工作进程侧：非阻塞投递一条增量，通道异常不影响生成流程"""
+    if channel is None: return
+    try:
+        channel.put_nowait({"task_id": task_id, **{k: v for k, v in delta.items() if v is not None}})
+    except (queue.Full, OSError, ValueError):
+        pass
+
+
+def _merge_delta(state, delta):
+    """None 表示未变化；需要清空的字段（如续跑时的旧 error）放在 clear 里"""
+    for key, value in delta.items():
+        if key == "clear":
+            for field in value: state[field] = None
+        elif key == "scene_updates":
+            scenes = state.setdefault("scenes_status", {})
+            for s_id, s_data in value.items():
+                scenes.setdefault(str(s_id), {}).update(s_data)
+        elif value is not None:
+            state[key] = value
+
+
+def not_found_event():
+    """任务不存在（或已被清理）时发送的终止事件，客户端据此关闭 EventSource，不再反复重连"""
+    return format_sse(data=json.dumps({"status": "error", "error": "任务不存在或已被清理"}))
+
+
+def format_sse(event_id=None, data=None, comment=None, retry=None):
+    """构造一帧 SSE 数据"""
+    lines = []
+    if comment is not None: lines.append(f": {comment}")
+    if retry is not None: lines.append(f"retry: {retry}")
+    if event_id is not None: lines.append(f"id: {event_id}")
+    if data is not None: lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,122 @@
+import re
+import json
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from service.progress import format_sse, not_found_event
+
+PATH_RE = re.compile(r'/api/progress/([0-9a-zA-Z-]+)')
+
+
+class SseServer:
+    """
+    独立的 SSE 进度服务：Web 进程内一个 asyncio 事件循环线程承载全部观看者，
+    每个连接只是一个协程，连接数不受 Werkzeug 线程数限制。
+
+    - ProgressBroker 每次发布后回调 notify()，经 call_soon_threadsafe 唤醒等待该任务的协程
+    - 协程读取快照用 broker.snapshot()，从不阻塞事件循环
+    - Flask 的 /api/progress/<task_id> 在启用后把 EventSource 重定向到这里（跨端口，需要 CORS 头）
+    """
+
+    def __init__(self, broker, host="0.0.0.0", port=8889, heartbeat=15):
+        self.broker = broker
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self._loop = None
+        self._waiters = {}      # task_id -> {asyncio.Event}
+        self._ready = threading.Event()
+
+    def start(self):
+        t = threading.Thread(target=self._run, name="sse-server", daemon=True)
+        t.start()
+        self._ready.wait(10)
+        self.broker.add_watcher(self.notify)
+        return self
+
+    def notify(self, task_id):
+        """任意线程调用：唤醒等待 task_id 的协程"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake, task_id)
+
+    def _wake(self, task_id):
+        for event in self._waiters.pop(task_id, ()):
+            event.set()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        print(f"📡 SSE 进度服务已启动: {self.host}:{self.port}")
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(server.serve_forever())
+        finally:
+            self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""): break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method, target = request_line[0], urlsplit(request_line[1])
+            match = PATH_RE.fullmatch(target.path)
+            if method == "OPTIONS":
+                # 带 Last-Event-ID 的跨域重连会先发预检请求
+                writer.write(self._head("204 No Content", {
+                    "Access-Control-Allow-Methods": "GET",
+                    "Access-Control-Allow-Headers": "Last-Event-ID, Cache-Control",
+                }))
+            elif method != "GET" or match is None:
+                writer.write(self._head("404 Not Found", {"Content-Length": "0"}))
+            else:
+                # 经 Flask 重定向过来时 Last-Event-ID 放在查询参数里
+                last_event_id = headers.get("last-event-id") or parse_qs(target.query).get("last_event_id", [""])[0]
+                await self._stream(writer, match.group(1), self.broker.last_seq(last_event_id))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, task_id, last_seq):
+        writer.write(self._head("200 OK", {
+            "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+        }))
+        writer.write(format_sse(retry=2000).encode())
+        while True:
+            seq, task = self.broker.snapshot(task_id, last_seq)
+            if seq is None:
+                writer.write(not_found_event().encode())
+                return
+            if task is None:
+                # 快照读取与登记在同一个事件循环里完成，发布方的唤醒回调一定排在登记之后
+                event = asyncio.Event()
+                self._waiters.setdefault(task_id, set()).add(event)
+                try:
+                    await asyncio.wait_for(event.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(format_sse(comment="heartbeat").encode())
+                    await writer.drain()
+                finally:
+                    waiters = self._waiters.get(task_id)
+                    if waiters is not None:
+                        waiters.discard(event)
+                        if not waiters: del self._waiters[task_id]
+                continue
+            last_seq = seq
+            writer.write(format_sse(event_id=f"{self.broker.epoch}-{seq}", data=json.dumps(task)).encode())
+            await writer.drain()
+            if task["status"] in ("completed", "error"): return
+
+    def _head(self, status, headers):
+        lines = [f"HTTP/1.1 {status}", "Access-Control-Allow-Origin: *", "Connection: close"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from service.task_store import _Transaction
+
+
+class RenderQueue:
+    """
+    场景渲染工作单元的租约队列（SQLite WAL，协调进程与各渲染节点共享同一个库文件）：
+
+        pending ──lease──> leased ──complete──> done
+           ^                 │
+           └─ 租约过期 / fail ┘ (超过 max_attempts 次后 -> failed)
+
+    - 渲染节点领取单元时获得 lease_seconds 的租约，渲染期间定期 heartbeat 续约
+    - 节点失联（进程被杀、机器宕机）后租约过期，单元自动回到可领取状态，被其他节点重新渲染
+    - complete / heartbeat 都校验持有者，过期后才完成的旧节点不会覆盖新节点的结果
+
+    单元的输入输出文件都是共享存储根目录下的相对路径，各节点可以挂载在不同位置。
+    SQLite 适合单机多进程或可靠的共享文件系统；跨机房部署时可按同样的接口换成 Redis 实现。
+    """
+
+    def __init__(self, path, lease_seconds=60, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_units_job ON units(job_id);
+            CREATE INDEX IF NOT EXISTS idx_units_status ON units(status, created);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL DEFAULT '{}',
+                unit_id TEXT,
+                last_seen REAL NOT NULL
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    # ---- 协调进程 ----
+
+    def publish(self, job_id, payload):
+        """发布一个工作单元，返回 unit_id"""
+        unit_id = f"{job_id}-{uuid.uuid4().hex[:8]}"
+        now = time.time()
+        with self._tx() as conn:
+            conn.execute("INSERT INTO units (unit_id, job_id, payload, created, updated) VALUES (?, ?, ?, ?, ?)",
+                         (unit_id, job_id, json.dumps(payload, ensure_ascii=False), now, now))
+        return unit_id
+
+    def get(self, unit_id):
+        """返回 {"status", "worker", "attempts", "result", "error"}；单元已被清除时返回 None"""
+        row = self._conn().execute(
+            "SELECT status, worker, attempts, result, error, lease_until FROM units WHERE unit_id=?", (unit_id,)
+        ).fetchone()
+        if row is None: return None
+        status, worker, attempts, result, error, lease_until = row
+        if status == "leased" and lease_until < time.time():
+            status = "expired"
+        return {"status": status, "worker": worker, "attempts": attempts,
+                "result": json.loads(result) if result else None, "error": error}
+
+    def purge(self, job_id):
+        """删除任务的全部单元；仍在渲染的节点下次续约失败后放弃结果"""
+        with self._tx() as conn:
+            conn.execute("DELETE FROM units WHERE job_id=?", (job_id,))
+
+    def live_workers(self, within=None):
+        """最近 within 秒内有心跳的节点"""
+        cutoff = time.time() - (within or self.lease_seconds)
+        return [{"worker_id": w, "unit_id": u, "last_seen": t, **json.loads(info)} for w, info, u, t in self._conn().execute(
+            "SELECT worker_id, info, unit_id, last_seen FROM workers WHERE last_seen >= ?", (cutoff,)
+        )]
+
+    # ---- 渲染节点 ----
+
+    def lease(self, worker_id, job_id=None):
+        """
+        领取一个可渲染的单元（pending，或租约已过期的 leased），返回 (unit_id, payload) 或 None。
+        job_id 给定时只领取该任务的单元
+        """
+        now = time.time()
+        job_filter = "AND job_id=?" if job_id else ""
+        with self._tx() as conn:
+            # 超过重试次数的过期单元直接判定失败，不再派发
+            conn.execute(
+                "UPDATE units SET status='failed', error=COALESCE(error, '渲染节点多次失联'), updated=? "
+                "WHERE status='leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                f"SELECT unit_id, payload FROM units WHERE (status='pending' OR (status='leased' AND lease_until < ?)) "
+                f"{job_filter} ORDER BY created LIMIT 1",
+                (now, job_id) if job_id else (now,)
+            ).fetchone()
+            if row is None: return None
+            conn.execute(
+                "UPDATE units SET status='leased', worker=?, lease_until=?, attempts=attempts+1, updated=? WHERE unit_id=?",
+                (worker_id, now + self.lease_seconds, now, row[0])
+            )
+            self._touch(conn, worker_id, row[0], now)
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, worker_id, unit_id=None, info=None):
+        """节点心跳；持有单元时顺带续约，返回 False 表示租约已丢失（过期被他人领走或任务已撤回）"""
+        now = time.time()
+        with self._tx() as conn:
+            self._touch(conn, worker_id, unit_id, now, info)
+            if unit_id is None: return True
+            cur = conn.execute(
+                "UPDATE units SET lease_until=?, updated=? WHERE unit_id=? AND worker=? AND status='leased'",
+                (now + self.lease_seconds, now, unit_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, worker_id, unit_id, result):
+        with self._tx() as conn:
+            cur = conn.execute(
+                "UPDATE units SET status='done', result=?, lease_until=NULL, updated=? "
+                "WHERE unit_id=? AND worker=? AND status='leased'",
+                (json.dumps(result, ensure_ascii=False), time.time(), unit_id, worker_id)
+            )
+            self._touch(conn, worker_id, None, time.time())
+            return cur.rowcount == 1
+
+    def fail(self, worker_id, unit_id, error):
+        """渲染出错：未超过重试次数时放回队列，否则标记失败"""
+        now = time.time()
+        with self._tx() as conn:
+            conn.execute(
+                "UPDATE units SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error=?, worker=NULL, lease_until=NULL, updated=? WHERE unit_id=? AND worker=? AND status='leased'",
+                (self.max_attempts, str(error)[:500], now, unit_id, worker_id)
+            )
+            self._touch(conn, worker_id, None, now)
+
+    def _touch(self, conn, worker_id, unit_id, now, info=None):
+        conn.execute(
+            "INSERT INTO workers (worker_id, info, unit_id, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET unit_id=excluded.unit_id, last_seen=excluded.last_seen"
+            + (", info=excluded.info" if info else ""),
+            (worker_id, json.dumps(info or {}, ensure_ascii=False), unit_id, now)
+        )
@@ -0,0 +1,129 @@
+"""
+远程场景渲染节点：从共享队列领取场景单元，在本机编码后把成片写回共享存储
+
+    python -m service.render_worker --queue /mnt/render/queue.db --shared /mnt/render/shared --threads 8
+
+各节点需要挂载同一个共享目录（NFS 等），--queue 指向协调进程的 RENDER_QUEUE_PATH，
+--shared 指向 RENDER_SHARED_DIR 在本机的挂载位置；烧录字幕用到的字体需在节点上安装。
+"""
+import os
+import sys
+import time
+import uuid
+import signal
+import socket
+import argparse
+import threading
+
+
+def render_unit(payload, shared_dir, synths, threads=0, preference=None):
+    """
+    渲染一个单元，返回写回协调进程的结果。
+    synths 缓存按 (分辨率, 帧率, 运动引擎, 档位) 复用的合成器，编码器探测只做一次
+    """
+    from generator.encoder import Encoder
+    from generator.synthesis import VideoSynthesizer
+
+    key = (payload["resolution"], payload["fps"], payload["motion_engine"], payload["profile"])
+    synth = synths.get(key)
+    if synth is None:
+        encoder = Encoder(payload["profile"], threads=threads, preference=preference)
+        synth = synths[key] = VideoSynthesizer(payload["resolution"].replace("x", ":"), payload["fps"],
+                                               motion_engine=payload["motion_engine"], encoder=encoder)
+
+    def shared(rel):
+        return os.path.join(shared_dir, rel) if rel else None
+
+    output = shared(payload["output"])
+    # 先写临时文件再改名，协调进程不会读到半个文件
+    partial = f"{output}.{uuid.uuid4().hex[:8]}.part.mp4"
+    frames = int(payload["duration"] * payload["fps"])
+    t0 = time.perf_counter()
+    try:
+        synth.merge_scene(shared(payload["image"]), shared(payload["audio"]), shared(payload["ass"]), partial,
+                          duration=payload["duration"])
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial): os.remove(partial)
+    return {"output": payload["output"], "encoder": synth.encoder.name, "frames": frames,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+class RenderWorker:
+    """领取 -> 续约 -> 渲染 -> 回报 的循环；协调进程在没有远程节点在线时也用它就地渲染自己的单元"""
+
+    def __init__(self, queue, shared_dir, worker_id=None, threads=0, preference=None, role="worker"):
+        self.queue = queue
+        self.shared_dir = shared_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.threads = threads
+        self.preference = preference
+        self.info = {"host": socket.gethostname(), "pid": os.getpid(), "role": role}
+        self._synths = {}
+        self.queue.heartbeat(self.worker_id, info=self.info)
+
+    def run_one(self, job_id=None):
+        """处理一个单元；队列中没有可领取的单元时返回 False"""
+        leased = self.queue.lease(self.worker_id, job_id=job_id)
+        if leased is None:
+            self.queue.heartbeat(self.worker_id)
+            return False
+        unit_id, payload = leased
+        lost = threading.Event()
+        done = threading.Event()
+
+        def keep_alive():
+            while not done.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(self.worker_id, unit_id):
+                    lost.set()
+                    return
+
+        beater = threading.Thread(target=keep_alive, name=f"lease-{unit_id}", daemon=True)
+        beater.start()
+        try:
+            result = render_unit(payload, self.shared_dir, self._synths, threads=self.threads, preference=self.preference)
+        except Exception as e:
+            done.set()
+            print(f"[{self.worker_id}] ❌ 单元 {unit_id} 渲染失败: {e}")
+            self.queue.fail(self.worker_id, unit_id, e)
+            return True
+        done.set()
+        beater.join()
+        # 租约已丢失（超时被重新派发或任务已结束）：结果作废，不覆盖别的节点
+        if lost.is_set() or not self.queue.complete(self.worker_id, unit_id, result):
+            print(f"[{self.worker_id}] ⚠️ 单元 {unit_id} 的租约已失效，丢弃结果")
+        return True
+
+    def run_forever(self, stop_event, poll_interval=1.0):
+        print(f"🖥️ 渲染节点 {self.worker_id} 已启动，共享目录: {self.shared_dir}")
+        while not stop_event.is_set():
+            if not self.run_one():
+                stop_event.wait(poll_interval)
+        print(f"🖥️ 渲染节点 {self.worker_id} 已退出")
+
+
+def main():
+    import config
+    from service.render_queue import RenderQueue
+
+    parser = argparse.ArgumentParser(description="远程场景渲染节点")
+    parser.add_argument("--queue", default=config.RENDER_QUEUE_PATH, help="共享队列库文件")
+    parser.add_argument("--shared", default=config.RENDER_SHARED_DIR, help="共享存储在本机的挂载目录")
+    parser.add_argument("--threads", type=int, default=0, help="编码线程数，0 交给编码器决定")
+    parser.add_argument("--worker-id", default=None)
+    args = parser.parse_args()
+
+    queue = RenderQueue(args.queue, lease_seconds=config.RENDER_LEASE_SECONDS, max_attempts=config.RENDER_MAX_ATTEMPTS)
+    worker = RenderWorker(queue, args.shared, worker_id=args.worker_id, threads=args.threads,
+                          preference=config.ENCODER_PREFERENCE)
+    stop = threading.Event()
+    # 收到 SIGTERM 时渲染完手上的单元再退出
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        worker.run_forever(stop)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """超出排队或资源预算，需要客户端稍后重试"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    生成任务调度器（运行在 Web 进程内）：
+    - 有界队列 + 准入控制：队列满、单客户端排队过多、CPU/内存超预算时拒绝
+    - 按优先级分层（interactive 先于 batch），同层内按客户端轮转，避免单个客户端霸占
+    - 只在工作进程有空闲时派发，并为每个排队任务计算位置和预计等待时间
+    """
+
+    PRIORITIES = ("interactive", "batch")
+
+    def __init__(self, dispatch, capacity, max_queue=50, max_per_client=10, cpu_budget=0.9, min_free_mem_mb=1024,
+                 default_job_seconds=120, on_queue_update=None):
+        self.dispatch = dispatch                # (task_id, payload) -> None，交给进程池执行
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.cpu_budget = cpu_budget
+        self.min_free_mem_mb = min_free_mem_mb
+        self.on_queue_update = on_queue_update  # (task_id, position, eta_seconds) -> None
+
+        self._lock = threading.Lock()
+        # priority -> OrderedDict(client_key -> deque[(task_id, payload)])
+        self._queues = {p: OrderedDict() for p in self.PRIORITIES}
+        self._running = {}                      # task_id -> 开始时间
+        self._avg_job_seconds = default_job_seconds
+        self._published = {}                    # task_id -> 上次推送的 (position, eta)，避免重复写状态
+
+    def submit(self, task_id, payload, client_key="anonymous", priority="interactive"):
+        """排队一个任务；超出预算时抛出 AdmissionRejected"""
+        if priority not in self.PRIORITIES: priority = self.PRIORITIES[0]
+        with self._lock:
+            self._check_admission(client_key)
+            self._queues[priority].setdefault(client_key, deque()).append((task_id, payload))
+        self._pump()
+
+    def cancel(self, task_id):
+        """移除尚未派发的任务，返回是否命中"""
+        with self._lock:
+            found = self._remove_pending(task_id)
+        if found:
+            self._published.pop(task_id, None)
+            self._publish_positions()
+        return found
+
+    def _remove_pending(self, task_id):
+        for clients in self._queues.values():
+            for client_key, jobs in clients.items():
+                for job in jobs:
+                    if job[0] == task_id:
+                        jobs.remove(job)
+                        if not jobs: del clients[client_key]
+                        return True
+        return False
+
+    def job_finished(self, task_id):
+        with self._lock:
+            started = self._running.pop(task_id, None)
+            if started:
+                # 指数滑动平均，用于估算排队等待时间
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (time.time() - started)
+        self._pump()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": {p: sum(len(j) for j in c.values()) for p, c in self._queues.items()},
+                "running": len(self._running),
+                "capacity": self.capacity,
+                "avg_job_seconds": round(self._avg_job_seconds, 1),
+            }
+
+    def _queued_count(self):
+        return sum(len(j) for c in self._queues.values() for j in c.values())
+
+    def _check_admission(self, client_key):
+        queued = self._queued_count()
+        retry_after = self._estimate_wait(queued)
+        if queued >= self.max_queue:
+            raise AdmissionRejected("排队任务已满", retry_after)
+        client_queued = sum(len(c.get(client_key, ())) for c in self._queues.values())
+        if client_queued >= self.max_per_client:
+            raise AdmissionRejected("该客户端排队任务过多", retry_after)
+
+        load = _cpu_load_ratio()
+        if load is not None and self.cpu_budget and load > self.cpu_budget:
+            raise AdmissionRejected(f"CPU 负载过高 ({load:.0%})", max(retry_after, 30))
+        free_mb = _available_memory_mb()
+        if free_mb is not None and self.min_free_mem_mb and free_mb < self.min_free_mem_mb:
+            raise AdmissionRejected(f"可用内存不足 ({free_mb:.0f}MB)", max(retry_after, 30))
+
+    def _estimate_wait(self, position):
+        """第 position 个排队任务（从 0 开始）预计多久后开始执行"""
+        rounds = math.floor(position / max(1, self.capacity))
+        if len(self._running) < self.capacity and position < self.capacity - len(self._running):
+            return 0
+        return int((rounds + 0.5) * self._avg_job_seconds)
+
+    def _ordered_pending(self):
+        """按实际派发顺序展开排队任务：优先级优先，同级按客户端轮转"""
+        order = []
+        for priority in self.PRIORITIES:
+            lanes = [list(jobs) for jobs in self._queues[priority].values()]
+            depth = max((len(l) for l in lanes), default=0)
+            for i in range(depth):
+                order += [lane[i] for lane in lanes if i < len(lane)]
+        return order
+
+    def _next_job(self):
+        for priority in self.PRIORITIES:
+            clients = self._queues[priority]
+            if not clients: continue
+            client_key, jobs = next(iter(clients.items()))
+            job = jobs.popleft()
+            # 轮转：本客户端移到队尾
+            del clients[client_key]
+            if jobs: clients[client_key] = jobs
+            return job
+        return None
+
+    def _pump(self):
+        dispatched = []
+        with self._lock:
+            while len(self._running) < self.capacity:
+                job = self._next_job()
+                if job is None: break
+                self._running[job[0]] = time.time()
+                dispatched.append(job)
+        for task_id, payload in dispatched:
+            if self.on_queue_update: self.on_queue_update(task_id, 0, 0)
+            self._published.pop(task_id, None)
+            self.dispatch(task_id, payload)
+        self._publish_positions()
+
+    def _publish_positions(self):
+        if not self.on_queue_update: return
+        with self._lock:
+            order = self._ordered_pending()
+            updates = [(job[0], pos + 1, self._estimate_wait(pos)) for pos, job in enumerate(order)]
+        for task_id, position, eta in updates:
+            if self._published.get(task_id) == (position, eta): continue
+            self._published[task_id] = (position, eta)
+            self.on_queue_update(task_id, position, eta)
+
+
+def _cpu_load_ratio():
+    """1 分钟平均负载 / 核心数"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+def _available_memory_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
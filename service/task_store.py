@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+class TaskStore(ABC):
+    """
+    任务状态存储接口。
+    update_task 只提交本次变化的字段和场景增量，由后端决定如何落盘；
+    值为 None（video_path / error 为空）的字段视为未变化，需要清空时放进 clear。
+    """
+
+    @abstractmethod
+    def get_task(self, task_id): ...
+
+    @abstractmethod
+    def load_all(self): ...
+
+    @abstractmethod
+    def put_task(self, task_id, task_data): ...
+
+    @abstractmethod
+    def update_task(self, task_id, progress=None, status=None, scene_updates=None, clear=(), **fields): ...
+
+    @abstractmethod
+    def delete_task(self, task_id): ...
+
+    def prune(self, max_age=None, max_count=None):
+        """清理过期历史任务，返回删除数量"""
+        return 0
+
+
+class JsonTaskStore(TaskStore):
+    """旧版单文件 tasks.json 后端（每次更新整文件重写，仅用于兼容）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if not os.path.exists(self.path): return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except: return {}
+
+    def get_task(self, task_id):
+        return self.load_all().get(task_id)
+
+    def _write_all(self, tasks):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(tasks, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def put_task(self, task_id, task_data):
+        with self._lock:
+            tasks = self.load_all()
+            tasks[task_id] = task_data
+            self._write_all(tasks)
+
+    def update_task(self, task_id, progress=None, status=None, scene_updates=None, clear=(), **fields):
+        with self._lock:
+            tasks = self.load_all()
+            task = tasks.get(task_id, {})
+            _apply_update(task, progress, status, scene_updates, fields, clear)
+            tasks[task_id] = task
+            self._write_all(tasks)
+            return task
+
+    def delete_task(self, task_id):
+        with self._lock:
+            tasks = self.load_all()
+            if tasks.pop(task_id, None) is not None:
+                self._write_all(tasks)
+
+    def prune(self, max_age=None, max_count=None):
+        with self._lock:
+            tasks = self.load_all()
+            keep = _select_retained(tasks, max_age, max_count)
+            removed = len(tasks) - len(keep)
+            if removed:
+                self._write_all({k: tasks[k] for k in keep})
+            return removed
+
+
+class SqliteTaskStore(TaskStore):
+    """
+    SQLite WAL 后端：
+    - 任务主字段一行，场景状态按 (task_id, scene_id) 分行存储
+    - 每次更新只改动涉及的行，成本与历史任务数量无关
+    - WAL + busy_timeout 保证多进程并发写入安全
+    """
+
+    # 固定列，其余字段进入 extra JSON
+    COLUMNS = ("status", "progress", "video_path", "error", "last_update")
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._init_schema()
+
+    def _conn(self):
+        # 连接不能跨 fork 复用，按 (进程, 线程) 各建一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT,
+                progress INTEGER,
+                video_path TEXT,
+                error TEXT,
+                last_update REAL,
+                extra TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_last_update ON tasks(last_update);
+            CREATE TABLE IF NOT EXISTS scenes (
+                task_id TEXT NOT NULL,
+                scene_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (task_id, scene_id)
+            );
+        """)
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    def get_task(self, task_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT status, progress, video_path, error, last_update, extra FROM tasks WHERE task_id=?",
+            (task_id,)
+        ).fetchone()
+        if row is None: return None
+        task = json.loads(row[5])
+        task.update(dict(zip(self.COLUMNS, row[:5])))
+        task["scenes_status"] = {
+            s_id: json.loads(data) for s_id, data in
+            conn.execute("SELECT scene_id, data FROM scenes WHERE task_id=?", (task_id,))
+        }
+        return task
+
+    def load_all(self):
+        ids = [r[0] for r in self._conn().execute("SELECT task_id FROM tasks")]
+        return {task_id: self.get_task(task_id) for task_id in ids}
+
+    def put_task(self, task_id, task_data):
+        task_data = dict(task_data)
+        scenes = task_data.pop("scenes_status", None) or {}
+        cols = [task_data.pop(c, None) for c in self.COLUMNS]
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, progress, video_path, error, last_update, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, *cols, json.dumps(task_data))
+            )
+            conn.execute("DELETE FROM scenes WHERE task_id=?", (task_id,))
+            conn.executemany(
+                "INSERT INTO scenes (task_id, scene_id, data) VALUES (?, ?, ?)",
+                [(task_id, str(s_id), json.dumps(s_data)) for s_id, s_data in scenes.items()]
+            )
+
+    def update_task(self, task_id, progress=None, status=None, scene_updates=None, clear=(), **fields):
+        cols = {"last_update": time.time()}
+        if status: cols["status"] = status
+        if progress is not None: cols["progress"] = progress
+        for c in ("video_path", "error"):
+            if fields.get(c): cols[c] = fields.pop(c)
+        extra = {k: v for k, v in fields.items() if v is not None and k not in self.COLUMNS}
+        # json_patch 中的 null 即删除该字段
+        for k in clear:
+            if k in self.COLUMNS: cols[k] = None
+            else: extra[k] = None
+
+        with self._tx() as conn:
+            conn.execute("INSERT OR IGNORE INTO tasks (task_id) VALUES (?)", (task_id,))
+            assignments = ", ".join(f"{c}=?" for c in cols)
+            params = list(cols.values())
+            if extra:
+                assignments += ", extra=json_patch(extra, ?)"
+                params.append(json.dumps(extra))
+            conn.execute(f"UPDATE tasks SET {assignments} WHERE task_id=?", (*params, task_id))
+
+            # 场景状态按行增量合并
+            for s_id, s_data in (scene_updates or {}).items():
+                conn.execute(
+                    "INSERT INTO scenes (task_id, scene_id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(task_id, scene_id) DO UPDATE SET data=json_patch(data, excluded.data)",
+                    (task_id, str(s_id), json.dumps(s_data))
+                )
+        return cols
+
+    def delete_task(self, task_id):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM scenes WHERE task_id=?", (task_id,))
+            conn.execute("DELETE FROM tasks WHERE task_id=?", (task_id,))
+
+    def prune(self, max_age=None, max_count=None):
+        """删除过期和超出数量上限的已结束任务，并在删除较多时回收空间"""
+        conn = self._conn()
+        finished = "status NOT IN ('pending', 'running')"
+        statuses = dict(conn.execute("SELECT task_id, status FROM tasks"))
+        batches = {task_id: json.loads(extra) for task_id, extra in
+                   conn.execute("SELECT task_id, extra FROM tasks WHERE status='batch'")}
+        live = _live_batch_members(batches, statuses)
+        expired = []
+        if max_age:
+            expired += [r[0] for r in conn.execute(
+                f"SELECT task_id FROM tasks WHERE {finished} AND last_update < ?",
+                (time.time() - max_age,)
+            )]
+        if max_count:
+            expired += [r[0] for r in conn.execute(
+                f"SELECT task_id FROM tasks WHERE {finished} ORDER BY last_update DESC LIMIT -1 OFFSET ?",
+                (max_count,)
+            )]
+        expired = list(set(expired) - live)
+        if not expired: return 0
+
+        with self._tx() as conn:
+            conn.executemany("DELETE FROM scenes WHERE task_id=?", [(t,) for t in expired])
+            conn.executemany("DELETE FROM tasks WHERE task_id=?", [(t,) for t in expired])
+        if len(expired) >= 1000:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        return len(expired)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE 事务：提前拿写锁，避免多进程下的升级死锁"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def _apply_update(task, progress, status, scene_updates, fields, clear=()):
+    if status: task["status"] = status
+    if progress is not None: task["progress"] = progress
+    for k, v in fields.items():
+        if v is not None and (v or k not in ("video_path", "error")): task[k] = v
+    for k in clear:
+        task[k] = None
+    task["last_update"] = time.time()
+
+    if "scenes_status" not in task: task["scenes_status"] = {}
+    for s_id, s_data in (scene_updates or {}).items():
+        _merge_patch(task["scenes_status"].setdefault(str(s_id), {}), s_data)
+    return task
+
+
+def _merge_patch(target, patch):
+    """与 SQLite json_patch 相同的合并语义（RFC 7396）：嵌套对象逐层合并，None 删除字段"""
+    for k, v in patch.items():
+        if v is None:
+            target.pop(k, None)
+        elif isinstance(v, dict) and isinstance(target.get(k), dict):
+            _merge_patch(target[k], v)
+        else:
+            target[k] = v
+    return target
+
+
+def _live_batch_members(batches, statuses):
+    """仍有子任务未结束的批次：批次记录、预热任务与全部子任务都不清理（批次记录本身不会更新 last_update）"""
+    live = set()
+    for batch_id, batch in batches.items():
+        members = [m for m in (batch.get("prewarm_task"), *batch.get("task_ids", [])) if m]
+        if any(statuses.get(m) in ("pending", "running") for m in members):
+            live.update((batch_id, *members))
+    return live
+
+
+def _select_retained(tasks, max_age, max_count):
+    active = {k for k, t in tasks.items() if t.get("status") in ("pending", "running")}
+    active |= _live_batch_members(
+        {k: t for k, t in tasks.items() if t.get("status") == "batch"},
+        {k: t.get("status") for k, t in tasks.items()}
+    )
+    finished = sorted(
+        (k for k in tasks if k not in active),
+        key=lambda k: tasks[k].get("last_update") or 0, reverse=True
+    )
+    if max_age:
+        cutoff = time.time() - max_age
+        finished = [k for k in finished if (tasks[k].get("last_update") or 0) >= cutoff]
+    if max_count:
+        finished = finished[:max_count]
+    return active | set(finished)
+
+
+def create_task_store(backend, path):
+    if backend == "json":
+        return JsonTaskStore(path)
+    return SqliteTaskStore(path)
@@ -0,0 +1,206 @@
+import os
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+
+
+class JobCancelled(Exception):
+    """任务被用户中止（由生成流程在检查点抛出）"""
+    pass
+
+
+class WorkerPool:
+    """
+    常驻预热的生成进程池：
+    - 每个进程启动时执行一次 initializer（加载 Whisper、导入生成器），之后循环从自己的队列取任务
+    - 任务先进入池内积压，由池派发给空闲进程；派发时即登记归属，进程在领取后、开始前死亡也能找回任务
+    - 进程执行满 max_jobs 个任务或 RSS 超过 max_rss_mb 后自行退出，由监督线程补充新进程
+    - 中止任务只设置对应进程的 cancel_event，由生成流程在检查点自行退出，进程保持热状态
+    """
+
+    def __init__(self, target, size=2, max_jobs=20, max_rss_mb=3072, initializer=None, worker_kwargs=None,
+                 on_job_start=None, on_job_done=None):
+        self.target = target
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.initializer = initializer
+        self.worker_kwargs = worker_kwargs or {}
+        self.on_job_start = on_job_start
+        self.on_job_done = on_job_done
+
+        self._events = multiprocessing.Queue()
+        self._lock = threading.Lock()
+        self._workers = {}          # worker_id -> {"process", "cancel", "jobs", "task_id", "retiring"}
+        self._backlog = deque()     # 已提交、尚未派发给进程的 (task_id, kwargs)
+        self._pending_cancel = set()
+        self._next_id = 0
+        self._busy = 0
+        self._stopped = False
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn()
+        threading.Thread(target=self._supervise, name="worker-pool-supervisor", daemon=True).start()
+        return self
+
+    def submit(self, task_id, **kwargs):
+        with self._lock:
+            self._busy += 1
+            self._backlog.append((task_id, kwargs))
+        self._dispatch()
+
+    def cancel(self, task_id):
+        """中止任务：已派发的通知其进程，未派发的在派发时立即标记中止"""
+        with self._lock:
+            for worker in self._workers.values():
+                if worker["task_id"] == task_id:
+                    worker["cancel"].set()
+                    return True
+            # 只记录确实在积压中等待的任务；未知或已结束的 id 记下来会误伤之后同 id 的续跑
+            if any(job[0] == task_id for job in self._backlog):
+                self._pending_cancel.add(task_id)
+            return False
+
+    def idle_slots(self):
+        with self._lock:
+            return max(0, self.size - self._busy)
+
+    def shutdown(self):
+        self._stopped = True
+        with self._lock:
+            for worker in self._workers.values():
+                worker["jobs"].put(None)
+
+    def _dispatch(self):
+        """把积压任务逐个派发给空闲进程，派发即登记 worker["task_id"]"""
+        with self._lock:
+            while self._backlog:
+                worker = next((w for w in self._workers.values()
+                               if w["task_id"] is None and not w["retiring"] and w["process"].is_alive()), None)
+                if worker is None: return
+                task_id, kwargs = self._backlog.popleft()
+                worker["task_id"] = task_id
+                worker["cancel"].clear()
+                if task_id in self._pending_cancel:
+                    self._pending_cancel.discard(task_id)
+                    worker["cancel"].set()
+                worker["jobs"].put((task_id, kwargs))
+
+    def _spawn(self):
+        with self._lock:
+            worker_id = self._next_id
+            self._next_id += 1
+            cancel = multiprocessing.Event()
+            jobs = multiprocessing.Queue()
+            p = multiprocessing.Process(
+                target=_worker_main,
+                args=(worker_id, jobs, self._events, cancel, self.target, self.initializer,
+                      self.worker_kwargs, self.max_jobs, self.max_rss_mb),
+                daemon=True
+            )
+            p.start()
+            self._workers[worker_id] = {"process": p, "cancel": cancel, "jobs": jobs, "task_id": None, "retiring": False}
+        print(f"[Pool] 🔥 工作进程 #{worker_id} 已启动 (pid={p.pid})")
+        self._dispatch()
+
+    def _supervise(self):
+        while not self._stopped:
+            try:
+                self._handle_event(*self._events.get(timeout=1.0))
+                # 先处理完已到达的事件再检查存活：进程退出前发出的 done 不会被误判为任务丢失
+                while True:
+                    self._handle_event(*self._events.get_nowait())
+            except queue.Empty:
+                pass
+            self._reap_dead_workers()
+
+    def _handle_event(self, kind, worker_id, payload):
+        with self._lock:
+            worker = self._workers.get(worker_id)
+        if worker is None: return
+
+        if kind == "start":
+            if self.on_job_start: self.on_job_start(payload)
+        elif kind == "done":
+            # payload 为回收原因：进程做完这个任务后自行退出，不再派发
+            if payload:
+                print(f"[Pool] ♻️ 工作进程 #{worker_id} 回收 ({payload})")
+                with self._lock:
+                    worker["retiring"] = True
+            self._finish_job(worker, lost=False)
+            self._dispatch()
+
+    def _finish_job(self, worker, lost):
+        with self._lock:
+            task_id, worker["task_id"] = worker["task_id"], None
+            self._busy = max(0, self._busy - 1)
+        if task_id and self.on_job_done: self.on_job_done(task_id, lost)
+
+    def _reap_dead_workers(self):
+        with self._lock:
+            dead = [w_id for w_id, w in self._workers.items() if not w["process"].is_alive()]
+        for worker_id in dead:
+            worker = self._workers[worker_id]
+            worker["process"].join(timeout=5)
+            if worker["task_id"]:
+                # 进程异常退出（如被 OOM Kill），已派发给它的任务（无论是否已开始）随之丢失
+                print(f"[Pool] 💥 工作进程 #{worker_id} 异常退出，任务 {worker['task_id']} 丢失")
+                self._finish_job(worker, lost=True)
+            self._retire(worker_id)
+
+    def _retire(self, worker_id):
+        with self._lock:
+            if self._workers.pop(worker_id, None) is None: return
+        if not self._stopped:
+            self._spawn()
+
+
+def _worker_main(worker_id, jobs, events, cancel, target, initializer, worker_kwargs, max_jobs, max_rss_mb):
+    try:
+        if initializer: initializer()
+    except Exception:
+        traceback.print_exc()
+
+    jobs_done = 0
+    while True:
+        job = jobs.get()
+        if job is None: return
+        task_id, kwargs = job
+
+        # cancel_event 由池在派发时复位，这里不能清除（派发前已请求的中止会丢失）
+        events.put(("start", worker_id, task_id))
+        try:
+            target(task_id, cancel_event=cancel, **worker_kwargs, **kwargs)
+        except Exception:
+            traceback.print_exc()
+
+        jobs_done += 1
+        rss = current_rss_mb()
+        retire = None
+        if max_jobs and jobs_done >= max_jobs:
+            retire = f"已执行 {jobs_done} 个任务"
+        elif max_rss_mb and rss > max_rss_mb:
+            retire = f"RSS {rss:.0f}MB 超过上限"
+        # 回收原因随 done 一起发出，池不会在退出前再派发任务给它
+        events.put(("done", worker_id, retire))
+        if retire: return
+
+
+def current_rss_mb():
+    """当前进程常驻内存 (MB)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
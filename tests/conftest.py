@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试从任意目录运行时都能导入仓库根目录下的 generator / service
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
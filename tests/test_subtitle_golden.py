@@ -0,0 +1,48 @@
+"""
+字幕 ASS 金标准：固定输入重新生成字幕，与 tests/fixtures/subtitles 下的文件逐字节比较。
+字宽固定走估算模式（不读本机字体），结果与机器上装了哪些字体无关。
+
+改动了排版或特效、确认新输出正确后重新生成金标准：
+    UPDATE_GOLDEN=1 python -m pytest tests/test_subtitle_golden.py
+"""
+import os
+
+import pytest
+
+import generator.text_layout as text_layout
+from generator.animation import AnimationGenerator
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "subtitles")
+TEXT = "今天我们来聊一聊 AI 如何改变视频创作，让每个人都能轻松做出好作品！"
+TIMESTAMPS = [{"start": 0.3, "end": 4.0}]
+DURATION = 4.2
+
+CASES = [
+    (compiler, resolution, style)
+    for compiler in AnimationGenerator.SUBTITLE_COMPILERS
+    for resolution in ("1080x1920", "1920x1080")
+    for style in AnimationGenerator.SUBTITLE_PRESETS
+]
+
+
+@pytest.fixture(autouse=True)
+def estimated_metrics(monkeypatch):
+    monkeypatch.setattr(text_layout, "_load_font_table", lambda font_name: None)
+    text_layout.get_glyph_metrics.cache_clear()
+    yield
+    text_layout.get_glyph_metrics.cache_clear()
+
+
+@pytest.mark.parametrize("compiler,resolution,style", CASES)
+def test_scene_subtitles_match_golden(tmp_path, compiler, resolution, style):
+    name = f"{compiler}_{resolution}_{style}.ass"
+    output = tmp_path / name
+    AnimationGenerator(resolution, 30, compiler=compiler).prepare_subtitles(
+        TEXT, TIMESTAMPS, str(output), duration=DURATION, style_id=style
+    )
+    golden = os.path.join(FIXTURES, name)
+    if os.environ.get("UPDATE_GOLDEN"):
+        with open(golden, "wb") as f:
+            f.write(output.read_bytes())
+    with open(golden, "rb") as f:
+        assert output.read_bytes() == f.read(), f"{name} 与金标准不一致"
@@ -34,6 +34,9 @@ const imgModelIdInput = document.getElementById('imgModelIdInput');
 const imgLocalPathInput = document.getElementById('imgLocalPathInput');
 
 let currentAudio = null;
+let streamPlayer = null;
+// 进度流连续重连失败的上限（retry 为 2 秒，约 20 秒后放弃）
+const MAX_SSE_RECONNECTS = 10;
 
 // 初始化
 async function init() {
@@ -223,6 +226,7 @@ async function startGeneration() {
   if (!text) { alert('请输入文案内容'); return; }
 
   setRunningUI(true);
+  stopStreamPreview();
   resultSection.classList.add('hidden');
   feedContainer.innerHTML = '';
 
@@ -249,6 +253,8 @@ async function startGeneration() {
         bgm: bgmSelect.value,
         subtitle_style: subtitleStyleSelect.value,
         font_name: fontSelect.value,
+        // 基于上一次成功的任务重新生成，未改动的场景由服务端直接复用
+        base_task_id: localStorage.getItem('lastTaskId') || undefined,
         image_config: {
           provider: modelConfig.provider,
           api_key: modelConfig.apiKey,
@@ -314,11 +320,14 @@ function addFeedItem(sceneId, data) {
 function trackProgress(taskId) {
   return new Promise((resolve, reject) => {
     const eventSource = new EventSource(`/api/progress/${taskId}`);
+    let failedReconnects = 0;
     eventSource.onmessage = (event) => {
+      failedReconnects = 0;
       const data = JSON.parse(event.data);
       if (data.error) {
         eventSource.close();
         localStorage.removeItem('activeTaskId');
+        stopStreamPreview();
         addFeedItem('err', { text: '系统告警', step: data.error, done: false });
         reject(new Error(data.error));
         return;
@@ -333,9 +342,12 @@ function trackProgress(taskId) {
         });
       }
 
+      if (data.stream_url && data.status === 'running') startStreamPreview(data.stream_url);
+
       if (data.status === 'completed') {
         eventSource.close();
         localStorage.removeItem('activeTaskId');
+        localStorage.setItem('lastTaskId', taskId);
         onGenerationComplete(taskId);
         resolve();
       } else if (data.status === 'error') {
@@ -346,15 +358,51 @@ function trackProgress(taskId) {
       }
     };
     eventSource.onerror = () => {
-      eventSource.close();
-      headerStatus.textContent = '连接中断';
+      // 浏览器会携带 Last-Event-ID 自动重连；连续多次重连都收不到任何消息（服务端不可达）时放弃
+      failedReconnects += 1;
+      if (eventSource.readyState === EventSource.CLOSED || failedReconnects >= MAX_SSE_RECONNECTS) {
+        eventSource.close();
+        headerStatus.textContent = '连接中断';
+        setRunningUI(false);
+        reject(new Error('进度连接中断'));
+        return;
+      }
+      headerStatus.textContent = '重连中...';
     };
   });
 }
 
+// 边渲染边播放：第一个场景完成后即可观看，播放列表随渲染进度增长
+function startStreamPreview(url) {
+  if (streamPlayer) return;
+  resultSection.classList.remove('hidden');
+  downloadBtn.classList.add('hidden');
+  if (window.Hls && Hls.isSupported()) {
+    streamPlayer = new Hls();
+    streamPlayer.loadSource(url);
+    streamPlayer.attachMedia(resultVideo);
+  } else if (resultVideo.canPlayType('application/vnd.apple.mpegurl')) {
+    // Safari 原生支持 HLS
+    streamPlayer = { destroy() {} };
+    resultVideo.src = url;
+  }
+}
+
+function stopStreamPreview() {
+  if (!streamPlayer) return;
+  streamPlayer.destroy();
+  streamPlayer = null;
+  resultVideo.removeAttribute('src');
+}
+
 function onGenerationComplete(taskId) {
   resultSection.classList.remove('hidden');
-  resultVideo.src = `/api/download/${taskId}`;
+  downloadBtn.classList.remove('hidden');
+  // 正在观看推流时不打断播放，否则切换到最终成片
+  if (!streamPlayer || resultVideo.paused) {
+    stopStreamPreview();
+    resultVideo.src = `/api/download/${taskId}`;
+  }
   downloadBtn.href = `/api/download/${taskId}`;
   setRunningUI(false);
   document.getElementById('feedContainer').scrollTo({ top: 0, behavior: 'smooth' });